@@ -0,0 +1,260 @@
+"""Score analytics computed with NumPy.
+
+Class matrix: ``CLASS_MATRIX_SQL`` reads a whole class (students × their
+scores) in one set-based query; ``pivot_class_matrix`` turns the long rows
+into a dense students × subjects array (NaN = no score) with vectorized
+indexing, and ``subject_stats`` reduces it column-wise (mean, median, fail
+rate).
+
+Subject distribution: ``load_subject_scores`` pulls the ``scores.score``
+column of the requested subjects into one compact structured array (no
+per-row Python objects kept), ``score_stats`` computes histogram,
+percentiles, standard deviation and grade bands per subject, and
+``subject_stats_cache`` keeps the result until a score of that subject
+changes (``changes`` topic ``scores``) or ``SUBJECT_STATS_CACHE_TTL`` expires.
+"""
+
+import itertools
+import threading
+import time
+
+import numpy as np
+
+import changes
+from db import SUBJECT_STATS_CACHE_TTL, read_connection, scatter_read, sharding_enabled
+from summary import PASS_SCORE
+
+# Sinh viên không có điểm nào vẫn có 1 dòng (subject_id NULL) để hiện trong ma trận.
+CLASS_MATRIX_SQL = (
+    "SELECT st.id, st.full_name, sc.subject_id, sj.subject_code, sc.score "
+    "FROM students st "
+    "LEFT JOIN scores sc ON sc.student_id = st.id "
+    "LEFT JOIN subjects sj ON sj.id = sc.subject_id "
+    "WHERE st.class_name = %s"
+)
+
+STATS_HEADERS = ["Mã môn", "Số SV có điểm", "Điểm TB", "Trung vị", "Tỉ lệ trượt (%)"]
+
+
+def pivot_class_matrix(rows) -> dict:
+    """Long ``CLASS_MATRIX_SQL`` rows -> dense matrix.
+
+    Returns {"student_ids", "names", "subject_ids", "codes", "scores"}; ``scores``
+    is a float array of shape (students, subjects) sorted by id on both axes,
+    NaN where a student has no score. Only subjects graded in the class are columns.
+    """
+    rows = list(rows)
+    student_col = np.array([r[0] for r in rows], dtype=np.int64)
+    subject_col = np.array([-1 if r[2] is None else r[2] for r in rows], dtype=np.int64)
+    score_col = np.array([np.nan if r[4] is None else float(r[4]) for r in rows], dtype=np.float64)
+
+    student_ids, row_index = np.unique(student_col, return_inverse=True)
+    graded = (subject_col >= 0) & ~np.isnan(score_col)
+    subject_ids, col_index = np.unique(subject_col[graded], return_inverse=True)
+
+    scores = np.full((len(student_ids), len(subject_ids)), np.nan)
+    scores[row_index[graded], col_index] = score_col[graded]
+
+    names = {r[0]: r[1] for r in rows}
+    codes = {r[2]: r[3] for r in rows if r[2] is not None}
+    return {
+        "student_ids": student_ids,
+        "names": [names[int(sid)] for sid in student_ids],
+        "subject_ids": subject_ids,
+        "codes": [codes[int(sid)] for sid in subject_ids],
+        "scores": scores,
+    }
+
+
+def subject_stats(matrix: dict) -> dict:
+    """Per-subject (column) count, mean, median and fail rate (score < ``PASS_SCORE``)."""
+    scores = matrix["scores"]
+    graded = ~np.isnan(scores)
+    counts = graded.sum(axis=0)
+    # Mỗi cột có ít nhất 1 điểm (pivot chỉ giữ môn có điểm) nên không chia cho 0.
+    return {
+        "counts": counts,
+        "mean": np.where(graded, scores, 0.0).sum(axis=0) / counts,
+        "median": np.nanmedian(scores, axis=0) if scores.size else np.empty(0),
+        "fail_rate": (graded & (scores < PASS_SCORE)).sum(axis=0) / counts,
+    }
+
+
+def _cells(values: np.ndarray) -> np.ndarray:
+    """Round to 2 decimals; NaN -> None (empty cell)."""
+    return np.where(np.isnan(values), None, np.round(values, 2).astype(object))
+
+
+def matrix_table(matrix: dict) -> dict:
+    """Dataframe value: Student ID, name, one column per subject code."""
+    headers = ["Student ID", "Họ tên", *matrix["codes"]]
+    if not len(matrix["student_ids"]):
+        return {"headers": headers, "data": []}
+    data = np.column_stack(
+        [matrix["student_ids"].astype(object), np.array(matrix["names"], dtype=object), _cells(matrix["scores"])]
+    )
+    return {"headers": headers, "data": data.tolist()}
+
+
+def stats_table(matrix: dict, stats: dict) -> list[list]:
+    return np.column_stack(
+        [
+            np.array(matrix["codes"], dtype=object),
+            stats["counts"].astype(object),
+            _cells(stats["mean"]),
+            _cells(stats["median"]),
+            _cells(stats["fail_rate"] * 100),
+        ]
+    ).tolist()
+
+
+# ---------- per-subject score distribution ----------
+
+
+SUBJECT_SCORES_SQL = "SELECT subject_id, score FROM scores WHERE subject_id IN ({marks}) AND score IS NOT NULL"
+# Số dòng mỗi lần fetchmany khi đọc cột điểm (không giữ cả list tuple trong bộ nhớ).
+_FETCH_ROWS = 10000
+_SCORE_DTYPE = np.dtype([("subject", np.int32), ("score", np.float32)])
+
+PERCENTILES = (10, 25, 50, 75, 90)
+# 10 khoảng 1 điểm: [0,1), [1,2), ..., [9,10].
+HISTOGRAM_EDGES = np.arange(0, 11, dtype=np.float32)
+HISTOGRAM_LABELS = [f"{low}–{low + 1}" for low in range(10)]
+# Xếp loại theo thang 10: A >= 8.5, B >= 7, C >= 5.5, D >= 4, còn lại F.
+GRADE_BANDS = ("A", "B", "C", "D", "F")
+_BAND_EDGES = np.array([4.0, 5.5, 7.0, 8.5], dtype=np.float32)
+
+DISTRIBUTION_HEADERS = ["Mã môn", "Số điểm", "Điểm TB", "Độ lệch chuẩn", "Min", *(f"P{p}" for p in PERCENTILES), "Max"]
+BANDS_HEADERS = ["Mã môn", "A (≥8.5)", "B (≥7)", "C (≥5.5)", "D (≥4)", "F (<4)"]
+
+
+def _fetch_chunks(cur):
+    while True:
+        rows = cur.fetchmany(_FETCH_ROWS)
+        if not rows:
+            return
+        yield from rows
+
+
+def load_subject_scores(session: dict | None, subject_ids) -> tuple[dict, bool]:
+    """({subject_id: float32 array of scores}, reached) for ``subject_ids``, in one query.
+
+    ``reached`` is False if no node could be reached. Raises ``mysql.connector.Error``.
+    """
+    ids = sorted({int(subject_id) for subject_id in subject_ids})
+    sql = SUBJECT_SCORES_SQL.format(marks=",".join(["%s"] * len(ids)))
+    if sharding_enabled():
+        parts = scatter_read(session, sql, tuple(ids))
+        data = np.fromiter(itertools.chain.from_iterable(parts), dtype=_SCORE_DTYPE)
+    else:
+        with read_connection(session) as conn:
+            if conn is None:
+                return {}, False
+            with conn.cursor() as cur:
+                cur.execute(sql, tuple(ids))
+                data = np.fromiter(_fetch_chunks(cur), dtype=_SCORE_DTYPE)
+
+    # Gom theo môn: sắp xếp 1 lần rồi cắt mảng tại điểm đổi môn.
+    data = data[np.argsort(data["subject"], kind="stable")]
+    subjects, starts = np.unique(data["subject"], return_index=True)
+    groups = dict(zip(subjects.tolist(), np.split(data["score"], starts[1:])))
+    return {subject_id: groups.get(subject_id, np.empty(0, dtype=np.float32)) for subject_id in ids}, True
+
+
+def score_stats(scores: np.ndarray) -> dict:
+    """Distribution of one subject's scores (all vectorized; float64 accumulators)."""
+    if not scores.size:
+        return {"count": 0}
+    # searchsorted: 0 = F, 1 = D, ..., 4 = A.
+    bands = np.bincount(np.searchsorted(_BAND_EDGES, scores, side="right"), minlength=len(GRADE_BANDS))
+    return {
+        "count": int(scores.size),
+        "mean": float(scores.mean(dtype=np.float64)),
+        "std": float(scores.std(dtype=np.float64)),
+        "min": float(scores.min()),
+        "max": float(scores.max()),
+        "percentiles": np.percentile(scores.astype(np.float64), PERCENTILES).tolist(),
+        "histogram": np.histogram(scores, bins=HISTOGRAM_EDGES)[0].tolist(),
+        "bands": dict(zip(GRADE_BANDS, bands[::-1].tolist())),
+    }
+
+
+class SubjectStatsCache:
+    """``score_stats`` per subject id, dropped when a score of that subject changes."""
+
+    def __init__(self, ttl: float):
+        self.ttl = float(ttl)
+        self._lock = threading.Lock()
+        self._entries: dict[int, tuple[dict, float]] = {}
+        self._versions: dict[int, int] = {}
+        self._epoch = 0
+
+    def invalidate(self, subject_ids=None) -> None:
+        with self._lock:
+            if subject_ids is None:
+                self._entries.clear()
+                self._epoch += 1
+                return
+            for subject_id in subject_ids:
+                self._entries.pop(subject_id, None)
+                self._versions[subject_id] = self._versions.get(subject_id, 0) + 1
+
+    def get(self, session: dict | None, subject_ids) -> tuple[dict, int] | None:
+        """({subject_id: stats}, number served from cache); None if no node is reachable.
+
+        Raises ``mysql.connector.Error`` if the query fails.
+        """
+        ids = sorted({int(subject_id) for subject_id in subject_ids})
+        now = time.monotonic()
+        with self._lock:
+            hits = {
+                subject_id: entry[0]
+                for subject_id in ids
+                if (entry := self._entries.get(subject_id)) and now - entry[1] < self.ttl
+            }
+            missing = [subject_id for subject_id in ids if subject_id not in hits]
+            epoch = self._epoch
+            versions = {subject_id: self._versions.get(subject_id, 0) for subject_id in missing}
+        if not missing:
+            return hits, len(hits)
+
+        arrays, reached = load_subject_scores(session, missing)
+        if not reached:
+            return None
+        loaded = {subject_id: score_stats(scores) for subject_id, scores in arrays.items()}
+        loaded_at = time.monotonic()
+        with self._lock:
+            # Điểm đổi trong lúc đang tải: không cache kết quả có thể đã cũ.
+            for subject_id, stats in loaded.items():
+                if epoch == self._epoch and versions[subject_id] == self._versions.get(subject_id, 0):
+                    self._entries[subject_id] = (stats, loaded_at)
+        return {**hits, **loaded}, len(hits)
+
+
+subject_stats_cache = SubjectStatsCache(SUBJECT_STATS_CACHE_TTL)
+changes.subscribe("scores", lambda keys: subject_stats_cache.invalidate(None if keys is None else {key[1] for key in keys}))
+changes.subscribe("subjects", subject_stats_cache.invalidate)
+
+
+def distribution_tables(stats_by_subject: dict, codes: dict) -> tuple[list, list, dict]:
+    """(distribution rows, grade band rows, histogram Dataframe value) in subject id order."""
+    ids = sorted(stats_by_subject)
+    distribution, bands, histogram = [], [], []
+    for subject_id in ids:
+        stats = stats_by_subject[subject_id]
+        code = codes.get(subject_id, str(subject_id))
+        if not stats["count"]:
+            distribution.append([code, 0] + [None] * (len(DISTRIBUTION_HEADERS) - 2))
+            bands.append([code] + [0] * len(GRADE_BANDS))
+            histogram.append([0] * len(HISTOGRAM_LABELS))
+            continue
+        summary = np.round([stats["mean"], stats["std"], stats["min"], *stats["percentiles"], stats["max"]], 2)
+        distribution.append([code, stats["count"], *summary.tolist()])
+        bands.append([code, *(stats["bands"][band] for band in GRADE_BANDS)])
+        histogram.append(stats["histogram"])
+    columns = np.array(histogram, dtype=np.int64).reshape(len(ids), len(HISTOGRAM_LABELS)).T
+    hist_value = {
+        "headers": ["Khoảng điểm", *(codes.get(subject_id, str(subject_id)) for subject_id in ids)],
+        "data": [[label, *counts] for label, counts in zip(HISTOGRAM_LABELS, columns.tolist())],
+    }
+    return distribution, bands, hist_value
@@ -0,0 +1,494 @@
+"""Load test for the teacher / student handlers.
+
+Simulated teachers and students call the real handler functions (the same
+ones the Gradio UI calls) against the configured database for a fixed
+duration. The report has throughput and p50/p95/p99 latency per handler,
+statements and pool checkouts per call (round trips per action), pool
+connection counts and the server's connection counters, and is written
+as JSON so runs before / after a change can be diffed.
+
+Teachers log in, then repeatedly load a roster page or upsert a score;
+students log in, then repeatedly load their scores table. Student accounts
+are ``student{id}`` / ``student{id}`` (the seed data and ``datagen.py``
+follow this pattern).
+
+``--statements N`` instead runs each hot query shape (login lookup, student
+scores, student detail, single score upsert) N times as a text query and N
+times as a prepared statement on one connection to the PRIMARY, and reports
+the per-execution latency plus the session's statement / byte counters, i.e.
+what preparing once saves in parsing and on the wire.
+
+CLI:
+    python benchmark.py --teachers 5 --students 50 --duration 60 --out before.json
+    python benchmark.py --mode async --students 200 --duration 60 --out after.json
+    python benchmark.py --statements 2000 --out statements.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import threading
+import time
+from datetime import datetime
+
+import mysql.connector
+from mysql.connector import HAVE_CEXT
+
+import metrics
+from catalog import subject_catalog, subject_choice_labels
+from db import _AUTH_SQL, _connect_kwargs, authenticate, current_primary, get_db_connection, pool_stats
+from pool import execute_prepared
+from student import _SCORES_SQL, student_scores_table
+from teacher import _STUDENT_DETAIL_SQL, _UPSERT_SCORE_SQL, list_students_table, teacher_upsert_score
+
+_SERVER_COUNTERS = ("Threads_connected", "Threads_running", "Max_used_connections", "Connections", "Aborted_connects")
+_STATEMENT_COUNTERS = ("Com_stmt_prepare", "Com_stmt_execute", "Com_stmt_reset", "Com_select", "Com_insert", "Bytes_received", "Bytes_sent")
+
+
+class LatencyRecorder:
+    """Thread-safe per-handler latency samples (seconds) and error counts."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples: dict[str, list[float]] = {}
+        self._errors: dict[str, int] = {}
+
+    def record(self, handler: str, seconds: float, ok: bool) -> None:
+        with self._lock:
+            self._samples.setdefault(handler, []).append(seconds)
+            if not ok:
+                self._errors[handler] = self._errors.get(handler, 0) + 1
+
+    def report(self, elapsed: float) -> dict:
+        with self._lock:
+            samples = {name: sorted(values) for name, values in self._samples.items()}
+            errors = dict(self._errors)
+        handlers = {name: _summarize(values, errors.get(name, 0), elapsed) for name, values in samples.items()}
+        everything = sorted(v for values in samples.values() for v in values)
+        return {"handlers": handlers, "total": _summarize(everything, sum(errors.values()), elapsed)}
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float:
+    # Nearest-rank percentile.
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def _summarize(sorted_values: list[float], errors: int, elapsed: float) -> dict:
+    calls = len(sorted_values)
+    ms = 1000.0
+    return {
+        "calls": calls,
+        "errors": errors,
+        "throughput_rps": round(calls / elapsed, 2) if elapsed > 0 else 0.0,
+        "mean_ms": round(sum(sorted_values) / calls * ms, 3) if calls else 0.0,
+        "p50_ms": round(_percentile(sorted_values, 50) * ms, 3),
+        "p95_ms": round(_percentile(sorted_values, 95) * ms, 3),
+        "p99_ms": round(_percentile(sorted_values, 99) * ms, 3),
+        "max_ms": round(sorted_values[-1] * ms, 3) if calls else 0.0,
+    }
+
+
+def _per_call(histogram: metrics.Histogram, name: str) -> float:
+    count, total = histogram.totals().get((name,), (0, 0.0))
+    return round(total / count, 2) if count else 0.0
+
+
+def add_round_trips(handlers: dict) -> None:
+    """Mean statements / pool checkouts per call of each handler (``@instrumented`` counters)."""
+    for name, summary in handlers.items():
+        summary["statements_per_call"] = _per_call(metrics.HANDLER_STATEMENTS, name)
+        summary["checkouts_per_call"] = _per_call(metrics.HANDLER_CHECKOUTS, name)
+
+
+def _is_error(result) -> bool:
+    """Handlers report failures as a "❌ ..." / "⚠️ ..." message somewhere in their result."""
+    values = result if isinstance(result, tuple) else (result,)
+    return any(isinstance(v, str) and v.startswith(("❌", "⚠️")) for v in values)
+
+
+class ConnectionSampler:
+    """Samples pool totals in the background to catch the peak during the run."""
+
+    def __init__(self, interval: float = 0.2):
+        self.interval = interval
+        self.peak_in_use = 0
+        self.peak_total = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="benchmark-conn-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            stats = pool_stats().values()
+            self.peak_in_use = max(self.peak_in_use, sum(s["in_use"] for s in stats))
+            self.peak_total = max(self.peak_total, sum(s["total"] for s in stats))
+            self._stop.wait(self.interval)
+
+
+def server_counters() -> dict:
+    """SHOW GLOBAL STATUS connection counters of the local node ({} if unreachable)."""
+    conn = get_db_connection()
+    if conn is None:
+        return {}
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            f"SHOW GLOBAL STATUS WHERE Variable_name IN ({','.join(['%s'] * len(_SERVER_COUNTERS))})",
+            _SERVER_COUNTERS,
+        )
+        rows = cur.fetchall()
+        cur.close()
+        return {name: int(value) for name, value in rows}
+    except mysql.connector.Error:
+        return {}
+    finally:
+        if conn.is_connected():
+            conn.close()
+
+
+# ---------- simulated users ----------
+
+
+class Workload:
+    """What the simulated users do; shared by the thread and asyncio drivers."""
+
+    def __init__(self, args):
+        self.args = args
+        snap = subject_catalog.snapshot()
+        if not snap or not snap.rows:
+            raise RuntimeError("Không đọc được danh mục môn học (cần dữ liệu mẫu).")
+        self.subject_choices = subject_choice_labels(snap.rows)
+
+    def student_login(self, rng: random.Random):
+        sid = rng.randint(1, self.args.max_student_id)
+        name = self.args.student_user_pattern.format(id=sid)
+        return name, name
+
+    def teacher_action(self, rng: random.Random):
+        """(handler name, positional args after the session)."""
+        if rng.random() < self.args.teacher_write_ratio:
+            return "teacher_upsert_score", (
+                rng.randint(1, self.args.max_student_id),
+                rng.choice(self.subject_choices),
+                round(rng.uniform(0, 10), 2),
+            )
+        return "list_students_table", ()
+
+
+_SYNC_HANDLERS = {
+    "authenticate": authenticate,
+    "list_students_table": list_students_table,
+    "teacher_upsert_score": teacher_upsert_score,
+    "student_scores_table": student_scores_table,
+}
+
+
+def _timed(recorder: LatencyRecorder, name: str, fn, *args):
+    started = time.perf_counter()
+    try:
+        result = fn(*args)
+        ok = not _is_error(result)
+    except Exception:
+        result, ok = None, False
+    recorder.record(name, time.perf_counter() - started, ok)
+    return result
+
+
+def _sync_user(role: str, workload: Workload, recorder: LatencyRecorder, deadline: float, seed: int) -> None:
+    args = workload.args
+    rng = random.Random(seed)
+    if role == "teacher":
+        login = (args.teacher_user, args.teacher_password)
+    else:
+        login = workload.student_login(rng)
+    result = _timed(recorder, "authenticate", authenticate, *login)
+    session = result[0] if result else None
+    if not session:
+        return
+
+    while time.monotonic() < deadline:
+        if role == "teacher":
+            name, extra = workload.teacher_action(rng)
+        else:
+            name, extra = "student_scores_table", ()
+        _timed(recorder, name, _SYNC_HANDLERS[name], session, *extra)
+        if args.think_time:
+            time.sleep(rng.uniform(0, args.think_time))
+
+
+def run_threads(workload: Workload, recorder: LatencyRecorder, deadline: float) -> None:
+    args = workload.args
+    roles = ["teacher"] * args.teachers + ["student"] * args.students
+    threads = [
+        threading.Thread(target=_sync_user, args=(role, workload, recorder, deadline, args.seed + i), daemon=True)
+        for i, role in enumerate(roles)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+async def _async_timed(recorder: LatencyRecorder, name: str, fn, *args):
+    started = time.perf_counter()
+    try:
+        result = await fn(*args)
+        ok = not _is_error(result)
+    except Exception:
+        result, ok = None, False
+    recorder.record(name, time.perf_counter() - started, ok)
+    return result
+
+
+async def _async_user(role, workload, recorder, deadline, seed, handlers) -> None:
+    args = workload.args
+    rng = random.Random(seed)
+    if role == "teacher":
+        login = (args.teacher_user, args.teacher_password)
+    else:
+        login = workload.student_login(rng)
+    result = await _async_timed(recorder, "authenticate", handlers["authenticate"], *login)
+    session = result[0] if result else None
+    if not session:
+        return
+
+    while time.monotonic() < deadline:
+        if role == "teacher":
+            name, extra = workload.teacher_action(rng)
+        else:
+            name, extra = "student_scores_table", ()
+        await _async_timed(recorder, name, handlers[name], session, *extra)
+        if args.think_time:
+            await asyncio.sleep(rng.uniform(0, args.think_time))
+
+
+def run_async(workload: Workload, recorder: LatencyRecorder, deadline: float) -> None:
+    import db_async
+    import student_async
+    import teacher_async
+
+    handlers = {
+        "authenticate": db_async.authenticate,
+        "list_students_table": teacher_async.list_students_table,
+        "teacher_upsert_score": teacher_async.teacher_upsert_score,
+        "student_scores_table": student_async.student_scores_table,
+    }
+    args = workload.args
+    roles = ["teacher"] * args.teachers + ["student"] * args.students
+
+    async def main():
+        await asyncio.gather(
+            *(_async_user(role, workload, recorder, deadline, args.seed + i, handlers) for i, role in enumerate(roles))
+        )
+
+    asyncio.run(main())
+
+
+def run(args) -> dict:
+    workload = Workload(args)
+    recorder = LatencyRecorder()
+    sampler = ConnectionSampler()
+    before = server_counters()
+
+    sampler.start()
+    started = time.monotonic()
+    deadline = started + args.duration
+    if args.mode == "async":
+        run_async(workload, recorder, deadline)
+    else:
+        run_threads(workload, recorder, deadline)
+    elapsed = time.monotonic() - started
+    sampler.stop()
+
+    after = server_counters()
+    report = recorder.report(elapsed)
+    add_round_trips(report["handlers"])
+    return {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "mode": args.mode,
+            "teachers": args.teachers,
+            "students": args.students,
+            "duration": args.duration,
+            "think_time": args.think_time,
+            "teacher_write_ratio": args.teacher_write_ratio,
+            "max_student_id": args.max_student_id,
+            "seed": args.seed,
+        },
+        "elapsed_seconds": round(elapsed, 3),
+        **report,
+        "connections": {
+            "pool_peak_in_use": sampler.peak_in_use,
+            "pool_peak_total": sampler.peak_total,
+            "pools": pool_stats(),
+            "server_before": before,
+            "server_after": after,
+            "server_new_connections": (after.get("Connections", 0) - before.get("Connections", 0)) if before and after else None,
+        },
+    }
+
+
+# ---------- text vs prepared statements ----------
+
+
+def _session_counters(conn) -> dict:
+    cur = conn.cursor()
+    cur.execute(
+        f"SHOW SESSION STATUS WHERE Variable_name IN ({','.join(['%s'] * len(_STATEMENT_COUNTERS))})",
+        _STATEMENT_COUNTERS,
+    )
+    rows = cur.fetchall()
+    cur.close()
+    return {name: int(value) for name, value in rows}
+
+
+def _hot_statements(args, subject_ids: list[int]) -> dict:
+    """{name: (sql, params_fn(rng), is_write)} for the hot query shapes."""
+
+    def student_id(rng):
+        return rng.randint(1, args.max_student_id)
+
+    return {
+        "authenticate": (_AUTH_SQL, lambda rng: (args.teacher_user, args.teacher_password), False),
+        "student_scores": (_SCORES_SQL, lambda rng: (student_id(rng),), False),
+        "student_detail": (_STUDENT_DETAIL_SQL, lambda rng: (student_id(rng),), False),
+        "upsert_score": (
+            _UPSERT_SCORE_SQL,
+            lambda rng: (student_id(rng), rng.choice(subject_ids), round(rng.uniform(0, 10), 1)),
+            True,
+        ),
+    }
+
+
+def _run_statement(conn, cur, execute, sql: str, params_fn, is_write: bool, n: int, rng) -> dict:
+    samples = []
+    before = _session_counters(conn)
+    for _ in range(n):
+        params = params_fn(rng)
+        t0 = time.perf_counter()
+        execute(cur, sql, params)
+        if cur.with_rows:
+            cur.fetchall()
+        samples.append(time.perf_counter() - t0)
+        if is_write:
+            conn.rollback()  # đo câu lệnh, không ghi dữ liệu thật
+    after = _session_counters(conn)
+    samples.sort()
+    us = 1_000_000.0
+    return {
+        "executions": n,
+        "mean_us": round(sum(samples) / n * us, 1),
+        "p50_us": round(_percentile(samples, 50) * us, 1),
+        "p95_us": round(_percentile(samples, 95) * us, 1),
+        # Gồm cả SHOW STATUS / ROLLBACK của chính phép đo (như nhau ở 2 chế độ).
+        "server": {name: after.get(name, 0) - before.get(name, 0) for name in _STATEMENT_COUNTERS},
+    }
+
+
+def run_statements(args) -> dict:
+    """Each hot statement ``args.statements`` times as text and as a prepared statement."""
+    node = current_primary()
+    if not node:
+        raise RuntimeError("Không có node PRIMARY để chạy benchmark câu lệnh.")
+    try:
+        conn = mysql.connector.connect(**_connect_kwargs(node), use_pure=not HAVE_CEXT)
+    except mysql.connector.Error as err:
+        raise RuntimeError(f"Không kết nối được {node}: {err}") from err
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM subjects ORDER BY id LIMIT 100")
+        subject_ids = [row[0] for row in cur.fetchall()]
+        cur.close()
+        if not subject_ids:
+            raise RuntimeError("Không có môn học nào (cần dữ liệu mẫu).")
+
+        statements = {}
+        for name, (sql, params_fn, is_write) in _hot_statements(args, subject_ids).items():
+            statements[name] = {}
+            for mode in ("text", "prepared"):
+                rng = random.Random(args.seed)  # cùng tham số cho 2 chế độ
+                prepared = mode == "prepared"
+                cur = conn.cursor(prepared=prepared)
+                # Chạy prepared giống pool (execute_prepared: bỏ COM_STMT_RESET khi không cần).
+                execute = execute_prepared if prepared else type(cur).execute
+                statements[name][mode] = _run_statement(conn, cur, execute, sql, params_fn, is_write, args.statements, rng)
+                cur.close()
+    finally:
+        conn.close()
+
+    return {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "config": {"statements": args.statements, "node": node, "c_extension": HAVE_CEXT, "seed": args.seed},
+        "statements": statements,
+    }
+
+
+def _print_statements(result: dict) -> None:
+    print(f"{'statement':<18}{'mode':<10}{'mean_us':>10}{'p50_us':>10}{'p95_us':>10}{'prepare':>9}{'execute':>9}{'reset':>7}{'srv_recv':>11}{'srv_sent':>11}")
+    for name, modes in result["statements"].items():
+        for mode, s in modes.items():
+            server = s["server"]
+            print(
+                f"{name:<18}{mode:<10}{s['mean_us']:>10}{s['p50_us']:>10}{s['p95_us']:>10}"
+                f"{server['Com_stmt_prepare']:>9}{server['Com_stmt_execute']:>9}{server['Com_stmt_reset']:>7}"
+                f"{server['Bytes_received']:>11}{server['Bytes_sent']:>11}"
+            )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark các handler Teacher/Student với nhiều người dùng đồng thời.")
+    parser.add_argument("--teachers", type=int, default=2, help="số giáo viên giả lập")
+    parser.add_argument("--students", type=int, default=20, help="số sinh viên giả lập")
+    parser.add_argument("--duration", type=float, default=30.0, help="thời gian chạy (giây)")
+    parser.add_argument("--mode", choices=("threads", "async"), default="threads")
+    parser.add_argument("--think-time", type=float, default=0.0, help="nghỉ ngẫu nhiên 0..N giây giữa 2 thao tác")
+    parser.add_argument("--teacher-write-ratio", type=float, default=0.2, help="tỉ lệ thao tác lưu điểm của giáo viên")
+    parser.add_argument("--teacher-user", default="teacher")
+    parser.add_argument("--teacher-password", default="teacher")
+    parser.add_argument("--student-user-pattern", default="student{id}", help="username = password của sinh viên")
+    parser.add_argument("--max-student-id", type=int, default=3, help="ID sinh viên lớn nhất có tài khoản")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--statements", type=int, default=0, help="chỉ đo N lần mỗi câu lệnh nóng: text vs prepared")
+    parser.add_argument("--out", default=None, help="file JSON kết quả (mặc định benchmark_<thời gian>.json)")
+    args = parser.parse_args(argv)
+
+    try:
+        result = run_statements(args) if args.statements > 0 else run(args)
+    except RuntimeError as err:
+        print(f"❌ {err}")
+        return 1
+
+    out = args.out or f"benchmark_{datetime.now():%Y%m%d_%H%M%S}.json"
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    if args.statements > 0:
+        _print_statements(result)
+        print(f"Kết quả: {out}")
+        return 0
+
+    print(f"{'handler':<24}{'calls':>8}{'err':>6}{'rps':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'stmt':>7}{'conn':>6}")
+    for name, s in sorted(result["handlers"].items()) + [("TOTAL", result["total"])]:
+        print(
+            f"{name:<24}{s['calls']:>8}{s['errors']:>6}{s['throughput_rps']:>10}"
+            f"{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}"
+            f"{s.get('statements_per_call', ''):>7}{s.get('checkouts_per_call', ''):>6}"
+        )
+    conns = result["connections"]
+    print(f"Pool peak: {conns['pool_peak_in_use']} in use / {conns['pool_peak_total']} open · kết quả: {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
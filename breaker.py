@@ -0,0 +1,99 @@
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Per-node circuit breaker around connection acquisition.
+
+    - CLOSED: connections are attempted normally; ``failure_threshold``
+      consecutive connect failures open the circuit.
+    - OPEN: ``allow()`` is False, callers fail fast instead of waiting for
+      the connect timeout, until ``backoff`` seconds have passed.
+    - HALF_OPEN: a single caller is let through as a probe. Success closes
+      the circuit; failure opens it again with the backoff doubled (up to
+      ``max_backoff``).
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 3, backoff: float = 5.0, max_backoff: float = 60.0):
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.base_backoff = float(backoff)
+        self.max_backoff = max(float(max_backoff), self.base_backoff)
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._backoff = self.base_backoff
+        self._retry_at = 0.0
+        self._probing = False
+        self._last_error = ""
+        self._opened_count = 0
+
+    def allow(self) -> bool:
+        """True if a connection attempt may be made now."""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN and time.monotonic() >= self._retry_at:
+                self._state = HALF_OPEN
+            if self._state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._backoff = self.base_backoff
+            self._probing = False
+            self._last_error = ""
+
+    def record_failure(self, error: str = "") -> None:
+        with self._lock:
+            self._failures += 1
+            self._last_error = error
+            if self._state == HALF_OPEN:
+                self._backoff = min(self._backoff * 2, self.max_backoff)
+                self._open()
+            elif self._state == CLOSED and self._failures >= self.failure_threshold:
+                self._open()
+            self._probing = False
+
+    def release_probe(self) -> None:
+        """The attempt ended without a verdict on the node (e.g. pool exhausted)."""
+        with self._lock:
+            self._probing = False
+
+    def _open(self) -> None:
+        # Caller holds self._lock.
+        self._state = OPEN
+        self._retry_at = time.monotonic() + self._backoff
+        self._opened_count += 1
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() >= self._retry_at:
+                return HALF_OPEN
+            return self._state
+
+    def retry_in(self) -> float:
+        """Seconds until the next probe is allowed (0 if not open)."""
+        with self._lock:
+            if self._state != OPEN:
+                return 0.0
+            return max(0.0, self._retry_at - time.monotonic())
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "retry_in_seconds": round(self.retry_in(), 1),
+            "backoff_seconds": self._backoff,
+            "opened_count": self._opened_count,
+            "last_error": self._last_error,
+        }
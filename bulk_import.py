@@ -0,0 +1,282 @@
+"""Bulk student import from CSV/XLSX.
+
+The file must have a header row with the columns
+``full_name, class_name, email, date_of_birth, address, username, password``
+(same fields as the "Tạo sinh viên" form). Rows are validated like the form,
+then students and their accounts are inserted in batches: one transaction and
+two multi-row INSERTs (``executemany``) per batch. With
+``innodb_autoinc_lock_mode = 2`` (MySQL 8 default) a multi-row INSERT's ids
+may interleave with concurrent inserts, so students are then inserted one
+statement at a time (still one transaction per batch) to get each real id.
+With sharding, students go
+to the shard of new students and every new id must be routed back to it
+(``shard_for_student``); rows whose id falls outside its range are rejected.
+
+CLI:
+    python bulk_import.py students.csv --batch-size 1000
+"""
+
+import argparse
+import csv
+import os
+import time
+from datetime import date, datetime
+
+import mysql.connector
+
+from db import (
+    BULK_IMPORT_BATCH_SIZE,
+    _parse_date,
+    get_write_connection,
+    new_student_shard,
+    remember_write,
+    shard_for_student,
+)
+from shards import UnroutedStudent
+
+COLUMNS = ("full_name", "class_name", "email", "date_of_birth", "address", "username", "password")
+
+_INSERT_STUDENTS = (
+    "INSERT INTO students (full_name, class_name, email, date_of_birth, address) "
+    "VALUES (%s,%s,%s,%s,%s)"
+)
+_INSERT_USERS = "INSERT INTO users (username, password, role, student_id) VALUES (%s,%s,'student',%s)"
+
+
+class ImportReport:
+    def __init__(self):
+        self.inserted = 0
+        self.errors: list[tuple[int, str]] = []  # (line number in file, message)
+        self.batches = 0
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.inserted / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self, max_errors: int = 50) -> str:
+        lines = [
+            f"✅ Đã nhập {self.inserted} sinh viên trong {self.batches} batch, "
+            f"{self.elapsed:.2f}s ({self.rows_per_second:.0f} dòng/s).",
+        ]
+        if self.errors:
+            lines.append(f"⚠️ {len(self.errors)} dòng lỗi:")
+            lines.extend(f"  - Dòng {line}: {msg}" for line, msg in self.errors[:max_errors])
+            if len(self.errors) > max_errors:
+                lines.append(f"  ... và {len(self.errors) - max_errors} dòng lỗi khác.")
+        return "\n".join(lines)
+
+
+def iter_rows(path: str):
+    """Yield (line_number, {column: value}) from a CSV or XLSX file, streaming."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".xlsx":
+        yield from _iter_xlsx(path)
+    else:
+        yield from _iter_csv(path)
+
+
+def _iter_csv(path: str):
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, {key.strip(): value for key, value in row.items() if key}
+
+
+def _iter_xlsx(path: str):
+    try:
+        from openpyxl import load_workbook
+    except ImportError as exc:
+        raise RuntimeError("Cần cài openpyxl để đọc file .xlsx (pip install openpyxl).") from exc
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = [str(h).strip() if h is not None else "" for h in next(rows, ())]
+        for line, values in enumerate(rows, start=2):
+            if values is None or all(v is None for v in values):
+                continue
+            yield line, dict(zip(header, values))
+    finally:
+        wb.close()
+
+
+def validate_row(row: dict):
+    """Return (values_for_insert, None) or (None, error message). Same rules as the form."""
+    def text(key):
+        value = row.get(key)
+        if value is None:
+            return ""
+        if isinstance(value, (datetime, date)):
+            return value.strftime("%Y-%m-%d")
+        return str(value).strip()
+
+    full_name = text("full_name")
+    username = text("username")
+    password = text("password")
+    if not full_name:
+        return None, "Họ tên không được để trống."
+    if not username:
+        return None, "Thiếu username cho sinh viên."
+    if not password:
+        return None, "Thiếu password cho sinh viên."
+
+    dob = _parse_date(text("date_of_birth"))
+    if dob == "__invalid__":
+        return None, "Ngày sinh không hợp lệ. Định dạng đúng: YYYY-MM-DD."
+
+    student = (full_name, text("class_name") or None, text("email") or None, dob, text("address") or None)
+    return (student, (username, password)), None
+
+
+def import_students(path: str, batch_size: int = BULK_IMPORT_BATCH_SIZE, session: dict | None = None, progress=None):
+    """Import students + accounts from ``path`` in batches of ``batch_size`` rows.
+
+    ``progress(report)`` is called after each batch (used by the CLI).
+    Raises ``RuntimeError`` if the PRIMARY is unreachable or the file cannot be read.
+    """
+    batch_size = max(1, int(batch_size))
+    report = ImportReport()
+    shard = new_student_shard()
+    conn = get_write_connection(shard)
+    if conn is None:
+        raise RuntimeError("Không kết nối được database PRIMARY.")
+
+    started = time.perf_counter()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT @@SESSION.auto_increment_increment, @@GLOBAL.innodb_autoinc_lock_mode")
+        increment, lock_mode = cur.fetchone()
+        # 2 = "interleaved": ID của một INSERT nhiều dòng không chắc liên tiếp (None = đọc ID từng dòng).
+        id_step = None if lock_mode is not None and int(lock_mode) == 2 else int(increment or 1)
+
+        batch = []
+        for line, row in iter_rows(path):
+            values, error = validate_row(row)
+            if error:
+                report.errors.append((line, error))
+                continue
+            batch.append((line, values))
+            if len(batch) >= batch_size:
+                _flush(conn, cur, batch, id_step, report, shard)
+                batch = []
+                if progress:
+                    report.elapsed = time.perf_counter() - started
+                    progress(report)
+        if batch:
+            _flush(conn, cur, batch, id_step, report, shard)
+
+        if report.inserted:
+            remember_write(session, conn, shard)
+        cur.close()
+    finally:
+        report.elapsed = time.perf_counter() - started
+        if conn.is_connected():
+            conn.close()
+    return report
+
+
+def _misrouted(shard, student_id: int) -> bool:
+    """``student_id`` would not be routed back to ``shard`` (outside every range, or another shard's)."""
+    if shard is None:
+        return False
+    try:
+        return shard_for_student(student_id) is not shard
+    except UnroutedStudent:
+        return True
+
+
+def _misrouted_message(shard, student_id: int) -> str:
+    return (
+        f"ID mới ({student_id}) nằm ngoài khoảng {shard.range_text()} của {shard.name}: "
+        "kiểm tra AUTO_INCREMENT của bảng students trên shard."
+    )
+
+
+def _insert_batch_students(cur, batch, id_step: int | None) -> list[int]:
+    """Insert the batch's students; their ids in batch order."""
+    if id_step is None:
+        student_ids = []
+        for _, (student, _) in batch:
+            cur.execute(_INSERT_STUDENTS, student)
+            student_ids.append(cur.lastrowid)
+        return student_ids
+    cur.executemany(_INSERT_STUDENTS, [student for _, (student, _) in batch])
+    # With innodb_autoinc_lock_mode 0/1 a multi-row INSERT gets consecutive
+    # AUTO_INCREMENT ids (step = auto_increment_increment); lastrowid is the
+    # id of the first row.
+    first_id = cur.lastrowid
+    if cur.rowcount != len(batch) or not first_id:
+        raise mysql.connector.InterfaceError("Không xác định được ID của batch.")
+    return [first_id + i * id_step for i in range(len(batch))]
+
+
+def _flush(conn, cur, batch, id_step: int | None, report: ImportReport, shard=None) -> None:
+    """Insert one batch in one transaction; ``id_step`` None = ids are read row by row."""
+    report.batches += 1
+    try:
+        conn.start_transaction()
+        student_ids = _insert_batch_students(cur, batch, id_step)
+        if any(_misrouted(shard, student_id) for student_id in student_ids):
+            raise mysql.connector.InterfaceError("ID mới nằm ngoài khoảng của shard.")
+        cur.executemany(
+            _INSERT_USERS,
+            [(u, p, student_id) for student_id, (_, (_, (u, p))) in zip(student_ids, batch)],
+        )
+        conn.commit()
+        report.inserted += len(batch)
+    except mysql.connector.Error:
+        _rollback(conn)
+        # Pinpoint the failing rows (e.g. duplicate username) one by one.
+        for line, values in batch:
+            _insert_one(conn, cur, line, values, report, shard)
+
+
+def _insert_one(conn, cur, line: int, values, report: ImportReport, shard=None) -> None:
+    student, (username, password) = values
+    try:
+        conn.start_transaction()
+        cur.execute(_INSERT_STUDENTS, student)
+        student_id = cur.lastrowid
+        if _misrouted(shard, student_id):
+            _rollback(conn)
+            report.errors.append((line, _misrouted_message(shard, student_id)))
+            return
+        cur.execute(_INSERT_USERS, (username, password, student_id))
+        conn.commit()
+        report.inserted += 1
+    except mysql.connector.Error as err:
+        _rollback(conn)
+        if getattr(err, "errno", None) == 1062:
+            report.errors.append((line, f"Username '{username}' đã tồn tại."))
+        else:
+            report.errors.append((line, f"Lỗi DB: {err}"))
+
+
+def _rollback(conn) -> None:
+    try:
+        conn.rollback()
+    except mysql.connector.Error:
+        pass
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Nhập hàng loạt sinh viên từ CSV/XLSX.")
+    parser.add_argument("path", help="File .csv hoặc .xlsx")
+    parser.add_argument("--batch-size", type=int, default=BULK_IMPORT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    def progress(report):
+        print(f"... {report.inserted} dòng, {report.rows_per_second:.0f} dòng/s", flush=True)
+
+    try:
+        report = import_students(args.path, args.batch_size, progress=progress)
+    except (OSError, RuntimeError, mysql.connector.Error) as err:
+        print(f"❌ {err}")
+        return 1
+    print(report.summary(max_errors=200))
+    return 0 if not report.errors else 2
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
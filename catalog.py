@@ -0,0 +1,85 @@
+import threading
+import time
+from typing import NamedTuple
+
+import changes
+from db import SUBJECT_CACHE_TTL, read_connection, reference_shard
+from delta import MARK_SQL, SUBJECTS_DELTA_SQL, mark_from, mark_usable, merge_rows_by_id, since, split_delta
+
+
+class CatalogSnapshot(NamedTuple):
+    rows: list  # [(id, subject_code, subject_name, credits), ...] ordered by id
+    node: str
+    loaded_at: float
+    cached: bool
+
+
+class SubjectCatalog:
+    """In-process cache of the ``subjects`` table.
+
+    The catalog almost never changes, so the subject table and the subject
+    dropdown are both built from one shared snapshot. Writes on this node
+    publish a ``subjects`` change (``changes``), which calls ``invalidate()``;
+    ``ttl`` seconds is the safety net for changes made on other nodes.
+    Either way the rows are kept and only the subjects changed since the last
+    load (``delta``) are read and merged in.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = float(ttl)
+        self._lock = threading.Lock()
+        self._rows = None
+        self._stale = False
+        self._delta = None
+        self._node = ""
+        self._loaded_at = 0.0
+        self._generation = 0
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._stale = True
+            self._generation += 1
+
+    def snapshot(self, session: dict | None = None) -> CatalogSnapshot | None:
+        """Cached rows, loading them if needed (None if no node is reachable).
+
+        Raises ``mysql.connector.Error`` if the query fails.
+        """
+        with self._lock:
+            if self._rows is not None and not self._stale and time.monotonic() - self._loaded_at < self.ttl:
+                return CatalogSnapshot(self._rows, self._node, self._loaded_at, True)
+            generation = self._generation
+            rows, state = self._rows, self._delta
+
+        with read_connection(session, reference_shard()) as conn:
+            if conn is None:
+                return None
+            node = conn.node
+            with conn.cursor() as cur:
+                if rows is not None and mark_usable(state):
+                    cur.execute(SUBJECTS_DELTA_SQL, (since(state), since(state)))
+                    changed, deleted, state = split_delta(cur.fetchall() or [], state)
+                    rows = merge_rows_by_id(rows, changed, deleted)
+                else:
+                    # Mốc lấy trước khi đọc bảng: thay đổi xen giữa sẽ có trong delta lần sau.
+                    cur.execute(MARK_SQL.format(table="subjects"))
+                    state = mark_from(cur.fetchall())
+                    cur.execute("SELECT id, subject_code, subject_name, credits FROM subjects ORDER BY id")
+                    rows = [tuple(r) for r in cur.fetchall() or []]
+
+        loaded_at = time.monotonic()
+        with self._lock:
+            # An invalidate() that raced with this load wins: keep serving fresh reads.
+            if generation == self._generation:
+                self._rows, self._delta, self._node, self._loaded_at = rows, state, node, loaded_at
+                self._stale = False
+        return CatalogSnapshot(rows, node, loaded_at, False)
+
+
+subject_catalog = SubjectCatalog(SUBJECT_CACHE_TTL)
+changes.subscribe("subjects", lambda _keys: subject_catalog.invalidate())
+
+
+def subject_choice_labels(rows) -> list[str]:
+    # label: "1 - DBD - ..."
+    return [f"{r[0]} - {r[1]} - {r[2]}" for r in rows]
@@ -0,0 +1,181 @@
+"""Binlog change-data-capture: row events on students / subjects / scores -> ``changes``.
+
+One daemon thread per node in ``DB_CDC_HOSTS`` tails its row-based binlog
+(the compose files run MySQL with ``--binlog-format=ROW`` and GTID; a
+REPLICA logs the changes it applies too, ``log_replica_updates`` is on by
+default) with the optional ``pymysqlreplication`` package, starting at the
+node's current ``gtid_executed``. The primary keys of every written /
+updated / deleted row are published on ``changes``, so caches on this node
+drop what another node changed and open sessions (``live``) are pushed the
+change instead of polling.
+
+InnoDB applies FK cascades below the binlog, so deleting a student or
+subject logs no row events for its scores: a deleted student is also
+published as "scores: anything", a deleted subject is covered by the
+``subjects`` notification. After a reconnect the consumer restarts at the
+node's current position and publishes "anything changed" for every table,
+since events may have been missed in between.
+
+This process's own writes are in the binlog as well: while every consumer is
+connected, ``changes`` stops handing the handlers' publishes to live
+sessions, which then get each change once (from here).
+"""
+
+import logging
+import os
+import threading
+import time
+
+import mysql.connector
+
+import changes
+import metrics
+from db import DB_CDC_HOSTS, DB_CDC_SERVER_ID, DB_NAME, _connect_kwargs
+
+logger = logging.getLogger(__name__)
+
+# Số cột khoá chính ở đầu mỗi bảng (thứ tự cột trong students.sql).
+TABLE_KEYS = {"students": 1, "subjects": 1, "scores": 2}
+# Chờ trước khi kết nối lại sau lỗi (giây, tăng dần tới tối đa).
+_RETRY_MIN, _RETRY_MAX = 1.0, 30.0
+
+EVENTS = metrics.Counter("db_cdc_events_total", "Binlog row events published as change notifications.", ["node", "table"])
+metrics.register_collector(EVENTS.render)
+
+
+def _row_keys(event, width: int) -> set:
+    """Primary keys of the rows of one row event (by column position: works without binlog_row_metadata=FULL)."""
+    keys = set()
+    for row in event.rows:
+        for values in (row.get("values"), row.get("before_values"), row.get("after_values")):
+            if values:
+                key = tuple(list(values.values())[:width])
+                keys.add(key[0] if width == 1 else key)
+    return keys
+
+
+class BinlogConsumer:
+    """Tails the binlog of ``node`` from a daemon thread and publishes row changes."""
+
+    def __init__(self, node: str, server_id: int):
+        self.node = node
+        self.server_id = server_id
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._state = {"connected": False, "events": 0, "last_event_at": None, "error": ""}
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"cdc-{self.node}", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def state(self) -> dict:
+        with self._lock:
+            return dict(self._state)
+
+    def _run(self) -> None:
+        delay = _RETRY_MIN
+        first = True
+        while not self._stop.is_set():
+            try:
+                stream = self._open_stream()
+            except Exception as err:
+                self._set_error(err)
+                self._stop.wait(delay)
+                delay = min(delay * 2, _RETRY_MAX)
+                continue
+            if not first:
+                # Có thể đã lỡ sự kiện trong lúc mất kết nối.
+                for table in TABLE_KEYS:
+                    changes.publish(table, from_binlog=True)
+            first = False
+            delay = _RETRY_MIN
+            with self._lock:
+                self._state.update(connected=True, error="")
+            _update_feed()
+            try:
+                for event in stream:
+                    if self._stop.is_set():
+                        break
+                    self._publish(event)
+            except Exception as err:
+                self._set_error(err)
+            finally:
+                stream.close()
+        with self._lock:
+            self._state["connected"] = False
+        _update_feed()
+
+    def _open_stream(self):
+        try:
+            from pymysqlreplication import BinLogStreamReader
+            from pymysqlreplication.row_event import DeleteRowsEvent, UpdateRowsEvent, WriteRowsEvent
+        except ImportError as exc:
+            raise RuntimeError("Cần cài mysql-replication để bật DB_CDC (pip install mysql-replication).") from exc
+
+        kwargs = _connect_kwargs(self.node)
+        conn = mysql.connector.connect(**kwargs)
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT @@GLOBAL.gtid_executed")
+            gtid_executed = cur.fetchone()[0]
+            cur.close()
+        finally:
+            conn.close()
+
+        settings = {"host": kwargs["host"], "port": kwargs.get("port", 3306), "user": kwargs["user"], "passwd": kwargs["password"]}
+        return BinLogStreamReader(
+            connection_settings=settings,
+            server_id=self.server_id,
+            blocking=True,
+            auto_position=gtid_executed,
+            only_schemas=[DB_NAME],
+            only_tables=list(TABLE_KEYS),
+            only_events=[WriteRowsEvent, UpdateRowsEvent, DeleteRowsEvent],
+        )
+
+    def _publish(self, event) -> None:
+        width = TABLE_KEYS.get(event.table)
+        if width is None:
+            return
+        keys = _row_keys(event, width)
+        changes.publish(event.table, keys, from_binlog=True)
+        if event.table == "students" and type(event).__name__ == "DeleteRowsEvent":
+            # Điểm bị xoá theo FK không có trong binlog.
+            changes.publish("scores", from_binlog=True)
+        EVENTS.inc(self.node, event.table)
+        with self._lock:
+            self._state["events"] += 1
+            self._state["last_event_at"] = time.time()
+
+    def _set_error(self, err: Exception) -> None:
+        logger.warning("CDC %s: %s", self.node, err)
+        with self._lock:
+            self._state.update(connected=False, error=str(err))
+        _update_feed()
+
+
+_consumers: list[BinlogConsumer] = []
+
+
+def _update_feed() -> None:
+    # Chỉ khi mọi consumer đang kết nối thì thay đổi ghi từ process này mới chắc chắn quay lại qua binlog.
+    changes.set_binlog_feed(bool(_consumers) and all(consumer.state()["connected"] for consumer in _consumers))
+
+
+def start() -> list[BinlogConsumer]:
+    """Start one consumer per ``DB_CDC_HOSTS`` node (idempotent)."""
+    if not _consumers:
+        base = DB_CDC_SERVER_ID or 100000 + os.getpid() % 100000
+        _consumers.extend(BinlogConsumer(node, base + index) for index, node in enumerate(DB_CDC_HOSTS))
+        for consumer in _consumers:
+            consumer.start()
+    return _consumers
+
+
+def cdc_state() -> dict:
+    return {consumer.node: consumer.state() for consumer in _consumers}
@@ -0,0 +1,112 @@
+"""In-process change notifications: writers publish what changed, caches subscribe.
+
+Topics are table names (``students``, ``subjects``, ``scores``); ``keys``
+are the primary keys of the changed rows (``(student_id, subject_id)``
+tuples for ``scores``), or ``None`` for "anything may have changed".
+Handlers publish *after* commit; the binlog consumer (``cdc``) publishes
+changes made on other nodes. Subscribers must be cheap (drop cache entries,
+wake a listener) and must not raise; a failing subscriber is logged and
+skipped so a write never fails because of a cache.
+
+Without ``cdc``, changes made on other nodes (or by ``datagen.py``) are not
+seen here; each cache keeps a TTL as the safety net. With it, this process's
+own writes come back through the binlog too: while every consumer is
+connected (``binlog_feed_active``), subscribers registered with
+``prefer_binlog`` (live sessions) skip the handlers' publishes and hear each
+change once. Caches keep both, so a write invalidates them before the
+handler's follow-up read.
+"""
+
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_subscribers: dict[str, list] = {}  # topic -> [(callback, prefer_binlog)]
+_lock = threading.Lock()
+_binlog_feed = False
+
+
+def subscribe(topic: str, callback, prefer_binlog: bool = False) -> None:
+    """Call ``callback(keys)`` after every ``publish(topic, keys)``.
+
+    With ``prefer_binlog``, local publishes are skipped while the binlog feed is
+    active: the same change arrives from ``cdc`` a moment later.
+    """
+    with _lock:
+        _subscribers.setdefault(topic, []).append((callback, prefer_binlog))
+
+
+def unsubscribe(topic: str, callback) -> None:
+    with _lock:
+        _subscribers[topic] = [entry for entry in _subscribers.get(topic, []) if entry[0] != callback]
+
+
+def set_binlog_feed(active: bool) -> None:
+    """Called by ``cdc``: every binlog consumer is connected (local writes will come back from it)."""
+    global _binlog_feed
+    _binlog_feed = bool(active)
+
+
+def binlog_feed_active() -> bool:
+    return _binlog_feed
+
+
+def publish(topic: str, keys=None, from_binlog: bool = False) -> None:
+    """Notify the subscribers of ``topic`` (handlers after commit; ``cdc`` with ``from_binlog``)."""
+    keys = None if keys is None else frozenset(keys)
+    skip_preferring_binlog = _binlog_feed and not from_binlog
+    with _lock:
+        callbacks = [
+            callback
+            for callback, prefer_binlog in _subscribers.get(topic, ())
+            if not (prefer_binlog and skip_preferring_binlog)
+        ]
+    for callback in callbacks:
+        try:
+            callback(keys)
+        except Exception:  # a cache must never break the write that notified it
+            logger.exception("change subscriber %r failed for %s", callback, topic)
+
+
+def merge_keys(batch: dict, topic: str, keys) -> None:
+    """Fold one notification into ``batch`` ({topic: set of keys, or None = everything})."""
+    if keys is None or batch.get(topic, set()) is None:
+        batch[topic] = None
+    else:
+        batch.setdefault(topic, set()).update(keys)
+
+
+class Listener:
+    """Changes of ``topics`` delivered to one asyncio consumer (e.g. one browser session).
+
+    Use as a context manager inside the event loop; notifications published
+    from any thread are handed over with ``call_soon_threadsafe``.
+    """
+
+    def __init__(self, topics):
+        self._loop = asyncio.get_running_loop()
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._callbacks = {topic: self._callback(topic) for topic in topics}
+
+    def _callback(self, topic: str):
+        return lambda keys: self._loop.call_soon_threadsafe(self._queue.put_nowait, (topic, keys))
+
+    def __enter__(self):
+        for topic, callback in self._callbacks.items():
+            subscribe(topic, callback, prefer_binlog=True)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        for topic, callback in self._callbacks.items():
+            unsubscribe(topic, callback)
+
+    async def next_batch(self, window: float) -> dict:
+        """Wait for a change, then keep collecting for ``window`` seconds; {topic: keys or None}."""
+        batch: dict = {}
+        merge_keys(batch, *await self._queue.get())
+        await asyncio.sleep(window)
+        while not self._queue.empty():
+            merge_keys(batch, *self._queue.get_nowait())
+        return batch
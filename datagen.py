@@ -0,0 +1,319 @@
+"""Synthetic data for scale testing: students, accounts, subjects and scores.
+
+The same ``--seed`` always produces the same rows. Students get Vietnamese
+names, birth dates, classes and addresses, plus a ``student{id}`` account
+(password = username, like the seed data; ``benchmark.py`` logs in with it).
+Each student has scores in a random handful of subjects, so the scores
+matrix is sparse like real data.
+
+Rows are generated as a stream and loaded into the PRIMARY chunk by chunk,
+either with ``LOAD DATA LOCAL INFILE`` (default, needs ``local_infile=ON`` on
+the server) or with batched multi-row INSERTs. Foreign key and unique
+checks are switched off for the loading session only. New ids start after
+the current ``MAX(id)``, so running it on the demo database keeps the demo
+rows. It only targets an unsharded setup: with ``DB_SHARDS`` set it refuses
+to run, since the students would not land on the shards owning their ids.
+
+CLI:
+    python datagen.py --students 1000000 --subjects 2000 --scores-per-student 8 --seed 42
+    python datagen.py --students 50000 --method insert --batch-size 2000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import unicodedata
+from datetime import date, timedelta
+
+import mysql.connector
+
+import summary
+from db import PRIMARY_HOST, _connect_kwargs, sharding_enabled
+
+_HO = [
+    "Nguyễn", "Trần", "Lê", "Phạm", "Hoàng", "Huỳnh", "Phan", "Vũ", "Võ", "Đặng",
+    "Bùi", "Đỗ", "Hồ", "Ngô", "Dương", "Lý", "Đinh", "Trương", "Mai", "Tạ",
+]
+# Tần suất họ gần với thực tế (Nguyễn ~ 38%).
+_HO_WEIGHTS = [38, 11, 9.5, 7, 5.1, 5, 4.5, 3.9, 3.5, 2.1, 2, 1.4, 1.3, 1.3, 1, 0.5, 0.5, 0.5, 0.4, 0.3]
+_DEM_NAM = ["Văn", "Đức", "Minh", "Quốc", "Hữu", "Thanh", "Công", "Gia", "Hoàng", "Trọng", "Xuân", "Anh"]
+_DEM_NU = ["Thị", "Ngọc", "Thu", "Thanh", "Minh", "Khánh", "Phương", "Bảo", "Mỹ", "Hồng", "Kim", "Diệu"]
+_TEN_NAM = [
+    "An", "Bình", "Cường", "Dũng", "Duy", "Đạt", "Hải", "Hiếu", "Hoàng", "Hùng", "Huy", "Khánh",
+    "Khoa", "Long", "Minh", "Nam", "Nghĩa", "Phong", "Phúc", "Quân", "Sơn", "Tâm", "Thắng", "Thành",
+    "Tiến", "Trung", "Tuấn", "Tùng", "Việt", "Vinh",
+]
+_TEN_NU = [
+    "Anh", "Chi", "Dung", "Giang", "Hà", "Hạnh", "Hằng", "Hiền", "Hoa", "Hương", "Lan", "Linh",
+    "Loan", "Mai", "My", "Nga", "Ngân", "Nhung", "Oanh", "Phương", "Quỳnh", "Tâm", "Thảo", "Thu",
+    "Trang", "Trinh", "Tuyết", "Uyên", "Vân", "Yến",
+]
+_CITIES = [
+    ("Hà Nội", ["Ba Đình", "Hoàn Kiếm", "Đống Đa", "Cầu Giấy", "Thanh Xuân", "Hà Đông", "Long Biên"]),
+    ("TP.HCM", ["Quận 1", "Quận 3", "Quận 10", "Bình Thạnh", "Gò Vấp", "Tân Bình", "Thủ Đức"]),
+    ("Đà Nẵng", ["Hải Châu", "Thanh Khê", "Sơn Trà", "Ngũ Hành Sơn", "Liên Chiểu"]),
+    ("Hải Phòng", ["Hồng Bàng", "Lê Chân", "Ngô Quyền", "Kiến An"]),
+    ("Cần Thơ", ["Ninh Kiều", "Bình Thủy", "Cái Răng"]),
+    ("Huế", ["Phú Hội", "Vĩnh Ninh", "Thuận Hòa"]),
+]
+_STREETS = ["Lê Lợi", "Trần Hưng Đạo", "Nguyễn Trãi", "Hai Bà Trưng", "Lý Thường Kiệt", "Điện Biên Phủ", "Phan Đình Phùng"]
+_MAJORS = ["CN", "AT", "DT", "KT", "QT", "MR", "VT", "PT"]
+_SUBJECT_TOPICS = [
+    "Cơ sở dữ liệu", "Cơ sở dữ liệu phân tán", "Lập trình hướng đối tượng", "Cấu trúc dữ liệu và giải thuật",
+    "Mạng máy tính", "Hệ điều hành", "Trí tuệ nhân tạo", "Học máy", "Toán rời rạc", "Xác suất thống kê",
+    "Giải tích", "Đại số tuyến tính", "Kiến trúc máy tính", "Kỹ thuật phần mềm", "An toàn thông tin",
+    "Phát triển ứng dụng web", "Điện toán đám mây", "Xử lý ảnh", "Kinh tế vi mô", "Tiếng Anh chuyên ngành",
+]
+_SUBJECT_LEVELS = ["", " nâng cao", " ứng dụng", " chuyên sâu"]
+
+_DOB_START = date(1998, 1, 1)
+_DOB_DAYS = (date(2006, 12, 31) - _DOB_START).days
+
+_STUDENT_COLUMNS = ("id", "full_name", "class_name", "email", "date_of_birth", "address")
+_USER_COLUMNS = ("username", "password", "role", "student_id")
+_SUBJECT_COLUMNS = ("id", "subject_code", "subject_name", "credits")
+_SCORE_COLUMNS = ("student_id", "subject_id", "score")
+
+
+# ---------- generators ----------
+
+
+def _ascii(text: str) -> str:
+    text = text.replace("Đ", "D").replace("đ", "d")
+    return unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+
+
+def gen_students(seed: int, count: int, start_id: int):
+    """Yield student rows (``_STUDENT_COLUMNS``)."""
+    rng = random.Random(f"{seed}:students")
+    class_count = max(1, count // 60)
+    for i in range(count):
+        sid = start_id + i
+        male = rng.random() < 0.5
+        ho = rng.choices(_HO, weights=_HO_WEIGHTS)[0]
+        dem = rng.choice(_DEM_NAM if male else _DEM_NU)
+        ten = rng.choice(_TEN_NAM if male else _TEN_NU)
+        full_name = f"{ho} {dem} {ten}"
+
+        dob = _DOB_START + timedelta(days=rng.randrange(_DOB_DAYS))
+        class_no = rng.randrange(class_count)
+        class_name = f"D{(dob.year + 18) % 100:02d}CQ{_MAJORS[class_no % len(_MAJORS)]}{class_no // len(_MAJORS) + 1:02d}"
+        email = f"{_ascii(ten).lower()}.{_ascii(ho).lower()}{sid}@student.edu.vn"
+        city, districts = rng.choice(_CITIES)
+        address = f"{rng.randint(1, 300)} {rng.choice(_STREETS)}, {rng.choice(districts)}, {city}"
+        yield sid, full_name, class_name, email, dob, address
+
+
+def gen_users(count: int, start_id: int):
+    for sid in range(start_id, start_id + count):
+        username = f"student{sid}"
+        yield username, username, "student", sid
+
+
+def gen_subjects(seed: int, count: int, start_id: int):
+    rng = random.Random(f"{seed}:subjects")
+    for i in range(count):
+        subject_id = start_id + i
+        topic = _SUBJECT_TOPICS[i % len(_SUBJECT_TOPICS)]
+        level = _SUBJECT_LEVELS[(i // len(_SUBJECT_TOPICS)) % len(_SUBJECT_LEVELS)]
+        part = i // (len(_SUBJECT_TOPICS) * len(_SUBJECT_LEVELS))
+        name = topic + level + (f" {part + 1}" if part else "")
+        yield subject_id, f"GEN{subject_id:06d}", name, rng.choice((1, 2, 2, 3, 3, 3, 4))
+
+
+def gen_scores(seed: int, students: int, student_start: int, subject_ids: list[int], per_student: float):
+    """Sparse scores: each student has 0..2*per_student subjects, scores ~ N(6.8, 1.6) in [0, 10].
+
+    Popular subjects (low ids) are picked more often, like mandatory courses.
+    """
+    rng = random.Random(f"{seed}:scores")
+    if not subject_ids:
+        return
+    n = len(subject_ids)
+    max_k = min(n, max(0, int(round(per_student * 2))))
+    for sid in range(student_start, student_start + students):
+        k = rng.randint(0, max_k)
+        if k * 2 > n:
+            picked = set(rng.sample(subject_ids, k))
+        else:
+            picked = set()
+            while len(picked) < k:
+                # Skewed towards the start of the catalog.
+                picked.add(subject_ids[int(n * rng.random() ** 2)])
+        for subject_id in sorted(picked):
+            if rng.random() < 0.03:
+                score = None  # registered, not graded yet
+            else:
+                score = round(min(10.0, max(0.0, rng.gauss(6.8, 1.6))) * 4) / 4
+            yield sid, subject_id, score
+
+
+# ---------- loading ----------
+
+
+def _chunks(rows, size: int):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _tsv_value(value) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+
+def _load_chunk_infile(cur, table: str, columns, chunk, tmp_dir: str) -> None:
+    path = os.path.join(tmp_dir, f"{table}.tsv")
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        for row in chunk:
+            f.write("\t".join(_tsv_value(v) for v in row))
+            f.write("\n")
+    cur.execute(
+        f"LOAD DATA LOCAL INFILE %s INTO TABLE {table} CHARACTER SET utf8mb4 ({', '.join(columns)})",
+        (path,),
+    )
+
+
+def _load_chunk_insert(cur, table: str, columns, chunk) -> None:
+    # executemany rewrites this into a single multi-row INSERT.
+    cur.executemany(
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({','.join(['%s'] * len(columns))})",
+        chunk,
+    )
+
+
+def load_rows(conn, table: str, columns, rows, method: str, batch_size: int, tmp_dir: str, progress=None) -> dict:
+    """Load ``rows`` into ``table`` one committed chunk at a time; returns {rows, seconds, rows_per_second}."""
+    started = time.perf_counter()
+    count = 0
+    cur = conn.cursor()
+    try:
+        for chunk in _chunks(rows, batch_size):
+            if method == "infile":
+                _load_chunk_infile(cur, table, columns, chunk, tmp_dir)
+            else:
+                _load_chunk_insert(cur, table, columns, chunk)
+            conn.commit()
+            count += len(chunk)
+            if progress:
+                progress(table, count, time.perf_counter() - started)
+    finally:
+        cur.close()
+    seconds = time.perf_counter() - started
+    return {"rows": count, "seconds": round(seconds, 3), "rows_per_second": round(count / seconds) if seconds > 0 else 0}
+
+
+def _next_id(cur, table: str) -> int:
+    cur.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}")
+    return int(cur.fetchone()[0])
+
+
+def _rebuild_summary(conn) -> dict:
+    """Bulk loads bypass the app's incremental summary updates: recompute it once."""
+    started = time.perf_counter()
+    cur = conn.cursor()
+    try:
+        count = summary.rebuild(cur)
+        conn.commit()
+    finally:
+        cur.close()
+    seconds = time.perf_counter() - started
+    return {"rows": count, "seconds": round(seconds, 3), "rows_per_second": round(count / seconds) if seconds > 0 else 0}
+
+
+def generate_and_load(
+    students: int,
+    subjects: int,
+    scores_per_student: float,
+    seed: int = 42,
+    method: str = "infile",
+    batch_size: int = 50_000,
+    progress=None,
+) -> dict:
+    """Generate and load everything into the PRIMARY; returns a report per table."""
+    if sharding_enabled():
+        raise RuntimeError("datagen.py chỉ nạp vào một PRIMARY: hãy bỏ DB_SHARDS (sinh viên sẽ nằm sai shard).")
+    if not PRIMARY_HOST:
+        raise RuntimeError("Không có PRIMARY để nạp dữ liệu.")
+    kwargs = _connect_kwargs(PRIMARY_HOST)
+    if method == "infile":
+        kwargs["allow_local_infile"] = True
+    conn = mysql.connector.connect(**kwargs)
+    report = {}
+    try:
+        cur = conn.cursor()
+        # Chỉ cho session nạp dữ liệu: dữ liệu sinh ra đã đúng khoá ngoại / unique.
+        cur.execute("SET SESSION foreign_key_checks = 0, SESSION unique_checks = 0")
+        student_start = _next_id(cur, "students")
+        subject_start = _next_id(cur, "subjects")
+        cur.close()
+        conn.autocommit = False
+
+        with tempfile.TemporaryDirectory(prefix="datagen_") as tmp_dir:
+            def load(table, columns, rows):
+                report[table] = load_rows(conn, table, columns, rows, method, batch_size, tmp_dir, progress)
+
+            load("subjects", _SUBJECT_COLUMNS, gen_subjects(seed, subjects, subject_start))
+            load("students", _STUDENT_COLUMNS, gen_students(seed, students, student_start))
+            load("users", _USER_COLUMNS, gen_users(students, student_start))
+            subject_ids = list(range(subject_start, subject_start + subjects))
+            load("scores", _SCORE_COLUMNS, gen_scores(seed, students, student_start, subject_ids, scores_per_student))
+            report["student_summary"] = _rebuild_summary(conn)
+    finally:
+        conn.close()
+
+    total_rows = sum(r["rows"] for r in report.values())
+    total_seconds = sum(r["seconds"] for r in report.values())
+    report["total"] = {
+        "rows": total_rows,
+        "seconds": round(total_seconds, 3),
+        "rows_per_second": round(total_rows / total_seconds) if total_seconds > 0 else 0,
+    }
+    return report
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Sinh dữ liệu giả lập (sinh viên, môn học, điểm) và nạp nhanh vào PRIMARY.")
+    parser.add_argument("--students", type=int, default=100_000)
+    parser.add_argument("--subjects", type=int, default=1_000)
+    parser.add_argument("--scores-per-student", type=float, default=8.0, help="số môn trung bình mỗi sinh viên")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--method", choices=("infile", "insert"), default="infile")
+    parser.add_argument("--batch-size", type=int, default=50_000, help="số dòng mỗi chunk / transaction")
+    args = parser.parse_args(argv)
+
+    def progress(table, count, seconds):
+        print(f"... {table}: {count} dòng, {count / seconds if seconds else 0:.0f} dòng/s", flush=True)
+
+    try:
+        report = generate_and_load(
+            args.students,
+            args.subjects,
+            args.scores_per_student,
+            seed=args.seed,
+            method=args.method,
+            batch_size=max(1, args.batch_size),
+            progress=progress,
+        )
+    except (RuntimeError, mysql.connector.Error) as err:
+        print(f"❌ {err}")
+        if getattr(err, "errno", None) in (1148, 2068, 3948):
+            print("   Server/client chưa bật local_infile: bật --local-infile=ON cho MySQL hoặc dùng --method insert.")
+        return 1
+    for table, r in report.items():
+        print(f"{table:<10} {r['rows']:>12} dòng  {r['seconds']:>9.2f}s  {r['rows_per_second']:>10} dòng/s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
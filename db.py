@@ -1,7 +1,23 @@
+import contextlib
+import contextvars
+import itertools
+import math
 import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 import mysql.connector
+from mysql.connector import HAVE_CEXT
+from mysql.connector.errors import PoolError
+
+import metrics
+from breaker import CLOSED, OPEN, CircuitBreaker
+from pool import ConnectionPool
+from replication import ReplicaLagMonitor, TopologyMonitor
+from shards import Shard, ShardMap, UnroutedStudent, parse_shards
+from slowlog import SlowQueryLog
 
 
 def _load_env_file(env_path: str = ".env") -> None:
@@ -53,16 +69,849 @@ DB_PASS = os.getenv("DB_PASS", os.getenv("MYSQL_ROOT_PASSWORD", ""))
 DB_NAME = os.getenv("DB_NAME", "distributed_db")
 
 
-def get_db_connection():
+def _env_int(key: str, default: int) -> int:
+    try:
+        return int(os.getenv(key, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_float(key: str, default: float) -> float:
     try:
-        return mysql.connector.connect(
-            host=DB_HOST,
-            user=DB_USER,
-            password=DB_PASS,
-            database=DB_NAME,
+        return float(os.getenv(key, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_bool(key: str, default: bool) -> bool:
+    value = os.getenv(key)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_list(key: str) -> list[str]:
+    return [item.strip() for item in os.getenv(key, "").split(",") if item.strip()]
+
+
+# Read/write splitting: ghi luôn vào PRIMARY, đọc từ các REPLICA.
+# - DB_PRIMARY_HOST: node nhận ghi (mặc định = DB_HOST nếu ROLE=primary).
+# - DB_REPLICA_HOSTS: danh sách node đọc, cách nhau bởi dấu phẩy (host hoặc host:port).
+#   Mặc định = DB_HOST nếu ROLE=replica; nếu trống thì đọc từ PRIMARY.
+PRIMARY_HOST = os.getenv("DB_PRIMARY_HOST") or (DB_HOST if ROLE == "primary" else None)
+REPLICA_HOSTS = _env_list("DB_REPLICA_HOSTS") or ([DB_HOST] if ROLE == "replica" else [])
+
+# Node đọc dự phòng (host hoặc host:port), thử sau REPLICA và PRIMARY khi các node đó không kết nối được.
+READ_FAILOVER_HOSTS = _env_list("DB_READ_FAILOVER_HOSTS")
+
+# Tự phát hiện PRIMARY lúc chạy: mỗi DB_TOPOLOGY_INTERVAL giây hỏi @@read_only / @@super_read_only
+# và trạng thái replication của các node trong DB_NODES (mặc định = PRIMARY + REPLICA + node dự phòng);
+# node ghi được là PRIMARY. Khi PRIMARY chết và một REPLICA được promote, ghi tự chuyển sang node đó.
+# DB_TOPOLOGY_INTERVAL=0: tắt, dùng cấu hình tĩnh ở trên.
+DB_NODES = _env_list("DB_NODES") or list(
+    dict.fromkeys(([PRIMARY_HOST] if PRIMARY_HOST else []) + REPLICA_HOSTS + READ_FAILOVER_HOSTS)
+)
+DB_TOPOLOGY_INTERVAL = _env_float("DB_TOPOLOGY_INTERVAL", 2.0)
+
+# Sharding theo khoảng students.id: mỗi shard là 1 nhóm PRIMARY/REPLICA riêng giữ students,
+# scores và tài khoản của sinh viên trong khoảng đó; subjects được ghi lên mọi shard (xem shards.py).
+# Ví dụ: DB_SHARDS=1-499999=10.0.0.1|10.0.0.2;500000-=10.0.1.1|10.0.1.2. Trống = không shard.
+DB_SHARDS = os.getenv("DB_SHARDS", "")
+
+# Read-your-writes: REPLICA phải bắt kịp GTID của lần ghi gần nhất trong session
+# trong tối đa DB_GTID_WAIT_TIMEOUT giây, nếu không thì đọc từ PRIMARY.
+DB_GTID_WAIT_TIMEOUT = _env_float("DB_GTID_WAIT_TIMEOUT", 1.0)
+
+# Theo dõi độ trễ replication: REPLICA trễ hơn DB_REPLICA_MAX_LAG giây (trung bình
+# DB_REPLICA_LAG_WINDOW mẫu gần nhất) bị loại khỏi read pool cho tới khi bắt kịp.
+DB_REPLICA_LAG_INTERVAL = _env_float("DB_REPLICA_LAG_INTERVAL", 2.0)  # 0 = tắt
+DB_REPLICA_LAG_WINDOW = _env_int("DB_REPLICA_LAG_WINDOW", 5)
+DB_REPLICA_MAX_LAG = _env_float("DB_REPLICA_MAX_LAG", 5.0)
+
+# Số sinh viên mỗi trang trong bảng danh sách (keyset pagination).
+STUDENTS_PAGE_SIZE = max(1, _env_int("STUDENTS_PAGE_SIZE", 50))
+
+# Danh mục môn học được cache trong process; TTL (giây) phòng khi node khác sửa môn học.
+SUBJECT_CACHE_TTL = _env_float("SUBJECT_CACHE_TTL", 60.0)
+
+# Delta refresh: nhìn lùi (giây) sau mốc đã đồng bộ để không sót transaction commit muộn /
+# lệch đồng hồ giữa các shard; tombstone được giữ DELTA_TOMBSTONE_RETENTION giây (client lâu hơn
+# thế chưa đồng bộ thì tải lại toàn bộ).
+DELTA_OVERLAP_SECONDS = _env_float("DELTA_OVERLAP_SECONDS", 2.0)
+DELTA_TOMBSTONE_RETENTION = max(60, _env_int("DELTA_TOMBSTONE_RETENTION", 86400))
+# Chốt chặn: dòng của transaction commit muộn hơn DELTA_OVERLAP_SECONDS sau khi đóng dấu updated_at (ghi dài,
+# REPLICA trễ) nằm ngoài cửa sổ delta; cứ sau chừng ấy giây kể từ lần tải đầy đủ trước thì tải lại toàn bộ (0 = tắt).
+DELTA_FULL_RELOAD_SECONDS = _env_float("DELTA_FULL_RELOAD_SECONDS", 300.0)
+
+# Thống kê điểm theo môn được cache tới khi có điểm của môn đó thay đổi trên node này;
+# TTL (giây) phòng khi node khác ghi điểm.
+SUBJECT_STATS_CACHE_TTL = _env_float("SUBJECT_STATS_CACHE_TTL", 300.0)
+
+# Số dòng mỗi batch (1 transaction) khi nhập sinh viên hàng loạt từ CSV/XLSX.
+BULK_IMPORT_BATCH_SIZE = max(1, _env_int("BULK_IMPORT_BATCH_SIZE", 500))
+
+# Số dòng đọc mỗi lần từ cursor khi xuất dữ liệu (bộ nhớ khi export ~ tỉ lệ với số này).
+EXPORT_FETCH_SIZE = max(1, _env_int("EXPORT_FETCH_SIZE", 1000))
+
+# Connection pool (mỗi click không còn phải connect + auth + close lại từ đầu).
+DB_POOL_SIZE = _env_int("DB_POOL_SIZE", 5)
+DB_POOL_MAX_OVERFLOW = _env_int("DB_POOL_MAX_OVERFLOW", 10)
+DB_POOL_TIMEOUT = _env_float("DB_POOL_TIMEOUT", 10.0)
+DB_POOL_IDLE_TIMEOUT = _env_float("DB_POOL_IDLE_TIMEOUT", 300.0)
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", True)
+DB_POOL_RESET_SESSION = _env_bool("DB_POOL_RESET_SESSION", True)
+# Prepared statement phía server cho các câu lệnh nóng (đăng nhập, bảng điểm, chi tiết sinh viên, lưu điểm),
+# giữ theo từng kết nối trong pool. COM_RESET_CONNECTION (DB_POOL_RESET_SESSION) xoá chúng mỗi lần trả kết nối,
+# lần mượn sau phải prepare lại (thêm round trip), nên mặc định chỉ bật khi đã tắt reset session.
+DB_PREPARED_STATEMENTS = _env_bool("DB_PREPARED_STATEMENTS", not DB_POOL_RESET_SESSION)
+
+# Các handler đọc nóng + lưu điểm chạy bằng asyncio (db_async) thay vì chiếm 1 thread mỗi request.
+DB_ASYNC_HANDLERS = _env_bool("DB_ASYNC_HANDLERS", True)
+
+# CDC: đọc binlog (ROW + GTID) để biết thay đổi từ node khác (cần mysql-replication).
+# DB_CDC_HOSTS: các node cần đọc binlog (mặc định = node local DB_HOST; sharding: 1 node mỗi shard);
+# DB_CDC_SERVER_ID 0 = tự chọn theo PID (phải khác mọi server-id MySQL).
+DB_CDC = _env_bool("DB_CDC", False)
+DB_CDC_HOSTS = _env_list("DB_CDC_HOSTS") or [DB_HOST]
+DB_CDC_SERVER_ID = _env_int("DB_CDC_SERVER_ID", 0)
+# Gộp các thay đổi đến gần nhau (giây) trước khi đẩy cập nhật tới phiên đang mở.
+LIVE_DEBOUNCE = _env_float("LIVE_DEBOUNCE", 0.5)
+
+# Slow query log phía ứng dụng (JSON lines, xoay vòng theo dung lượng); 0 = tắt.
+DB_SLOW_QUERY_MS = _env_float("DB_SLOW_QUERY_MS", 500.0)
+DB_SLOW_QUERY_LOG = os.getenv("DB_SLOW_QUERY_LOG", "slow_queries.log")
+DB_SLOW_QUERY_LOG_MAX_BYTES = _env_int("DB_SLOW_QUERY_LOG_MAX_BYTES", 10 * 1024 * 1024)
+DB_SLOW_QUERY_LOG_BACKUPS = _env_int("DB_SLOW_QUERY_LOG_BACKUPS", 5)
+
+# Circuit breaker theo node: sau DB_BREAKER_FAILURES lần connect lỗi liên tiếp thì báo lỗi
+# ngay (không chờ timeout), thử lại sau DB_BREAKER_BACKOFF giây (gấp đôi mỗi lần thử lỗi,
+# tối đa DB_BREAKER_MAX_BACKOFF). DB_CONNECT_TIMEOUT giới hạn thời gian mỗi lần connect.
+DB_CONNECT_TIMEOUT = _env_int("DB_CONNECT_TIMEOUT", 3)
+DB_BREAKER_FAILURES = _env_int("DB_BREAKER_FAILURES", 3)
+DB_BREAKER_BACKOFF = _env_float("DB_BREAKER_BACKOFF", 5.0)
+DB_BREAKER_MAX_BACKOFF = _env_float("DB_BREAKER_MAX_BACKOFF", 60.0)
+
+# Group commit cho lưu điểm: các lần lưu một điểm đến trong DB_SCORE_GROUP_COMMIT_MS ms được gộp
+# thành 1 câu INSERT ... ON DUPLICATE KEY UPDATE nhiều dòng trong 1 transaction (tối đa
+# DB_SCORE_GROUP_COMMIT_MAX dòng); mỗi người vẫn nhận kết quả riêng. 0 = tắt (mỗi lần lưu 1 commit).
+DB_SCORE_GROUP_COMMIT_MS = _env_float("DB_SCORE_GROUP_COMMIT_MS", 0.0)
+DB_SCORE_GROUP_COMMIT_MAX = max(1, _env_int("DB_SCORE_GROUP_COMMIT_MAX", 200))
+
+# Cổng HTTP phục vụ /metrics (định dạng Prometheus) bên cạnh Gradio; 0 = tắt.
+METRICS_PORT = _env_int("METRICS_PORT", 9464)
+# Địa chỉ lắng nghe của /metrics: mặc định chỉ máy local (endpoint không có xác thực, lộ tên handler /
+# node / errno); đặt 0.0.0.0 hoặc IP LAN khi Prometheus scrape từ máy khác.
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1").strip() or "127.0.0.1"
+
+_pools: dict[str, ConnectionPool] = {}
+_async_pools: dict = {}  # node -> AsyncConnectionPool, filled by db_async
+_breakers: dict[str, CircuitBreaker] = {}  # shared by the sync and async pools of a node
+_pools_lock = threading.Lock()
+_replica_cursor = itertools.count()
+# Node that served the last checkout of this thread / asyncio task (for _node_info());
+# a tuple of nodes after a scatter-gather read across shards.
+_last_node: contextvars.ContextVar[str | tuple | None] = contextvars.ContextVar("last_node", default=None)
+_shard_map = ShardMap(parse_shards(DB_SHARDS)) if DB_SHARDS.strip() else None
+
+
+def _connect_kwargs(node: str) -> dict:
+    host, _, port = node.partition(":")
+    kwargs = {
+        "host": host,
+        "user": DB_USER,
+        "password": DB_PASS,
+        "database": DB_NAME,
+        "connection_timeout": DB_CONNECT_TIMEOUT,
+    }
+    if port:
+        kwargs["port"] = int(port)
+    return kwargs
+
+
+def _get_pool(node: str) -> ConnectionPool:
+    pool = _pools.get(node)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(node)
+            if pool is None:
+                pool = ConnectionPool(
+                    name=node,
+                    # C extension khi có: parse kết quả (cả giao thức binary) nhanh hơn bản pure Python.
+                    connect_kwargs={**_connect_kwargs(node), "use_pure": not HAVE_CEXT},
+                    size=DB_POOL_SIZE,
+                    max_overflow=DB_POOL_MAX_OVERFLOW,
+                    timeout=DB_POOL_TIMEOUT,
+                    idle_timeout=DB_POOL_IDLE_TIMEOUT,
+                    pre_ping=DB_POOL_PRE_PING,
+                    reset_on_return=DB_POOL_RESET_SESSION,
+                    prepared=DB_PREPARED_STATEMENTS,
+                )
+                _pools[node] = pool
+    return pool
+
+
+def _get_breaker(node: str) -> CircuitBreaker:
+    breaker = _breakers.get(node)
+    if breaker is None:
+        with _pools_lock:
+            breaker = _breakers.setdefault(
+                node,
+                CircuitBreaker(
+                    node,
+                    failure_threshold=DB_BREAKER_FAILURES,
+                    backoff=DB_BREAKER_BACKOFF,
+                    max_backoff=DB_BREAKER_MAX_BACKOFF,
+                ),
+            )
+    return breaker
+
+
+def _checkout_failed(breaker: CircuitBreaker, err: mysql.connector.Error) -> None:
+    if isinstance(err, PoolError):
+        # Pool đầy: node vẫn sống, không tính là lỗi node.
+        breaker.release_probe()
+    else:
+        breaker.record_failure(str(err))
+
+
+def _checkout(node: str):
+    breaker = _get_breaker(node)
+    if not breaker.allow():
+        return None
+    try:
+        conn = _get_pool(node).acquire()
+    except mysql.connector.Error as err:
+        _checkout_failed(breaker, err)
+        return None
+    breaker.record_success()
+    _last_node.set(node)
+    return conn
+
+
+_lag_monitor: ReplicaLagMonitor | None = None
+_shard_lag_monitors: dict[str, ReplicaLagMonitor] = {}
+
+
+def _get_lag_monitor(shard: Shard | None = None) -> ReplicaLagMonitor:
+    """Lag monitor for the replicas (of ``shard``), started on first use."""
+    global _lag_monitor
+    if shard is not None:
+        return _shard_monitor(
+            _shard_lag_monitors,
+            shard,
+            lambda: ReplicaLagMonitor(
+                shard.replicas,
+                checkout=_checkout,
+                interval=DB_REPLICA_LAG_INTERVAL,
+                window=DB_REPLICA_LAG_WINDOW,
+                max_lag=DB_REPLICA_MAX_LAG,
+            ),
+        )
+    if _lag_monitor is None:
+        with _pools_lock:
+            if _lag_monitor is None:
+                _lag_monitor = ReplicaLagMonitor(
+                    [node for node in REPLICA_HOSTS if node != PRIMARY_HOST],
+                    checkout=_checkout,
+                    interval=DB_REPLICA_LAG_INTERVAL,
+                    window=DB_REPLICA_LAG_WINDOW,
+                    max_lag=DB_REPLICA_MAX_LAG,
+                )
+                _lag_monitor.start()
+    return _lag_monitor
+
+
+def _shard_monitor(monitors: dict, shard: Shard, factory):
+    monitor = monitors.get(shard.name)
+    if monitor is None:
+        with _pools_lock:
+            monitor = monitors.get(shard.name)
+            if monitor is None:
+                monitor = monitors[shard.name] = factory()
+                monitor.start()
+    return monitor
+
+
+_topology: TopologyMonitor | None = None
+_shard_topologies: dict[str, TopologyMonitor] = {}
+
+# Lỗi ghi cho thấy PRIMARY đã đổi (read-only, mất kết nối): kiểm tra lại topology ngay.
+_FAILOVER_ERRNOS = {1290, 1836, 2003, 2006, 2013, 2055}
+
+
+def _get_topology(shard: Shard | None = None) -> TopologyMonitor | None:
+    """Writable-node discovery (of ``shard``), started on first use (None if disabled)."""
+    global _topology
+    if DB_TOPOLOGY_INTERVAL <= 0:
+        return None
+    if shard is not None:
+        return _shard_monitor(
+            _shard_topologies,
+            shard,
+            lambda: TopologyMonitor(shard.nodes, checkout=_checkout, interval=DB_TOPOLOGY_INTERVAL, preferred=shard.primary),
         )
+    if _topology is None and DB_NODES:
+        with _pools_lock:
+            if _topology is None:
+                _topology = TopologyMonitor(
+                    DB_NODES,
+                    checkout=_checkout,
+                    interval=DB_TOPOLOGY_INTERVAL,
+                    preferred=PRIMARY_HOST,
+                )
+                _topology.start()
+    return _topology
+
+
+def current_primary(shard: Shard | None = None) -> str | None:
+    """The node that takes writes now (for ``shard``): discovered at runtime, else the configured one."""
+    topology = _get_topology(shard)
+    if topology:
+        return topology.primary()
+    return shard.primary if shard is not None else PRIMARY_HOST
+
+
+def _rediscover_primary(failed: str, shard: Shard | None = None) -> str | None:
+    """Re-check the topology after ``failed`` refused a connection; the new PRIMARY if it moved."""
+    topology = _get_topology(shard)
+    if topology is None:
+        return None
+    primary = topology.refresh()
+    return primary if primary != failed else None
+
+
+def _watch_write_errors(node, sql, params, seconds, error) -> None:
+    if error is None or getattr(error, "errno", None) not in _FAILOVER_ERRNOS:
+        return
+    for topology in [_topology, *_shard_topologies.values()]:
+        if topology is not None and node == topology.primary():
+            topology.refresh_soon()
+
+
+metrics.register_query_observer(_watch_write_errors)
+
+
+# ---------- shards ----------
+
+
+def sharding_enabled() -> bool:
+    return _shard_map is not None
+
+
+def all_shards() -> list[Shard]:
+    """Shards in id-range order ([] when not sharded)."""
+    return list(_shard_map.shards) if _shard_map else []
+
+
+def shard_for_student(student_id) -> Shard | None:
+    """Shard owning ``student_id``; None only when not sharded (the single PRIMARY_HOST / local node).
+
+    With ``DB_SHARDS`` set, an id no range owns raises ``UnroutedStudent`` instead of
+    quietly falling back to the default node.
+    """
+    if _shard_map is None:
+        return None
+    try:
+        shard = _shard_map.for_student(int(student_id))
+    except (TypeError, ValueError):
+        raise UnroutedStudent(f"Student ID '{student_id}' không hợp lệ.") from None
+    if shard is None:
+        raise UnroutedStudent(f"Student ID {student_id} không thuộc shard nào trong DB_SHARDS.")
+    return shard
+
+
+def new_student_shard() -> Shard | None:
+    """Shard that receives newly created students (the highest id range)."""
+    return _shard_map.for_new_student() if _shard_map else None
+
+
+def reference_shard() -> Shard | None:
+    """Shard the ``subjects`` catalog is read from (every shard holds a copy)."""
+    return _shard_map.shards[0] if _shard_map else None
+
+
+def _shard_of_node(node: str) -> Shard | None:
+    return _shard_map.for_node(node) if _shard_map else None
+
+
+# ---------- connections ----------
+
+
+def get_db_connection():
+    """Check out a pooled connection to the LOCAL node (``DB_HOST``).
+
+    ``conn.close()`` returns it to the pool. Handlers should prefer
+    ``get_read_connection()`` / ``get_write_connection()``.
+    """
+    return _checkout(DB_HOST)
+
+
+def get_read_connection(session: dict | None = None, shard: Shard | None = None):
+    """Connection for a read: next healthy replica (round-robin), PRIMARY as fallback.
+
+    Replicas whose rolling lag exceeds ``DB_REPLICA_MAX_LAG`` are skipped.
+    With ``shard`` the read goes to that shard's group instead.
+
+    If the session has written before (``session["gtid"]``, see
+    ``remember_write``), the replica must have applied that GTID set within
+    ``DB_GTID_WAIT_TIMEOUT`` seconds; otherwise the read goes to the PRIMARY,
+    so a ``.then(...)`` refresh never shows data older than the user's own write.
+    """
+    gtid_set = _session_gtid(session, shard)
+    primary = current_primary(shard)
+    for node in _read_candidates(shard):
+        conn = _checkout(node)
+        if conn is None:
+            continue
+        if gtid_set and node != primary and not _wait_for_gtid(conn, gtid_set):
+            conn.close()
+            break
+        return conn
+    for node in _read_fallbacks(shard):
+        conn = _checkout(node)
+        if conn is not None:
+            return conn
+    return None
+
+
+def _read_fallbacks(shard: Shard | None = None) -> list[str]:
+    """Nodes for a read once the replicas are out: PRIMARY, then DB_READ_FAILOVER_HOSTS."""
+    primary = current_primary(shard)
+    nodes = [primary] if primary else []
+    if shard is not None:
+        return nodes
+    return nodes + [node for node in READ_FAILOVER_HOSTS if node not in nodes]
+
+
+def _read_candidates(shard: Shard | None = None) -> list[str]:
+    """Healthy read nodes in round-robin order for this request."""
+    replicas = shard.replicas if shard is not None else REPLICA_HOSTS
+    monitor = _get_lag_monitor(shard)
+    candidates = [node for node in replicas if monitor.is_healthy(node)]
+    if not candidates and not current_primary(shard):
+        # Không có PRIMARY để dự phòng: đọc REPLICA trễ còn hơn không đọc được.
+        candidates = replicas
+    if not candidates:
+        return []
+    start = next(_replica_cursor)
+    return [candidates[(start + i) % len(candidates)] for i in range(len(candidates))]
+
+
+def get_write_connection(shard: Shard | None = None):
+    """Connection for a write: the current PRIMARY (of ``shard``), None if no node is writable.
+
+    If the PRIMARY cannot be reached the topology is re-checked once, so a
+    promoted replica takes the write without waiting for the next round.
+    """
+    primary = current_primary(shard)
+    if not primary:
+        return None
+    conn = _checkout(primary)
+    if conn is None:
+        promoted = _rediscover_primary(primary, shard)
+        if promoted:
+            conn = _checkout(promoted)
+    return conn
+
+
+def remember_write(session: dict | None, conn, shard: Shard | None = None) -> None:
+    """After a commit on the PRIMARY, store its executed GTID set in the session.
+
+    ``@@GLOBAL.gtid_executed`` is a superset of this commit's GTID, which is
+    enough for read-your-writes (at worst the replica waits for a bit more).
+    Each shard has its own GTID history, kept under ``session["shard_gtids"]``.
+    """
+    if session is None:
+        return
+    gtid_set = executed_gtid(conn)
+    if gtid_set:
+        _store_gtid(session, shard, gtid_set)
+
+
+def executed_gtid(conn) -> str | None:
+    """``@@GLOBAL.gtid_executed`` of ``conn``'s node (None if it cannot be read)."""
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT @@GLOBAL.gtid_executed")
+        row = cur.fetchone()
+        cur.close()
     except mysql.connector.Error:
         return None
+    return row[0] if row and row[0] else None
+
+
+def _session_gtid(session: dict | None, shard: Shard | None) -> str | None:
+    if shard is None:
+        return (session or {}).get("gtid")
+    return (session or {}).get("shard_gtids", {}).get(shard.name)
+
+
+def _store_gtid(session: dict, shard: Shard | None, gtid_set: str) -> None:
+    if shard is None:
+        session["gtid"] = gtid_set
+    else:
+        session.setdefault("shard_gtids", {})[shard.name] = gtid_set
+
+
+def _wait_for_gtid(conn, gtid_set: str) -> bool:
+    """True if ``conn``'s node has applied ``gtid_set`` (waits up to DB_GTID_WAIT_TIMEOUT)."""
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT WAIT_FOR_EXECUTED_GTID_SET(%s, %s)",
+            (gtid_set, DB_GTID_WAIT_TIMEOUT),
+        )
+        row = cur.fetchone()
+        cur.close()
+    except mysql.connector.Error:
+        return False
+    return bool(row) and row[0] == 0
+
+
+# ---------- request-scoped connections ----------
+
+# Kết nối đã lấy trong thao tác hiện tại: {("read"|"write", shard): conn}; None = ngoài unit_of_work.
+_action_conns: contextvars.ContextVar[dict | None] = contextvars.ContextVar("action_conns", default=None)
+
+
+@contextlib.contextmanager
+def unit_of_work():
+    """Scope in which ``read_connection`` / ``write_connection`` blocks share checkouts.
+
+    Use as ``with unit_of_work():`` or as a ``@unit_of_work()`` decorator on a
+    handler made of several DB steps. The first block needing a connection
+    for a (role, shard) checks it out; later and nested blocks in the same
+    thread reuse it, and everything goes back to the pool when the outermost
+    scope exits. A read reuses the write connection of its shard if there is
+    one (it also sees that transaction's writes). Scatter-gather reads keep
+    their own parallel checkouts.
+    """
+    if _action_conns.get() is not None:
+        yield
+        return
+    conns: dict = {}
+    token = _action_conns.set(conns)
+    try:
+        yield
+    finally:
+        _action_conns.reset(token)
+        for conn in conns.values():
+            conn.close()
+
+
+def _scoped_conn(conns: dict, *keys):
+    for key in keys:
+        conn = conns.get(key)
+        if conn is not None:
+            _last_node.set(conn.node)
+            return conn
+    return None
+
+
+@contextlib.contextmanager
+def read_connection(session: dict | None = None, shard: Shard | None = None):
+    """``get_read_connection()`` as a ``with`` block (``None`` if no node is reachable).
+
+    Opens a ``unit_of_work`` if none is active, so nested blocks reuse the connection.
+    """
+    with unit_of_work():
+        conns = _action_conns.get()
+        name = shard.name if shard is not None else ""
+        conn = _scoped_conn(conns, ("write", name), ("read", name))
+        if conn is None:
+            conn = get_read_connection(session, shard)
+            if conn is not None:
+                conns[("read", name)] = conn
+        yield conn
+
+
+@contextlib.contextmanager
+def write_connection(shard: Shard | None = None):
+    """``get_write_connection()`` as a ``with`` block (``None`` if no node is writable)."""
+    with unit_of_work():
+        conns = _action_conns.get()
+        name = shard.name if shard is not None else ""
+        conn = _scoped_conn(conns, ("write", name))
+        if conn is None:
+            conn = get_write_connection(shard)
+            if conn is not None:
+                conns[("write", name)] = conn
+        yield conn
+
+
+# ---------- scatter-gather / reference tables ----------
+
+_scatter_executor: ThreadPoolExecutor | None = None
+
+
+def _shard_unreachable(shard: Shard) -> mysql.connector.Error:
+    return mysql.connector.errors.OperationalError(msg=f"Không kết nối được {shard.name} ({shard.range_text()})")
+
+
+def scatter_read(session: dict | None, sql: str, params=(), dictionary: bool = False) -> list[list]:
+    """Run one SELECT on every shard in parallel; the row lists in shard (id-range) order.
+
+    Each shard is read with the usual routing (healthy replica, GTID
+    read-your-writes, PRIMARY fallback). Raises ``mysql.connector.Error`` if
+    any shard fails: a partial roster would silently miss students.
+    """
+    global _scatter_executor
+    shards = all_shards()
+    if _scatter_executor is None:
+        with _pools_lock:
+            if _scatter_executor is None:
+                _scatter_executor = ThreadPoolExecutor(
+                    max_workers=max(4, len(shards) * DB_POOL_SIZE), thread_name_prefix="shard-scatter"
+                )
+    # One context copy per task: workers see current_handler (slow log) without sharing state.
+    futures = [
+        _scatter_executor.submit(contextvars.copy_context().run, _read_shard, session, shard, sql, params, dictionary)
+        for shard in shards
+    ]
+    results = [future.result() for future in futures]
+    _last_node.set(tuple(node for node, _ in results))
+    return [rows for _, rows in results]
+
+
+def read_everywhere(session: dict | None, sql: str, params=()) -> list:
+    """All rows of one SELECT: from every shard (concatenated) or from the usual read node.
+
+    Raises ``mysql.connector.Error`` (also when no node is reachable).
+    """
+    if sharding_enabled():
+        return list(itertools.chain.from_iterable(scatter_read(session, sql, params)))
+    with read_connection(session) as conn:
+        if conn is None:
+            raise mysql.connector.errors.OperationalError(msg="Không kết nối được database local.")
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            return cur.fetchall() or []
+
+
+def _read_shard(session: dict | None, shard: Shard, sql: str, params, dictionary: bool):
+    conn = get_read_connection(session, shard)
+    if conn is None:
+        raise _shard_unreachable(shard)
+    try:
+        cur = conn.cursor(dictionary=dictionary)
+        cur.execute(sql, params)
+        rows = cur.fetchall() or []
+        cur.close()
+        return conn.node, rows
+    finally:
+        if conn.is_connected():
+            conn.close()
+
+
+def write_reference(session: dict | None, apply):
+    """Apply a change to a reference table (``subjects``) on every shard's PRIMARY.
+
+    ``apply(cur, first)`` runs the statement and returns a value; ``first`` is
+    what the first shard's call returned (None there), so an INSERT can reuse
+    the first shard's AUTO_INCREMENT id on the others. Across shards this is
+    an XA transaction: every shard prepares before any commits, so a failure
+    on one shard rolls all of them back. Not sharded: one plain transaction
+    on the PRIMARY. Returns the first shard's value; raises
+    ``mysql.connector.Error``.
+    """
+    shards = all_shards()
+    if not shards:
+        conn = get_write_connection()
+        if conn is None:
+            raise mysql.connector.errors.OperationalError(msg="Không kết nối được PRIMARY")
+        try:
+            cur = conn.cursor()
+            result = apply(cur, None)
+            cur.close()
+            conn.commit()
+            remember_write(session, conn)
+            return result
+        except mysql.connector.Error:
+            _rollback_quietly(conn)
+            raise
+        finally:
+            if conn.is_connected():
+                conn.close()
+
+    xid = f"ref-{uuid.uuid4().hex}"
+    conns = []
+    committed = 0
+    try:
+        for shard in shards:
+            conn = get_write_connection(shard)
+            if conn is None:
+                raise _shard_unreachable(shard)
+            conns.append((shard, conn))
+
+        first = None
+        for index, (_, conn) in enumerate(conns):
+            cur = conn.cursor()
+            try:
+                cur.execute("XA START %s", (xid,))
+                value = apply(cur, first)
+                cur.execute("XA END %s", (xid,))
+                cur.execute("XA PREPARE %s", (xid,))
+            finally:
+                cur.close()
+            if index == 0:
+                first = value
+
+        for _, conn in conns:
+            cur = conn.cursor()
+            cur.execute("XA COMMIT %s", (xid,))
+            cur.close()
+            committed += 1
+        for shard, conn in conns:
+            remember_write(session, conn, shard)
+        return first
+    except mysql.connector.Error as err:
+        if committed:
+            # Đã commit trên một số shard: giao dịch còn lại vẫn ở trạng thái PREPARED
+            # trên các shard kia (XA RECOVER / XA COMMIT để hoàn tất).
+            raise mysql.connector.errors.OperationalError(
+                msg=f"XA {xid} mới commit trên {committed}/{len(conns)} shard: {err}"
+            ) from err
+        for _, conn in conns:
+            _xa_abort(conn, xid)
+        raise
+    finally:
+        for _, conn in conns:
+            if conn.is_connected():
+                conn.close()
+
+
+def _xa_abort(conn, xid: str) -> None:
+    """Roll back ``xid`` on ``conn`` whatever state it reached (active, idle or prepared)."""
+    for sql in ("XA END %s", "XA ROLLBACK %s"):
+        try:
+            cur = conn.cursor()
+            cur.execute(sql, (xid,))
+            cur.close()
+        except mysql.connector.Error:
+            pass
+
+
+def _rollback_quietly(conn) -> None:
+    try:
+        conn.rollback()
+    except mysql.connector.Error:
+        pass
+
+
+def can_write() -> bool:
+    return current_primary() is not None
+
+
+def topology_state() -> dict:
+    topology = _get_topology()
+    if topology is None:
+        return {"primary": PRIMARY_HOST, "discovered": False, "nodes": {}}
+    return topology.snapshot()
+
+
+def pool_stats() -> dict:
+    """Pool metrics per node (checkouts, waits, wait time, broken connections, ...)."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        async_pools = list(_async_pools.values())
+    stats = {pool.name: pool.stats() for pool in pools}
+    stats.update({f"{pool.name} (async)": pool.stats() for pool in async_pools})
+    return stats
+
+
+def replication_lag() -> dict:
+    """Rolling lag estimate and health per replica (for monitoring)."""
+    lag = _get_lag_monitor().snapshot()
+    for shard in all_shards():
+        lag.update(_get_lag_monitor(shard).snapshot())
+    return lag
+
+
+def shard_state() -> dict:
+    """Id range, configured and current PRIMARY per shard ({} when not sharded)."""
+    return {
+        shard.name: {
+            "range": shard.range_text(),
+            "primary": current_primary(shard),
+            "configured_primary": shard.primary,
+            "replicas": list(shard.replicas),
+        }
+        for shard in all_shards()
+    }
+
+
+def _pool_metrics() -> list[str]:
+    """Pool / replication gauges for /metrics, read on each scrape."""
+    pools = pool_stats()
+    lines = [
+        "# HELP db_pool_connections Pooled connections by state.",
+        "# TYPE db_pool_connections gauge",
+    ]
+    for name, stats in pools.items():
+        for state in ("in_use", "idle", "total"):
+            lines.append(f'db_pool_connections{{pool="{name}",state="{state}"}} {stats[state]}')
+    lines += [
+        "# HELP db_pool_timeouts_total Checkouts that gave up waiting for a connection.",
+        "# TYPE db_pool_timeouts_total counter",
+    ]
+    lines += [f'db_pool_timeouts_total{{pool="{name}"}} {stats["timeouts"]}' for name, stats in pools.items()]
+    lines += [
+        "# HELP db_replica_lag_seconds Rolling replication lag estimate (-1 = unknown).",
+        "# TYPE db_replica_lag_seconds gauge",
+    ]
+    for node, info in replication_lag().items():
+        lag = info["lag_seconds"]
+        lines.append(f'db_replica_lag_seconds{{node="{node}"}} {-1 if lag is None else lag}')
+    lines += [
+        "# HELP db_circuit_state Circuit breaker state per node (0 closed, 1 half-open, 2 open).",
+        "# TYPE db_circuit_state gauge",
+    ]
+    codes = {"closed": 0, "half_open": 1, "open": 2}
+    lines += [f'db_circuit_state{{node="{node}"}} {codes[b["state"]]}' for node, b in breaker_states().items()]
+    return lines
+
+
+metrics.register_collector(_pool_metrics)
+
+if DB_SLOW_QUERY_MS > 0:
+    slow_query_log = SlowQueryLog(
+        DB_SLOW_QUERY_LOG,
+        threshold=DB_SLOW_QUERY_MS / 1000.0,
+        checkout=_checkout,
+        max_bytes=DB_SLOW_QUERY_LOG_MAX_BYTES,
+        backups=DB_SLOW_QUERY_LOG_BACKUPS,
+    )
+    metrics.register_query_observer(slow_query_log.observe)
+
+
+def breaker_states() -> dict:
+    """Circuit breaker state per node (closed / open / half_open, failures, next probe)."""
+    with _pools_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.snapshot() for breaker in breakers}
+
+
+def monitoring_snapshot() -> dict:
+    return {
+        "topology": topology_state(),
+        "pools": pool_stats(),
+        "replication": replication_lag(),
+        "breakers": breaker_states(),
+        "shards": shard_state(),
+    }
+
+
+def _topology_info() -> str:
+    replicas = ", ".join(f"`{node}`" for node in REPLICA_HOSTS) or "(không có, đọc từ PRIMARY)"
+    primary = current_primary()
+    primary = f"`{primary}`" if primary else "(không có, chỉ đọc)"
+    info = f"PRIMARY (ghi): {primary} · REPLICA (đọc): {replicas}"
+    if _shard_map:
+        shards = ", ".join(
+            f"{shard.name} ({shard.range_text()}): `{current_primary(shard) or '—'}`" for shard in all_shards()
+        )
+        info += f" · Shard: {shards}"
+    return info
 
 
 def _parse_date(date_str: str | None):
@@ -74,12 +923,63 @@ def _parse_date(date_str: str | None):
         return "__invalid__"
 
 
+def _node_kind(node: str, shard: Shard | None) -> str:
+    """PRIMARY / REPLICA as last probed; UNREACHABLE / UNKNOWN when the topology monitor has no answer."""
+    if node == current_primary(shard):
+        return "PRIMARY"
+    topology = _get_topology(shard)
+    if topology is None:
+        return "REPLICA"  # cấu hình tĩnh: mọi node khác PRIMARY_HOST là REPLICA
+    state = topology.snapshot()["nodes"].get(node)
+    if not state:
+        return "UNKNOWN"
+    if not state.get("reachable"):
+        return "UNREACHABLE"
+    return "REPLICA" if state.get("read_only") or state.get("super_read_only") else "UNKNOWN"
+
+
 def _node_info() -> str:
-    return f"ℹ️ Dữ liệu lấy từ LOCAL node ({ROLE.upper()})"
+    node = _last_node.get() or DB_HOST
+    if isinstance(node, tuple):
+        nodes = ", ".join(f"`{n}`" for n in node)
+        return f"ℹ️ Dữ liệu gộp từ {len(node)} shard: {nodes}" + _breaker_text()
+    shard = _shard_of_node(node)
+    lag = _lag_text(node)
+    kind = _node_kind(node, shard)
+    details = ", ".join(part for part in (shard.name if shard else "", lag) if part)
+    if node == DB_HOST:
+        details = f"{kind}, {details}" if details else kind
+        return f"ℹ️ Dữ liệu lấy từ LOCAL node ({details})" + _breaker_text()
+    return f"ℹ️ Dữ liệu lấy từ {kind} node `{node}`" + (f" ({details})" if details else "") + _breaker_text()
+
+
+def _breaker_text() -> str:
+    with _pools_lock:
+        down = [b for b in _breakers.values() if b.state != CLOSED]
+    if not down:
+        return ""
+    parts = []
+    for breaker in down:
+        if breaker.state == OPEN:
+            parts.append(f"`{breaker.name}` (thử lại sau {math.ceil(breaker.retry_in())}s)")
+        else:
+            parts.append(f"`{breaker.name}` (đang thử lại)")
+    return " · ⚡ Node mất kết nối: " + ", ".join(parts)
+
+
+def _lag_text(node: str) -> str:
+    shard = _shard_of_node(node)
+    replicas = shard.replicas if shard else REPLICA_HOSTS
+    if node == current_primary(shard) or node not in replicas:
+        return ""
+    lag = _get_lag_monitor(shard).lag(node)
+    if lag is None:
+        return "lag: không rõ"
+    return f"lag ~{lag:.1f}s"
 
 
 def _write_blocked_message() -> str:
-    return "❌ Node hiện tại là REPLICA (Read-Only). Không cho phép thao tác ghi."
+    return "❌ Hiện không có node PRIMARY ghi được (các node đều Read-Only). Không cho phép thao tác ghi."
 
 
 # ==========================================
@@ -87,37 +987,44 @@ def _write_blocked_message() -> str:
 # ==========================================
 
 
+_AUTH_SQL = "SELECT username, role, student_id FROM users WHERE username=%s AND password=%s"
+
+
+def _login_result(row):
+    if not row:
+        return None, "❌ Sai username/password."
+    session = {
+        "logged_in": True,
+        "username": row["username"],
+        "role": row["role"],
+        "student_id": row.get("student_id"),
+    }
+    return session, f"✅ Đăng nhập thành công ({row['role']})."
+
+
+@metrics.instrumented
 def authenticate(username: str, password: str):
+    """Check a login; the lookup is a prepared statement only with ``DB_PREPARED_STATEMENTS`` (off by default)."""
     if not username or not password:
         return None, "⚠️ Vui lòng nhập username và password."
 
-    conn = get_db_connection()
-    if conn is None:
-        return None, "❌ Không kết nối được database local."
+    if sharding_enabled():
+        # Tài khoản sinh viên nằm trên shard của sinh viên đó: hỏi mọi shard.
+        try:
+            parts = scatter_read(None, _AUTH_SQL, (username.strip(), password), dictionary=True)
+        except mysql.connector.Error as err:
+            return None, f"❌ Lỗi DB: {err}"
+        return _login_result(next((rows[0] for rows in parts if rows), None))
 
-    try:
-        cur = conn.cursor(dictionary=True)
-        cur.execute(
-            "SELECT username, role, student_id FROM users WHERE username=%s AND password=%s",
-            (username.strip(), password),
-        )
-        row = cur.fetchone()
-        if not row:
-            return None, "❌ Sai username/password."
-
-        session = {
-            "logged_in": True,
-            "username": row["username"],
-            "role": row["role"],
-            "student_id": row.get("student_id"),
-        }
-        return session, f"✅ Đăng nhập thành công ({row['role']})."
-    except mysql.connector.Error as err:
-        return None, f"❌ Lỗi DB: {err}"
-    finally:
-        if conn and conn.is_connected():
-            cur.close()
-            conn.close()
+    with read_connection() as conn:
+        if conn is None:
+            return None, "❌ Không kết nối được database local."
+        try:
+            with conn.prepared_cursor(_AUTH_SQL, dictionary=True) as cur:
+                cur.execute(_AUTH_SQL, (username.strip(), password))
+                return _login_result(cur.fetchone())
+        except mysql.connector.Error as err:
+            return None, f"❌ Lỗi DB: {err}"
 
 
 def _require_login(session: dict | None):
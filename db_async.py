@@ -0,0 +1,263 @@
+"""asyncio counterpart of the connection helpers in ``db``.
+
+Same routing rules (PRIMARY for writes, healthy replicas round-robin for
+reads, GTID read-your-writes) and the same config, but connections come from
+``AsyncConnectionPool`` and every database call is awaited, so Gradio can
+run these handlers on its event loop instead of one worker thread each.
+The sync API in ``db`` stays as it is (CLI tools, background threads).
+"""
+
+import asyncio
+import contextlib
+import contextvars
+
+import mysql.connector
+
+import db
+from db import (
+    DB_GTID_WAIT_TIMEOUT,
+    DB_HOST,
+    DB_POOL_IDLE_TIMEOUT,
+    DB_POOL_MAX_OVERFLOW,
+    DB_POOL_PRE_PING,
+    DB_POOL_RESET_SESSION,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_PREPARED_STATEMENTS,
+    _AUTH_SQL,
+    _connect_kwargs,
+    _login_result,
+    _read_candidates,
+    _read_fallbacks,
+    _rediscover_primary,
+    _session_gtid,
+    _shard_unreachable,
+    _store_gtid,
+    all_shards,
+    current_primary,
+    sharding_enabled,
+)
+from metrics import instrumented
+from pool import AsyncConnectionPool
+
+
+def _get_pool(node: str) -> AsyncConnectionPool:
+    pool = db._async_pools.get(node)
+    if pool is None:
+        with db._pools_lock:
+            pool = db._async_pools.get(node)
+            if pool is None:
+                pool = AsyncConnectionPool(
+                    name=node,
+                    connect_kwargs=_connect_kwargs(node),
+                    size=DB_POOL_SIZE,
+                    max_overflow=DB_POOL_MAX_OVERFLOW,
+                    timeout=DB_POOL_TIMEOUT,
+                    idle_timeout=DB_POOL_IDLE_TIMEOUT,
+                    pre_ping=DB_POOL_PRE_PING,
+                    reset_on_return=DB_POOL_RESET_SESSION,
+                    prepared=DB_PREPARED_STATEMENTS,
+                )
+                db._async_pools[node] = pool
+    return pool
+
+
+async def _checkout(node: str):
+    breaker = db._get_breaker(node)
+    if not breaker.allow():
+        return None
+    try:
+        conn = await _get_pool(node).acquire()
+    except mysql.connector.Error as err:
+        db._checkout_failed(breaker, err)
+        return None
+    breaker.record_success()
+    db._last_node.set(node)
+    return conn
+
+
+async def get_db_connection():
+    return await _checkout(DB_HOST)
+
+
+async def get_read_connection(session: dict | None = None, shard=None):
+    """Async ``db.get_read_connection``."""
+    gtid_set = _session_gtid(session, shard)
+    primary = current_primary(shard)
+    for node in _read_candidates(shard):
+        conn = await _checkout(node)
+        if conn is None:
+            continue
+        if gtid_set and node != primary and not await _wait_for_gtid(conn, gtid_set):
+            await conn.close()
+            break
+        return conn
+    for node in _read_fallbacks(shard):
+        conn = await _checkout(node)
+        if conn is not None:
+            return conn
+    return None
+
+
+async def get_write_connection(shard=None):
+    primary = current_primary(shard)
+    if not primary:
+        return None
+    conn = await _checkout(primary)
+    if conn is None:
+        # Topology probes use the sync pools: keep them off the event loop.
+        promoted = await asyncio.to_thread(_rediscover_primary, primary, shard)
+        if promoted:
+            conn = await _checkout(promoted)
+    return conn
+
+
+async def remember_write(session: dict | None, conn, shard=None) -> None:
+    """Async ``db.remember_write``."""
+    if session is None:
+        return
+    try:
+        cur = await conn.cursor()
+        await cur.execute("SELECT @@GLOBAL.gtid_executed")
+        row = await cur.fetchone()
+        await cur.close()
+    except mysql.connector.Error:
+        return
+    if row and row[0]:
+        _store_gtid(session, shard, row[0])
+
+
+async def _wait_for_gtid(conn, gtid_set: str) -> bool:
+    try:
+        cur = await conn.cursor()
+        await cur.execute(
+            "SELECT WAIT_FOR_EXECUTED_GTID_SET(%s, %s)",
+            (gtid_set, DB_GTID_WAIT_TIMEOUT),
+        )
+        row = await cur.fetchone()
+        await cur.close()
+    except mysql.connector.Error:
+        return False
+    return bool(row) and row[0] == 0
+
+
+# Kết nối async đã lấy trong thao tác hiện tại (xem db.unit_of_work).
+_action_conns: contextvars.ContextVar[dict | None] = contextvars.ContextVar("async_action_conns", default=None)
+
+
+@contextlib.asynccontextmanager
+async def unit_of_work():
+    """Async ``db.unit_of_work`` (``async with`` or ``@unit_of_work()`` on an ``async def``).
+
+    Tasks spawned inside (``asyncio.gather``) must not use the scope: the
+    scatter helpers check out their own connections.
+    """
+    if _action_conns.get() is not None:
+        yield
+        return
+    conns: dict = {}
+    token = _action_conns.set(conns)
+    try:
+        yield
+    finally:
+        _action_conns.reset(token)
+        for conn in conns.values():
+            await conn.close()
+
+
+@contextlib.asynccontextmanager
+async def read_connection(session: dict | None = None, shard=None):
+    """Async ``db.read_connection``."""
+    async with unit_of_work():
+        conns = _action_conns.get()
+        name = shard.name if shard is not None else ""
+        conn = db._scoped_conn(conns, ("write", name), ("read", name))
+        if conn is None:
+            conn = await get_read_connection(session, shard)
+            if conn is not None:
+                conns[("read", name)] = conn
+        yield conn
+
+
+@contextlib.asynccontextmanager
+async def write_connection(shard=None):
+    """Async ``db.write_connection``."""
+    async with unit_of_work():
+        conns = _action_conns.get()
+        name = shard.name if shard is not None else ""
+        conn = db._scoped_conn(conns, ("write", name))
+        if conn is None:
+            conn = await get_write_connection(shard)
+            if conn is not None:
+                conns[("write", name)] = conn
+        yield conn
+
+
+async def fetch(conn, sql: str, params=(), dictionary: bool = False, one: bool = False, prepared: bool = False):
+    """Run one SELECT on ``conn``; all rows (or the first row if ``one``).
+
+    ``prepared`` runs it as a per-connection prepared statement (``sql`` must be a module constant)
+    when the pool keeps them (``DB_PREPARED_STATEMENTS``); otherwise it is a plain text query.
+    """
+    if prepared:
+        cur = await conn.prepared_cursor(sql, dictionary)
+    else:
+        cur = await conn.cursor(dictionary=dictionary)
+    try:
+        await cur.execute(sql, params)
+        rows = await cur.fetchall()
+    finally:
+        await cur.close()
+    if one:
+        return rows[0] if rows else None
+    return rows
+
+
+async def scatter_fetch(session: dict | None, sql: str, params=(), dictionary: bool = False) -> list[list]:
+    """Async ``db.scatter_read``: the shards are queried concurrently on the event loop."""
+    results = await asyncio.gather(*(_fetch_shard(session, shard, sql, params, dictionary) for shard in all_shards()))
+    db._last_node.set(tuple(node for node, _ in results))
+    return [rows for _, rows in results]
+
+
+async def fetch_everywhere(session: dict | None, sql: str, params=()) -> list:
+    """Async ``db.read_everywhere``."""
+    if sharding_enabled():
+        return [row for rows in await scatter_fetch(session, sql, params) for row in rows]
+    async with read_connection(session) as conn:
+        if conn is None:
+            raise mysql.connector.errors.OperationalError(msg="Không kết nối được database local.")
+        return await fetch(conn, sql, params)
+
+
+async def _fetch_shard(session: dict | None, shard, sql: str, params, dictionary: bool):
+    conn = await get_read_connection(session, shard)
+    if conn is None:
+        raise _shard_unreachable(shard)
+    try:
+        return conn.node, await fetch(conn, sql, params, dictionary=dictionary)
+    finally:
+        if await conn.is_connected():
+            await conn.close()
+
+
+@instrumented
+async def authenticate(username: str, password: str):
+    if not username or not password:
+        return None, "⚠️ Vui lòng nhập username và password."
+
+    if sharding_enabled():
+        try:
+            parts = await scatter_fetch(None, _AUTH_SQL, (username.strip(), password), dictionary=True)
+        except mysql.connector.Error as err:
+            return None, f"❌ Lỗi DB: {err}"
+        return _login_result(next((rows[0] for rows in parts if rows), None))
+
+    async with read_connection() as conn:
+        if conn is None:
+            return None, "❌ Không kết nối được database local."
+        try:
+            row = await fetch(conn, _AUTH_SQL, (username.strip(), password), dictionary=True, one=True, prepared=True)
+        except mysql.connector.Error as err:
+            return None, f"❌ Lỗi DB: {err}"
+    return _login_result(row)
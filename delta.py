@@ -0,0 +1,163 @@
+"""Delta refresh: rows changed since a client's mark, plus tombstones for deletes.
+
+``students``, ``subjects`` and ``scores`` carry ``updated_at`` (TIMESTAMP(6),
+set by MySQL on insert and on every update that changes the row). Deletes
+are recorded by the application in ``deleted_rows`` in the same transaction
+(``record_deletes``): FK cascades fire no triggers, and every delete path
+goes through the app. Scores are only ever removed by cascade, so the
+tombstone of their student / subject covers them.
+
+A delta query returns changed rows and tombstones in one round trip; the
+caller merges them into what it already shows, so a post-write refresh
+costs the size of the change instead of the size of the table.
+
+- A *mark* is the newest ``updated_at`` / ``deleted_at`` seen (database time,
+  never compared with the app clock). Queries look back
+  ``DELTA_OVERLAP_SECONDS`` behind it so a transaction that stamped its rows
+  before the mark but committed after it (or a shard whose clock is slightly
+  behind) is still picked up; merging is idempotent.
+- A transaction that commits more than the overlap after stamping its rows
+  (a long write, a lagging replica) is missed by the delta, so a view is
+  reloaded in full at least every ``DELTA_FULL_RELOAD_SECONDS`` as a
+  backstop (``full_at`` in the delta state).
+- Tombstones are purged after ``DELTA_TOMBSTONE_RETENTION`` seconds, so a
+  client that has not synced for that long reloads in full (``mark_usable``).
+
+Delta rows are ``(is_deleted, key, *payload, stamp)``.
+"""
+
+import time
+from datetime import datetime, timedelta
+
+from db import DELTA_FULL_RELOAD_SECONDS, DELTA_OVERLAP_SECONDS, DELTA_TOMBSTONE_RETENTION
+
+# Mốc khi bảng còn trống (TIMESTAMP nhỏ nhất hợp lệ là 1970-01-01 00:00:01 UTC).
+_EPOCH = datetime(1970, 1, 2)
+# Số tombstone hết hạn dọn mỗi lần ghi (giới hạn thời gian giữ lock của transaction xoá).
+_PURGE_LIMIT = 1000
+
+_TOMBSTONES = "SELECT 1, CAST(row_key AS SIGNED), {nulls}, deleted_at FROM deleted_rows WHERE table_name = '{table}' AND deleted_at > %s"
+
+MARK_SQL = (
+    "SELECT (SELECT MAX(updated_at) FROM {table}), "
+    "(SELECT MAX(deleted_at) FROM deleted_rows WHERE table_name = '{table}')"
+)
+
+# Danh sách sinh viên: dòng đổi + có còn khớp bộ lọc đang hiển thị không (so sánh bằng collation của MySQL).
+STUDENTS_DELTA_SQL = (
+    "SELECT 0, id, full_name, class_name, email, date_of_birth, address, "
+    "(%s = '' OR class_name = %s) AND full_name LIKE %s, updated_at "
+    "FROM students WHERE updated_at > %s "
+    "UNION ALL " + _TOMBSTONES.format(nulls="NULL, NULL, NULL, NULL, NULL, 0", table="students")
+)
+
+SUBJECTS_DELTA_SQL = (
+    "SELECT 0, id, subject_code, subject_name, credits, updated_at FROM subjects WHERE updated_at > %s "
+    "UNION ALL " + _TOMBSTONES.format(nulls="NULL, NULL, NULL", table="subjects")
+)
+
+# Lưới điểm của một sinh viên: dòng (môn LEFT JOIN điểm) của các môn đổi hoặc có điểm đổi.
+SCORES_GRID_DELTA_SQL = (
+    "SELECT 0, s.id, s.subject_code, s.subject_name, s.credits, sc.score, "
+    "GREATEST(s.updated_at, COALESCE(sc.updated_at, s.updated_at)) "
+    "FROM subjects s "
+    "LEFT JOIN scores sc ON sc.subject_id = s.id AND sc.student_id = %s "
+    "WHERE s.updated_at > %s "
+    "OR s.id IN (SELECT subject_id FROM scores WHERE student_id = %s AND updated_at > %s) "
+    "UNION ALL " + _TOMBSTONES.format(nulls="NULL, NULL, NULL, NULL", table="subjects")
+)
+
+
+def record_deletes(cur, table: str, keys) -> None:
+    """Tombstones for ``keys`` of ``table`` (caller's transaction) + purge of expired ones."""
+    keys = [str(key) for key in keys]
+    if not keys:
+        return
+    cur.execute(
+        "INSERT INTO deleted_rows (table_name, row_key) VALUES " + ",".join(["(%s, %s)"] * len(keys)),
+        [value for key in keys for value in (table, key)],
+    )
+    cur.execute(
+        "DELETE FROM deleted_rows WHERE deleted_at < NOW(6) - INTERVAL %s SECOND LIMIT %s",
+        (DELTA_TOMBSTONE_RETENTION, _PURGE_LIMIT),
+    )
+
+
+def mark_from(rows) -> dict:
+    """Delta state from ``MARK_SQL`` rows (one per shard) taken with a full load: the newest stamp anywhere."""
+    stamps = [stamp for row in rows for stamp in row if stamp is not None]
+    now = time.time()
+    return {"mark": max(stamps, default=_EPOCH), "synced_at": now, "full_at": now}
+
+
+def mark_usable(state: dict | None) -> bool:
+    """A delta can be applied: synced within the tombstone retention, fully loaded within the backstop period."""
+    if not state or state.get("mark") is None or state.get("full_at") is None:
+        return False
+    now = time.time()
+    if DELTA_FULL_RELOAD_SECONDS > 0 and now - state["full_at"] >= DELTA_FULL_RELOAD_SECONDS:
+        return False
+    return now - state["synced_at"] < DELTA_TOMBSTONE_RETENTION
+
+
+def since(state: dict) -> datetime:
+    return state["mark"] - timedelta(seconds=DELTA_OVERLAP_SECONDS)
+
+
+def split_delta(rows, state: dict) -> tuple[dict, set, dict]:
+    """({key: payload} of changed rows, {deleted keys}, advanced delta state)."""
+    changed, deleted = {}, set()
+    newest = state["mark"]
+    for is_deleted, key, *payload, stamp in rows:
+        if is_deleted:
+            deleted.add(key)
+        else:
+            changed[key] = payload
+        newest = max(newest, stamp)
+    return changed, deleted, {"mark": newest, "synced_at": time.time(), "full_at": state["full_at"]}
+
+
+def students_delta_params(page: dict, state: dict) -> tuple:
+    class_filter = page.get("class_filter", "")
+    pattern = f"%{page.get('name_filter', '')}%"
+    mark = since(state)
+    return (class_filter, class_filter, pattern, mark, mark)
+
+
+def merge_students_page(page: dict, changed: dict, deleted: set, page_size: int) -> list | None:
+    """The shown page with the delta applied (rows sorted by id); None if it must be reloaded.
+
+    A changed row stays / appears when it still matches the page's filters and
+    falls in the page's id range (or after it, on the last page); otherwise it
+    leaves the page.
+    """
+    first, last = page.get("first_id"), page.get("last_id")
+    if first is None or page.get("rows") is None:
+        return None
+    by_id = {row[0]: row for row in page["rows"]}
+    for student_id, (*fields, matches) in changed.items():
+        in_range = student_id >= first and (student_id <= last or not page.get("has_next"))
+        if matches and in_range:
+            by_id[student_id] = [student_id, *fields]
+        else:
+            by_id.pop(student_id, None)
+    for student_id in deleted:
+        by_id.pop(student_id, None)
+    if not by_id or len(by_id) > page_size:
+        return None
+    return [by_id[student_id] for student_id in sorted(by_id)]
+
+
+def merge_rows_by_id(rows, changed: dict, deleted: set) -> list[tuple]:
+    """``rows`` (``(id, *fields)``, e.g. catalog or scores grid) with a delta applied, sorted by id."""
+    by_id = {row[0]: row for row in rows}
+    for key, fields in changed.items():
+        by_id[key] = (key, *fields)
+    for key in deleted:
+        by_id.pop(key, None)
+    return [by_id[key] for key in sorted(by_id)]
+
+
+def scores_grid_delta_params(student_id: int, state: dict) -> tuple:
+    mark = since(state)
+    return (student_id, mark, student_id, mark, mark)
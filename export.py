@@ -0,0 +1,175 @@
+"""Streaming export of students / subjects / scores to CSV or Parquet.
+
+Rows come from an unbuffered cursor (the server streams the result set, the
+client only holds ``EXPORT_FETCH_SIZE`` rows at a time) through generators
+into the output file, so memory stays bounded whatever the table size.
+Parquet output needs the optional ``pyarrow`` package.
+"""
+
+import csv
+import itertools
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from catalog import subject_catalog
+from db import EXPORT_FETCH_SIZE, all_shards, get_read_connection, reference_shard
+
+DATASETS = {
+    "students": "Danh sách sinh viên",
+    "subjects": "Danh mục môn học",
+    "scores": "Ma trận điểm (sinh viên × môn)",
+}
+FORMATS = ("csv", "parquet")
+
+# (column, type) — the type is only used for the Parquet schema.
+_STUDENT_COLUMNS = [
+    ("id", "int"),
+    ("full_name", "str"),
+    ("class_name", "str"),
+    ("email", "str"),
+    ("date_of_birth", "date"),
+    ("address", "str"),
+]
+_SUBJECT_COLUMNS = [("id", "int"), ("subject_code", "str"), ("subject_name", "str"), ("credits", "int")]
+
+
+def stream_rows(sql: str, params=(), session: dict | None = None, fetch_size: int = EXPORT_FETCH_SIZE, shard=None):
+    """Yield rows of ``sql`` from an unbuffered cursor, ``fetch_size`` rows per network read."""
+    conn = get_read_connection(session, shard)
+    if conn is None:
+        raise RuntimeError("Không kết nối được database.")
+    cur = None
+    try:
+        cur = conn.cursor(buffered=False)
+        cur.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(fetch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        # Closing early (consumer stopped) leaves unread rows; the pool consumes them.
+        if cur is not None:
+            try:
+                cur.close()
+            except Exception:
+                pass
+        if conn.is_connected():
+            conn.close()
+
+
+def stream_sharded_rows(sql: str, params=(), session: dict | None = None):
+    """``stream_rows`` over every shard in id-range order (one shard open at a time).
+
+    Shards own consecutive id ranges, so ``ORDER BY id`` per shard is also
+    the global order. Not sharded: the plain ``stream_rows``.
+    """
+    shards = all_shards() or [None]
+    return itertools.chain.from_iterable(stream_rows(sql, params, session, shard=shard) for shard in shards)
+
+
+def dataset_rows(dataset: str, session: dict | None = None):
+    """Return ([(column, type), ...], row generator) for one of ``DATASETS``."""
+    if dataset == "students":
+        sql = f"SELECT {', '.join(name for name, _ in _STUDENT_COLUMNS)} FROM students ORDER BY id"
+        return list(_STUDENT_COLUMNS), stream_sharded_rows(sql, session=session)
+    if dataset == "subjects":
+        sql = f"SELECT {', '.join(name for name, _ in _SUBJECT_COLUMNS)} FROM subjects ORDER BY id"
+        return list(_SUBJECT_COLUMNS), stream_rows(sql, session=session, shard=reference_shard())
+    if dataset == "scores":
+        return _score_matrix(session)
+    raise ValueError(f"Unknown dataset: {dataset}")
+
+
+def _score_matrix(session: dict | None):
+    """Wide students × subjects matrix, one output row per student.
+
+    The join is read in student-id order (PK order on both tables, no
+    filesort), so each student's scores arrive together and can be folded
+    into a row without keeping anything else in memory.
+    """
+    snap = subject_catalog.snapshot(session)
+    if snap is None:
+        raise RuntimeError("Không kết nối được database.")
+    column_of = {subject_id: i for i, (subject_id, *_rest) in enumerate(snap.rows)}
+    header = [("student_id", "int"), ("full_name", "str"), ("class_name", "str")]
+    header += [(code, "float") for _, code, _, _ in snap.rows]
+
+    sql = (
+        "SELECT st.id, st.full_name, st.class_name, sc.subject_id, sc.score "
+        "FROM students st "
+        "LEFT JOIN scores sc ON sc.student_id = st.id "
+        "ORDER BY st.id"
+    )
+
+    def rows():
+        current, scores = None, None
+        for student_id, full_name, class_name, subject_id, score in stream_sharded_rows(sql, session=session):
+            if current is None or current[0] != student_id:
+                if current is not None:
+                    yield current + scores
+                current = [student_id, full_name, class_name]
+                scores = [None] * len(column_of)
+            if subject_id in column_of:
+                scores[column_of[subject_id]] = None if score is None else float(score)
+        if current is not None:
+            yield current + scores
+
+    return header, rows()
+
+
+def write_csv(path: str, header, rows) -> int:
+    count = 0
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow([name for name, _ in header])
+        for row in rows:
+            writer.writerow(["" if v is None else v for v in row])
+            count += 1
+    return count
+
+
+def write_parquet(path: str, header, rows, batch_rows: int = EXPORT_FETCH_SIZE * 10) -> int:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise RuntimeError("Cần cài pyarrow để xuất Parquet (pip install pyarrow).") from exc
+
+    types = {"int": pa.int64(), "float": pa.float64(), "str": pa.string(), "date": pa.date32()}
+    schema = pa.schema([pa.field(name, types[kind]) for name, kind in header])
+    count = 0
+    batch = []
+
+    def flush(writer):
+        columns = list(zip(*batch)) if batch else [[] for _ in header]
+        arrays = [pa.array(col, type=field.type) for col, field in zip(columns, schema)]
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        batch.clear()
+
+    with pq.ParquetWriter(path, schema) as writer:
+        for row in rows:
+            batch.append(row)
+            count += 1
+            if len(batch) >= batch_rows:
+                flush(writer)
+        if batch or count == 0:
+            flush(writer)
+    return count
+
+
+def export_dataset(dataset: str, fmt: str = "csv", session: dict | None = None, out_dir: str | None = None):
+    """Export ``dataset`` to a new file; returns (path, row_count, seconds)."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format: {fmt}")
+    started = time.perf_counter()
+    out_dir = out_dir or tempfile.mkdtemp(prefix="export_")
+    path = os.path.join(out_dir, f"{dataset}_{datetime.now():%Y%m%d_%H%M%S}.{fmt}")
+    header, rows = dataset_rows(dataset, session)
+    try:
+        count = write_csv(path, header, rows) if fmt == "csv" else write_parquet(path, header, rows)
+    finally:
+        rows.close()
+    return path, count, time.perf_counter() - started
@@ -0,0 +1,87 @@
+"""Group commit: coalesce small writes that arrive close together into one transaction.
+
+Callers ``submit(key, item)`` and wait on the returned future. A daemon
+thread takes the first pending item, keeps collecting for ``window`` seconds
+(or until ``max_batch`` items), then calls ``flush(key, items)`` once per key
+(e.g. per shard). ``flush`` returns one result per item: a value, or an
+exception instance for an item that failed, so every caller still gets its
+own outcome. Items queued while a flush runs form the next batch, so under
+load batches grow by themselves.
+
+Async callers wrap the future with ``asyncio.wrap_future``.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import metrics
+
+BATCH_ROWS = metrics.Histogram(
+    "db_group_commit_batch_rows",
+    "Items written per group-commit flush.",
+    ["queue"],
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+metrics.register_collector(BATCH_ROWS.render)
+
+
+class GroupCommitQueue:
+    def __init__(self, name: str, flush, window: float, max_batch: int = 100):
+        self.name = name
+        self.window = max(0.0, float(window))
+        self.max_batch = max(1, int(max_batch))
+        self._flush = flush
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, key, item) -> Future:
+        """Queue ``item`` for the next flush of ``key``; the future resolves to its result."""
+        future = Future()
+        self._start()
+        self._queue.put((key, item, future))
+        return future
+
+    def _start(self) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=f"group-commit-{self.name}", daemon=True)
+                    self._thread.start()
+
+    def _run(self) -> None:
+        # Statements of a flush show up in the slow query log under this name.
+        metrics.current_handler.set(f"{self.name} (group commit)")
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            groups: dict = {}
+            for key, item, future in batch:
+                groups.setdefault(key, []).append((item, future))
+            for key, entries in groups.items():
+                self._flush_group(key, entries)
+
+    def _flush_group(self, key, entries) -> None:
+        BATCH_ROWS.observe(len(entries), self.name)
+        try:
+            results = list(self._flush(key, [item for item, _ in entries]))
+        except Exception as err:  # never leave a caller waiting forever
+            results = [err] * len(entries)
+        if len(results) != len(entries):
+            results = [RuntimeError(f"{self.name}: flush trả về {len(results)} kết quả cho {len(entries)} mục")] * len(entries)
+        for (_, future), result in zip(entries, results):
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
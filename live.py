@@ -0,0 +1,106 @@
+"""Live updates for open sessions: changes on the bus are pushed instead of polled.
+
+``live_changes`` is a per-session async generator (started by the "live"
+button, stopped by cancelling its event): it waits on a ``changes.Listener``,
+collects notifications for ``LIVE_DEBOUNCE`` seconds and emits one event
+(JSON ``{"seq": n, table: [keys] or null}``) into a hidden textbox. Each view
+listens to that textbox through ``live_handler``, which re-runs its existing
+(delta) refresh handler only when the event touches what the view shows.
+
+Changes made through this process are always seen; changes made on other
+nodes arrive when ``DB_CDC`` is on (see ``cdc``).
+"""
+
+import asyncio
+import inspect
+import json
+import time
+
+import gradio as gr
+
+import changes
+from db import DB_CDC, LIVE_DEBOUNCE, _require_login
+
+TOPICS = ("students", "subjects", "scores")
+
+
+def _encode(batch: dict, seq: int) -> str:
+    event = {"seq": seq}
+    for topic, keys in batch.items():
+        event[topic] = None if keys is None else sorted(list(key) if isinstance(key, tuple) else key for key in keys)
+    return json.dumps(event)
+
+
+def _status(updates: int) -> str:
+    source = "binlog (mọi node)" if DB_CDC else "node này"
+    stamp = time.strftime("%H:%M:%S")
+    return f"🔴 Đang cập nhật trực tiếp · nguồn: {source} · {updates} lần cập nhật · lần cuối {stamp}"
+
+
+async def live_changes(session: dict | None):
+    """Yield ``(status, event_json)`` for every debounced batch of changes, until cancelled."""
+    ok, msg = _require_login(session)
+    if not ok:
+        yield msg, gr.update()
+        return
+    seq = 0
+    with changes.Listener(TOPICS) as listener:
+        yield _status(seq), gr.update()
+        while True:
+            batch = await listener.next_batch(LIVE_DEBOUNCE)
+            seq += 1
+            yield _status(seq), _encode(batch, seq)
+
+
+def live_stopped():
+    return "⚪ Đã tắt cập nhật trực tiếp."
+
+
+def live_handler(handler, n_outputs: int, relevant, extra: int = 0):
+    """Wrap a refresh handler: run it only when ``relevant(event, *inputs)``, else leave its outputs as they are.
+
+    The last ``extra`` inputs are only passed to ``relevant`` (e.g. an edit-mode checkbox).
+    """
+
+    async def run(event_json, *inputs):
+        try:
+            event = json.loads(event_json) if event_json else None
+        except ValueError:
+            event = None
+        if not event or not relevant(event, *inputs):
+            return tuple(gr.update() for _ in range(n_outputs))
+        args = inputs[: len(inputs) - extra]
+        if inspect.iscoroutinefunction(handler):
+            return await handler(*args)
+        return await asyncio.to_thread(handler, *args)
+
+    return run
+
+
+def students_changed(event: dict, *_) -> bool:
+    return "students" in event
+
+
+def subjects_changed(event: dict, *_) -> bool:
+    return "subjects" in event
+
+
+def _touches_student(event: dict, student_id) -> bool:
+    """Scores of ``student_id`` changed (a subject change renames / drops rows of every grid)."""
+    if not student_id:
+        return False
+    if "subjects" in event:
+        return True
+    if "scores" not in event:
+        return False
+    keys = event["scores"]
+    return keys is None or any(key[0] == int(student_id) for key in keys)
+
+
+def grid_changed(event: dict, session, snapshot, current_msg, editing=False) -> bool:
+    """The shown grid is affected (and not being edited: a reload would drop unsaved cells)."""
+    return not editing and _touches_student(event, (snapshot or {}).get("student_id"))
+
+
+def my_scores_changed(event: dict, session, *_) -> bool:
+    return _touches_student(event, (session or {}).get("student_id"))
@@ -1,23 +1,77 @@
 import gradio as gr
-from db import ROLE, authenticate
+
+import cdc
+import metrics
+from db import (
+    BULK_IMPORT_BATCH_SIZE,
+    DB_ASYNC_HANDLERS,
+    DB_CDC,
+    DB_TOPOLOGY_INTERVAL,
+    METRICS_HOST,
+    METRICS_PORT,
+    ROLE,
+    _topology_info,
+    authenticate,
+    can_write,
+    monitoring_snapshot,
+)
+from analytics import BANDS_HEADERS, DISTRIBUTION_HEADERS, STATS_HEADERS
+from export import DATASETS as EXPORT_DATASETS
+from live import (
+    grid_changed,
+    live_changes,
+    live_handler,
+    live_stopped,
+    my_scores_changed,
+    students_changed,
+    subjects_changed,
+)
 from student import student_load_profile, student_scores_table, student_update_profile
 from teacher import (
     get_student_detail,
+    list_students_next_page,
+    list_students_prev_page,
+    list_students_refresh,
     list_students_table,
+    teacher_analytics_subject_choices,
+    teacher_bulk_import_students,
+    teacher_class_matrix,
     teacher_create_student,
     teacher_create_subject,
     teacher_delete_student,
     teacher_delete_subject,
-    teacher_get_scores_table,
+    teacher_export_data,
     teacher_get_subject_detail,
     teacher_list_subject_choices,
+    teacher_load_scores_grid,
     teacher_refresh_subjects_ui,
+    teacher_refresh_scores_grid_keep_msg,
     teacher_refresh_subjects_ui_keep_msg,
+    teacher_reload_scores_grid_keep_msg,
+    teacher_save_scores_grid,
+    teacher_subject_analytics,
     teacher_update_student,
     teacher_update_subject,
     teacher_upsert_score,
 )
 
+if DB_ASYNC_HANDLERS:
+    # Same names and return shapes, awaited on Gradio's event loop.
+    from db_async import authenticate as authenticate_async
+    from student_async import student_load_profile, student_scores_table
+    from teacher_async import (
+        get_student_detail,
+        list_students_next_page,
+        list_students_prev_page,
+        list_students_refresh,
+        list_students_table,
+        teacher_get_subject_detail,
+        teacher_load_scores_grid,
+        teacher_refresh_scores_grid_keep_msg,
+        teacher_reload_scores_grid_keep_msg,
+        teacher_upsert_score,
+    )
+
 
 # ==========================================
 # 3. GRADIO UI (Login + Teacher/Student)
@@ -50,15 +104,38 @@ def _login_ui_updates(session: dict | None, login_message: str):
     )
 
 
-def do_login(username, password):
-    session, msg = authenticate(username, password)
-    return _login_ui_updates(session, msg)
+if DB_ASYNC_HANDLERS:
+
+    async def do_login(username, password):
+        session, msg = await authenticate_async(username, password)
+        return _login_ui_updates(session, msg)
+
+else:
+
+    def do_login(username, password):
+        # Handler sync: Gradio chạy trong threadpool, không chặn event loop của các phiên khác.
+        session, msg = authenticate(username, password)
+        return _login_ui_updates(session, msg)
 
 
 def do_logout():
     return _login_ui_updates(None, "✅ Đã đăng xuất.")
 
 
+def _write_gating_updates(n_controls: int):
+    """Timer callback: topology line + write buttons enabled only while a PRIMARY is writable."""
+
+    def refresh():
+        writable = can_write()
+        return [gr.update(value=_topology_info())] + [gr.update(interactive=writable)] * n_controls
+
+    return refresh
+
+
+def _toggle_scores_edit(enabled: bool):
+    return gr.update(interactive=bool(enabled))
+
+
 CUSTOM_CSS = """
 /* --- Spacing between major Teacher features --- */
 
@@ -126,8 +203,9 @@ CUSTOM_CSS = """
 with gr.Blocks(title="Distributed Database Final Project", fill_height=True) as demo:
     gr.Markdown("# Distributed Database Final Project – MySQL Replication Demo")
     gr.Markdown(f"### Current Node Role: **{ROLE.upper()}**")
-    if ROLE == "replica":
-        gr.Warning("Node đang chạy ở chế độ REPLICA (Read-Only): các thao tác ghi sẽ bị chặn.")
+    topology_md = gr.Markdown(_topology_info())
+    if not can_write():
+        gr.Warning("Không có node PRIMARY ghi được (Read-Only): các thao tác ghi sẽ bị chặn.")
 
     with gr.Accordion("System Overview", open=False):
         gr.Markdown(
@@ -138,6 +216,8 @@ with gr.Blocks(title="Distributed Database Final Project", fill_height=True) as
         - **Location Transparency:** Users interact with their local node without worrying about the underlying replication sync.
         """
         )
+        btn_monitoring = gr.Button("🔄 Pool & replication metrics", variant="secondary")
+        monitoring_json = gr.JSON(label="Connection pools / replication lag")
 
     session_state = gr.State({"logged_in": False})
 
@@ -159,11 +239,19 @@ with gr.Blocks(title="Distributed Database Final Project", fill_height=True) as
             teacher_group = gr.Group(visible=False, elem_id="teacher_root")
             with teacher_group:
                 gr.Markdown("### Teacher Dashboard")
+                with gr.Row():
+                    btn_teacher_live = gr.Button("🔴 Bật cập nhật trực tiếp", size="sm")
+                    btn_teacher_live_stop = gr.Button("⚪ Tắt", size="sm")
+                    teacher_live_status = gr.Markdown()
+                teacher_live_event = gr.Textbox(visible=False)
 
                 # --- Major section 1: Student management ---
                 with gr.Group(elem_classes=["teacher-major-section"]):
                     with gr.Row():
                         with gr.Column(scale=2):
+                            with gr.Row():
+                                students_class_filter = gr.Textbox(label="Lọc theo lớp", placeholder="VD: CS101")
+                                students_name_filter = gr.Textbox(label="Lọc theo họ tên", placeholder="VD: Nguyễn")
                             btn_refresh_students = gr.Button("🔄 Tải danh sách sinh viên", variant="secondary")
                             students_table = gr.Dataframe(
                                 headers=["ID", "Họ tên", "Lớp", "Email", "Ngày sinh", "Địa chỉ"],
@@ -172,6 +260,11 @@ with gr.Blocks(title="Distributed Database Final Project", fill_height=True) as
                                 wrap=True,
                                 max_height=360,
                             )
+                            with gr.Row():
+                                btn_students_prev = gr.Button("◀ Trang trước", size="sm")
+                                btn_students_next = gr.Button("Trang sau ▶", size="sm")
+                            students_page_info = gr.Markdown()
+                            students_page = gr.State({})
                         with gr.Column(scale=1):
                             teacher_msg = gr.Textbox(label="Thông báo", lines=10, interactive=False)
                             teacher_node = gr.Markdown()
@@ -197,19 +290,39 @@ with gr.Blocks(title="Distributed Database Final Project", fill_height=True) as
                         btn_create_student = gr.Button(
                             "➕ Tạo sinh viên",
                             variant="primary",
-                            interactive=(ROLE == "primary"),
+                            interactive=can_write(),
                         )
                         btn_update_student = gr.Button(
                             "💾 Cập nhật sinh viên",
                             variant="primary",
-                            interactive=(ROLE == "primary"),
+                            interactive=can_write(),
                         )
                         btn_delete_student = gr.Button(
                             "🗑️ Xoá sinh viên",
                             variant="stop",
-                            interactive=(ROLE == "primary"),
+                            interactive=can_write(),
                         )
 
+                    with gr.Accordion("Nhập sinh viên hàng loạt (CSV / XLSX)", open=False):
+                        gr.Markdown(
+                            "Cột bắt buộc ở dòng tiêu đề: `full_name, class_name, email, date_of_birth, "
+                            "address, username, password`."
+                        )
+                        with gr.Row():
+                            import_file = gr.File(label="File sinh viên", file_types=[".csv", ".xlsx"])
+                            with gr.Column():
+                                import_batch_size = gr.Number(
+                                    label="Số dòng mỗi batch",
+                                    value=BULK_IMPORT_BATCH_SIZE,
+                                    precision=0,
+                                )
+                                btn_import_students = gr.Button(
+                                    "📥 Nhập danh sách sinh viên",
+                                    variant="primary",
+                                    interactive=can_write(),
+                                )
+                        import_msg = gr.Textbox(label="Kết quả nhập", lines=8, interactive=False)
+
                 # --- Major section 2: Subject management ---
                 with gr.Group(elem_classes=["teacher-major-section"]):
                     with gr.Accordion("Quản lý môn học (Thêm / Sửa / Xoá / Danh sách)", open=True):
@@ -239,17 +352,17 @@ with gr.Blocks(title="Distributed Database Final Project", fill_height=True) as
                             btn_create_subject = gr.Button(
                                 "➕ Tạo môn",
                                 variant="primary",
-                                interactive=(ROLE == "primary"),
+                                interactive=can_write(),
                             )
                             btn_update_subject = gr.Button(
                                 "💾 Cập nhật môn",
                                 variant="primary",
-                                interactive=(ROLE == "primary"),
+                                interactive=can_write(),
                             )
                             btn_delete_subject = gr.Button(
                                 "🗑️ Xoá môn",
                                 variant="stop",
-                                interactive=(ROLE == "primary"),
+                                interactive=can_write(),
                             )
 
                 # --- Major section 3: Scores-by-subject management ---
@@ -263,10 +376,24 @@ with gr.Blocks(title="Distributed Database Final Project", fill_height=True) as
                             scores_table = gr.Dataframe(
                                 headers=["Mã môn", "Tên môn", "Số TC", "Điểm"],
                                 datatype=["str", "str", "number", "number"],
+                                type="array",
                                 interactive=False,
                                 wrap=True,
                                 max_height=300,
                             )
+                            scores_summary = gr.Markdown()
+                            scores_snapshot = gr.State({})
+                            with gr.Row():
+                                scores_edit_mode = gr.Checkbox(
+                                    label="✏️ Sửa nhiều điểm trực tiếp trong bảng",
+                                    value=False,
+                                    interactive=can_write(),
+                                )
+                                btn_save_scores_grid = gr.Button(
+                                    "💾 Lưu các điểm đã sửa",
+                                    variant="primary",
+                                    interactive=can_write(),
+                                )
 
                     with gr.Row():
                         subject_choice = gr.Dropdown(label="Chọn môn", choices=[])
@@ -274,15 +401,88 @@ with gr.Blocks(title="Distributed Database Final Project", fill_height=True) as
                         btn_save_score = gr.Button(
                             "Lưu điểm",
                             variant="primary",
-                            interactive=(ROLE == "primary"),
+                            interactive=can_write(),
                         )
 
                     teacher_score_msg = gr.Textbox(label="Kết quả điểm", lines=6, interactive=False)
 
+                # --- Major section 4: Class score matrix ---
+                with gr.Group(elem_classes=["teacher-major-section"]):
+                    gr.Markdown("#### Ma trận điểm theo lớp")
+                    with gr.Row():
+                        matrix_class = gr.Textbox(label="Lớp", placeholder="VD: CS101")
+                        btn_load_matrix = gr.Button("📊 Tải ma trận điểm của lớp", variant="secondary")
+                    matrix_msg = gr.Markdown()
+                    matrix_table = gr.Dataframe(
+                        headers=["Student ID", "Họ tên"],
+                        type="array",
+                        interactive=False,
+                        wrap=True,
+                        max_height=400,
+                    )
+                    matrix_stats = gr.Dataframe(
+                        headers=STATS_HEADERS,
+                        datatype=["str", "number", "number", "number", "number"],
+                        type="array",
+                        interactive=False,
+                        max_height=300,
+                    )
+
+                # --- Major section 5: Subject score distribution ---
+                with gr.Group(elem_classes=["teacher-major-section"]):
+                    gr.Markdown("#### Thống kê phân bố điểm theo môn")
+                    with gr.Row():
+                        analytics_subjects = gr.Dropdown(label="Chọn môn (nhiều môn)", choices=[], multiselect=True)
+                        with gr.Column(scale=0, min_width=220):
+                            btn_analytics_choices = gr.Button("🔄 Tải danh sách môn", size="sm")
+                            btn_analytics = gr.Button("📈 Thống kê", variant="secondary")
+                    analytics_msg = gr.Markdown()
+                    analytics_distribution = gr.Dataframe(
+                        headers=DISTRIBUTION_HEADERS,
+                        type="array",
+                        interactive=False,
+                        max_height=300,
+                    )
+                    with gr.Row():
+                        analytics_bands = gr.Dataframe(
+                            label="Xếp loại",
+                            headers=BANDS_HEADERS,
+                            type="array",
+                            interactive=False,
+                            max_height=300,
+                        )
+                        analytics_histogram = gr.Dataframe(
+                            label="Histogram (số điểm mỗi khoảng)",
+                            headers=["Khoảng điểm"],
+                            type="array",
+                            interactive=False,
+                            max_height=300,
+                        )
+
+                # --- Major section 6: Export ---
+                with gr.Group(elem_classes=["teacher-major-section"]):
+                    gr.Markdown("#### Xuất dữ liệu (CSV / Parquet)")
+                    with gr.Row():
+                        export_dataset_choice = gr.Dropdown(
+                            label="Dữ liệu",
+                            choices=[(label, key) for key, label in EXPORT_DATASETS.items()],
+                            value="students",
+                        )
+                        export_format = gr.Radio(label="Định dạng", choices=["csv", "parquet"], value="csv")
+                        btn_export = gr.Button("📤 Xuất file", variant="secondary")
+                    with gr.Row():
+                        export_file = gr.File(label="File xuất", interactive=False)
+                        export_msg = gr.Textbox(label="Kết quả xuất", lines=3, interactive=False)
+
         with gr.TabItem("Student", visible=False) as student_tab:
             student_group = gr.Group(visible=False, elem_id="student_root")
             with student_group:
                 gr.Markdown("### Student Dashboard")
+                with gr.Row():
+                    btn_student_live = gr.Button("🔴 Bật cập nhật trực tiếp", size="sm")
+                    btn_student_live_stop = gr.Button("⚪ Tắt", size="sm")
+                    student_live_status = gr.Markdown()
+                student_live_event = gr.Textbox(visible=False)
                 with gr.Row():
                     with gr.Column(scale=1):
                         btn_load_profile = gr.Button("🔄 Tải hồ sơ của tôi", variant="secondary")
@@ -306,7 +506,7 @@ with gr.Blocks(title="Distributed Database Final Project", fill_height=True) as
                     btn_update_profile = gr.Button(
                         "Cập nhật thông tin của tôi",
                         variant="primary",
-                        interactive=(ROLE == "primary"),
+                        interactive=can_write(),
                     )
 
                 with gr.Group(elem_classes=["student-major-section"]):
@@ -318,6 +518,32 @@ with gr.Blocks(title="Distributed Database Final Project", fill_height=True) as
                         wrap=True,
                         max_height=360,
                     )
+                    my_summary = gr.Markdown()
+
+    # ---- Events: Monitoring ----
+    # ---- Write gating follows the discovered PRIMARY ----
+    write_controls = [
+        btn_create_student,
+        btn_update_student,
+        btn_delete_student,
+        btn_import_students,
+        btn_create_subject,
+        btn_update_subject,
+        btn_delete_subject,
+        scores_edit_mode,
+        btn_save_scores_grid,
+        btn_save_score,
+        btn_update_profile,
+    ]
+    if DB_TOPOLOGY_INTERVAL > 0:
+        gr.Timer(max(DB_TOPOLOGY_INTERVAL, 2.0)).tick(
+            _write_gating_updates(len(write_controls)),
+            inputs=[],
+            outputs=[topology_md, *write_controls],
+            show_progress="hidden",
+        )
+
+    btn_monitoring.click(monitoring_snapshot, inputs=[], outputs=[monitoring_json])
 
     # ---- Events: Login/Logout ----
     btn_login.click(
@@ -332,10 +558,24 @@ with gr.Blocks(title="Distributed Database Final Project", fill_height=True) as
     )
 
     # ---- Events: Teacher ----
+    students_page_inputs = [session_state, students_class_filter, students_name_filter, students_page]
+    students_page_outputs = [students_table, teacher_msg, teacher_node, students_page, students_page_info]
+    # Sau khi ghi: chỉ đọc các dòng đổi (delta) và giữ thông báo của thao tác ghi.
+    students_refresh_inputs = students_page_inputs + [teacher_msg]
     btn_refresh_students.click(
         list_students_table,
-        inputs=[session_state],
-        outputs=[students_table, teacher_msg, teacher_node],
+        inputs=[session_state, students_class_filter, students_name_filter],
+        outputs=students_page_outputs,
+    )
+    btn_students_next.click(
+        list_students_next_page,
+        inputs=students_page_inputs,
+        outputs=students_page_outputs,
+    )
+    btn_students_prev.click(
+        list_students_prev_page,
+        inputs=students_page_inputs,
+        outputs=students_page_outputs,
     )
     btn_load_student.click(
         get_student_detail,
@@ -356,27 +596,37 @@ with gr.Blocks(title="Distributed Database Final Project", fill_height=True) as
         ],
         outputs=[teacher_msg],
     ).then(
-        list_students_table,
-        inputs=[session_state],
-        outputs=[students_table, teacher_msg, teacher_node],
+        list_students_refresh,
+        inputs=students_refresh_inputs,
+        outputs=students_page_outputs,
     )
     btn_update_student.click(
         teacher_update_student,
         inputs=[session_state, t_student_id, t_full_name, t_class_name, t_email, t_dob, t_address],
         outputs=[teacher_msg],
     ).then(
-        list_students_table,
-        inputs=[session_state],
-        outputs=[students_table, teacher_msg, teacher_node],
+        list_students_refresh,
+        inputs=students_refresh_inputs,
+        outputs=students_page_outputs,
     )
     btn_delete_student.click(
         teacher_delete_student,
         inputs=[session_state, t_student_id],
         outputs=[teacher_msg],
     ).then(
-        list_students_table,
-        inputs=[session_state],
-        outputs=[students_table, teacher_msg, teacher_node],
+        list_students_refresh,
+        inputs=students_refresh_inputs,
+        outputs=students_page_outputs,
+    )
+
+    btn_import_students.click(
+        teacher_bulk_import_students,
+        inputs=[session_state, import_file, import_batch_size],
+        outputs=[import_msg],
+    ).then(
+        list_students_refresh,
+        inputs=students_refresh_inputs,
+        outputs=students_page_outputs,
     )
 
     # ---- Events: Subjects (Teacher) ----
@@ -425,19 +675,57 @@ with gr.Blocks(title="Distributed Database Final Project", fill_height=True) as
         outputs=[subject_choice, teacher_msg],
     )
 
+    scores_grid_outputs = [scores_table, teacher_score_msg, teacher_node, scores_snapshot, scores_summary]
     btn_load_scores.click(
-        teacher_get_scores_table,
+        teacher_load_scores_grid,
         inputs=[session_state, score_student_id],
-        outputs=[scores_table, teacher_score_msg, teacher_node],
+        outputs=scores_grid_outputs,
     )
     btn_save_score.click(
         teacher_upsert_score,
         inputs=[session_state, score_student_id, subject_choice, score_value],
         outputs=[teacher_score_msg],
     ).then(
-        teacher_get_scores_table,
-        inputs=[session_state, score_student_id],
-        outputs=[scores_table, teacher_score_msg, teacher_node],
+        teacher_refresh_scores_grid_keep_msg,
+        inputs=[session_state, score_student_id, scores_snapshot, teacher_score_msg],
+        outputs=scores_grid_outputs,
+    )
+    scores_edit_mode.change(
+        _toggle_scores_edit,
+        inputs=[scores_edit_mode],
+        outputs=[scores_table],
+    )
+    btn_save_scores_grid.click(
+        teacher_save_scores_grid,
+        inputs=[session_state, scores_table, scores_snapshot],
+        outputs=[teacher_score_msg],
+    ).then(
+        teacher_reload_scores_grid_keep_msg,
+        inputs=[session_state, scores_snapshot, teacher_score_msg],
+        outputs=scores_grid_outputs,
+    )
+
+    btn_load_matrix.click(
+        teacher_class_matrix,
+        inputs=[session_state, matrix_class],
+        outputs=[matrix_table, matrix_stats, matrix_msg, teacher_node],
+    )
+
+    btn_analytics_choices.click(
+        teacher_analytics_subject_choices,
+        inputs=[session_state],
+        outputs=[analytics_subjects, analytics_msg],
+    )
+    btn_analytics.click(
+        teacher_subject_analytics,
+        inputs=[session_state, analytics_subjects],
+        outputs=[analytics_distribution, analytics_bands, analytics_histogram, analytics_msg, teacher_node],
+    )
+
+    btn_export.click(
+        teacher_export_data,
+        inputs=[session_state, export_dataset_choice, export_format],
+        outputs=[export_file, export_msg],
     )
 
     # ---- Events: Student ----
@@ -454,11 +742,58 @@ with gr.Blocks(title="Distributed Database Final Project", fill_height=True) as
     btn_load_my_scores.click(
         student_scores_table,
         inputs=[session_state],
-        outputs=[my_scores_table, student_msg, student_node],
+        outputs=[my_scores_table, student_msg, student_node, my_summary],
+    )
+
+    # ---- Events: Live updates (push thay cho polling) ----
+    teacher_live_run = btn_teacher_live.click(
+        live_changes,
+        inputs=[session_state],
+        outputs=[teacher_live_status, teacher_live_event],
+        concurrency_limit=None,
+    )
+    btn_teacher_live_stop.click(live_stopped, outputs=[teacher_live_status], cancels=[teacher_live_run])
+    student_live_run = btn_student_live.click(
+        live_changes,
+        inputs=[session_state],
+        outputs=[student_live_status, student_live_event],
+        concurrency_limit=None,
+    )
+    btn_student_live_stop.click(live_stopped, outputs=[student_live_status], cancels=[student_live_run])
+    btn_logout.click(None, cancels=[teacher_live_run, student_live_run])
+
+    teacher_live_event.change(
+        live_handler(list_students_refresh, len(students_page_outputs), students_changed),
+        inputs=[teacher_live_event, *students_refresh_inputs],
+        outputs=students_page_outputs,
+        show_progress="hidden",
+    )
+    teacher_live_event.change(
+        live_handler(teacher_refresh_subjects_ui_keep_msg, 4, subjects_changed),
+        inputs=[teacher_live_event, session_state, subject_msg],
+        outputs=[subjects_table, subject_msg, teacher_node, subject_choice],
+        show_progress="hidden",
+    )
+    teacher_live_event.change(
+        live_handler(teacher_reload_scores_grid_keep_msg, len(scores_grid_outputs), grid_changed, extra=1),
+        inputs=[teacher_live_event, session_state, scores_snapshot, teacher_score_msg, scores_edit_mode],
+        outputs=scores_grid_outputs,
+        show_progress="hidden",
+    )
+    student_live_event.change(
+        live_handler(student_scores_table, 4, my_scores_changed),
+        inputs=[student_live_event, session_state],
+        outputs=[my_scores_table, student_msg, student_node, my_summary],
+        show_progress="hidden",
     )
 
 
 if __name__ == "__main__":
+    if METRICS_PORT:
+        metrics.start_http_server(METRICS_PORT, METRICS_HOST)
+        print(f"Metrics (Prometheus): http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    if DB_CDC:
+        cdc.start()
     # If running locally on different machines in LAN, 
     # use server_name="0.0.0.0" to make the UI accessible on the network.
     # Gradio 6.0: `css` moved from `gr.Blocks(...)` to `launch(...)`.
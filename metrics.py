@@ -0,0 +1,434 @@
+"""Dependency-free metrics: counters / histograms rendered in Prometheus text format.
+
+- ``@instrumented`` wraps a handler (sync or async): calls, errors, latency.
+  Handlers report failures as "❌ ..." strings, so a result containing one
+  counts as an error too. Only the outermost handler of a call chain is
+  recorded, and its name is available to the DB layer via ``current_handler``.
+  It also counts the statements executed and the pool checkouts made on its
+  behalf (round trips per user action; see ``db.unit_of_work``).
+- ``InstrumentedCursor`` / ``AsyncInstrumentedCursor`` (returned by pooled
+  connections) time every ``execute`` and count rows and errors by errno.
+- ``ConnectionPool`` reports the time spent acquiring a connection.
+
+``start_http_server(port)`` serves ``GET /metrics`` from a daemon thread next
+to the Gradio server. Recording is a ``perf_counter`` pair plus a short
+locked update, cheap enough to leave on.
+"""
+
+import bisect
+import contextvars
+import functools
+import inspect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import mysql.connector
+
+# Latency buckets in seconds (upper bounds; +Inf is implicit).
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Handler currently running in this thread / asyncio task ("" outside handlers).
+current_handler: contextvars.ContextVar[str] = contextvars.ContextVar("current_handler", default="")
+# Buckets for per-handler counts (statements, checkouts).
+COUNT_BUCKETS = (1, 2, 3, 4, 6, 8, 12, 16, 24, 32, 64)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(names, values, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def value(self, *label_values) -> float:
+        with self._lock:
+            return self._values.get(label_values, 0.0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels_text(self.labels, key)} {value:g}" for key, value in items]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series: dict[tuple, list] = {}  # labels -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, seconds: float, *label_values) -> None:
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += seconds
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="%g"' % bound
+                lines.append(f"{self.name}_bucket{_labels_text(self.labels, key, le)} {cumulative}")
+            cumulative += series[len(self.buckets)]
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels_text(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels_text(self.labels, key)} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{_labels_text(self.labels, key)} {cumulative}")
+        return lines
+
+    def totals(self) -> dict:
+        """{label values: (count, sum)} of every series."""
+        with self._lock:
+            return {key: (sum(series[:-1]), series[-1]) for key, series in self._series.items()}
+
+
+HANDLER_CALLS = Counter("app_handler_calls_total", "Handler calls.", ["handler"])
+HANDLER_ERRORS = Counter("app_handler_errors_total", "Handler calls that raised or returned an error message.", ["handler"])
+HANDLER_LATENCY = Histogram("app_handler_duration_seconds", "Handler latency.", ["handler"])
+QUERY_LATENCY = Histogram("db_query_duration_seconds", "Statement latency (execute).", ["node", "statement"])
+QUERY_ERRORS = Counter("db_query_errors_total", "Failed statements by MySQL errno.", ["node", "errno"])
+ROWS_RETURNED = Counter("db_rows_returned_total", "Rows fetched from result sets.", ["node"])
+ROWS_AFFECTED = Counter("db_rows_affected_total", "Rows changed by INSERT/UPDATE/DELETE.", ["node"])
+ACQUIRE_LATENCY = Histogram("db_connection_acquire_seconds", "Time to check a connection out of a pool.", ["node", "pool"])
+HANDLER_STATEMENTS = Histogram(
+    "app_handler_statements", "Statements executed per handler call.", ["handler"], buckets=COUNT_BUCKETS
+)
+HANDLER_CHECKOUTS = Histogram(
+    "app_handler_connection_checkouts", "Pool checkouts per handler call.", ["handler"], buckets=COUNT_BUCKETS
+)
+
+_METRICS = [
+    HANDLER_CALLS,
+    HANDLER_ERRORS,
+    HANDLER_LATENCY,
+    QUERY_LATENCY,
+    QUERY_ERRORS,
+    ROWS_RETURNED,
+    ROWS_AFFECTED,
+    ACQUIRE_LATENCY,
+    HANDLER_STATEMENTS,
+    HANDLER_CHECKOUTS,
+]
+_collectors = []  # callables returning extra exposition lines (gauges computed on scrape)
+
+
+def register_collector(fn) -> None:
+    _collectors.append(fn)
+
+
+def render() -> str:
+    lines = []
+    for metric in _METRICS:
+        lines += metric.render()
+    for collect in _collectors:
+        try:
+            lines += collect()
+        except Exception as err:  # a broken collector must not take /metrics down
+            lines.append(f"# collector error: {_escape(err)}")
+    return "\n".join(lines) + "\n"
+
+
+# ---------- handlers ----------
+
+
+def _is_error_result(result) -> bool:
+    values = result if isinstance(result, tuple) else (result,)
+    return any(isinstance(v, str) and v.startswith("❌") for v in values)
+
+
+class ActionCounts:
+    """Statements / checkouts of one handler call (shared with its scatter worker threads)."""
+
+    __slots__ = ("_lock", "statements", "checkouts")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.statements = 0
+        self.checkouts = 0
+
+    def add(self, statements: int = 0, checkouts: int = 0) -> None:
+        with self._lock:
+            self.statements += statements
+            self.checkouts += checkouts
+
+
+# Counters of the handler call running in this thread / asyncio task (None outside handlers).
+current_action: contextvars.ContextVar[ActionCounts | None] = contextvars.ContextVar("current_action", default=None)
+
+
+def instrumented(fn):
+    """Record calls / errors / latency of a UI handler (sync or ``async def``)."""
+    name = fn.__name__
+
+    if inspect.iscoroutinefunction(fn):
+
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            if current_handler.get():
+                return await fn(*args, **kwargs)
+            token = current_handler.set(name)
+            counts = ActionCounts()
+            counts_token = current_action.set(counts)
+            started = time.perf_counter()
+            failed = True
+            try:
+                result = await fn(*args, **kwargs)
+                failed = _is_error_result(result)
+                return result
+            finally:
+                _record_handler(name, time.perf_counter() - started, failed, counts)
+                current_action.reset(counts_token)
+                current_handler.reset(token)
+
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if current_handler.get():
+            return fn(*args, **kwargs)
+        token = current_handler.set(name)
+        counts = ActionCounts()
+        counts_token = current_action.set(counts)
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = fn(*args, **kwargs)
+            failed = _is_error_result(result)
+            return result
+        finally:
+            _record_handler(name, time.perf_counter() - started, failed, counts)
+            current_action.reset(counts_token)
+            current_handler.reset(token)
+
+    return wrapper
+
+
+def _record_handler(name: str, seconds: float, failed: bool, counts: ActionCounts) -> None:
+    HANDLER_CALLS.inc(name)
+    HANDLER_LATENCY.observe(seconds, name)
+    HANDLER_STATEMENTS.observe(counts.statements, name)
+    HANDLER_CHECKOUTS.observe(counts.checkouts, name)
+    if failed:
+        HANDLER_ERRORS.inc(name)
+
+
+# ---------- queries ----------
+
+
+def statement_kind(sql) -> str:
+    """First keyword of a statement (SELECT / INSERT / ...): a low-cardinality label."""
+    head = str(sql).lstrip()[:16].split(None, 1)
+    return head[0].upper() if head else ""
+
+
+def observe_acquire(node: str, pool: str, seconds: float) -> None:
+    ACQUIRE_LATENCY.observe(seconds, node, pool)
+    counts = current_action.get()
+    if counts is not None:
+        counts.add(checkouts=1)
+
+
+_query_observers = []  # fn(node, sql, params, seconds, error), e.g. the slow query log
+
+
+def register_query_observer(fn) -> None:
+    _query_observers.append(fn)
+
+
+def _record_query(node: str, sql, params, seconds: float, error) -> None:
+    QUERY_LATENCY.observe(seconds, node, statement_kind(sql))
+    counts = current_action.get()
+    if counts is not None:
+        counts.add(statements=1)
+    if error is not None:
+        QUERY_ERRORS.inc(node, str(getattr(error, "errno", None) or "unknown"))
+    for observe in _query_observers:
+        observe(node, sql, params, seconds, error)
+
+
+def _record_rows(node: str, rows) -> None:
+    if rows is None:
+        return
+    count = len(rows) if isinstance(rows, list) else 1
+    if count:
+        ROWS_RETURNED.inc(node, amount=count)
+
+
+class InstrumentedCursor:
+    """Cursor proxy timing ``execute`` / ``executemany`` and counting rows."""
+
+    def __init__(self, raw, node: str):
+        self._raw = raw
+        self._node = node
+
+    def __getattr__(self, item):
+        return getattr(self._raw, item)
+
+    def __iter__(self):
+        return iter(self._raw)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._raw.close()
+
+    def _run(self, method, sql, params):
+        started = time.perf_counter()
+        error = None
+        try:
+            return method(sql, params)
+        except mysql.connector.Error as err:
+            error = err
+            raise
+        finally:
+            _record_query(self._node, sql, params, time.perf_counter() - started, error)
+            if error is None and not getattr(self._raw, "with_rows", True) and (self._raw.rowcount or 0) > 0:
+                ROWS_AFFECTED.inc(self._node, amount=self._raw.rowcount)
+
+    def execute(self, sql, params=()):
+        return self._run(self._raw.execute, sql, params)
+
+    def executemany(self, sql, seq_params):
+        return self._run(self._raw.executemany, sql, seq_params)
+
+    def fetchone(self):
+        row = self._raw.fetchone()
+        _record_rows(self._node, row)
+        return row
+
+    def fetchmany(self, size=1):
+        rows = self._raw.fetchmany(size)
+        _record_rows(self._node, rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._raw.fetchall()
+        _record_rows(self._node, rows)
+        return rows
+
+
+class PreparedCursor(InstrumentedCursor):
+    """``InstrumentedCursor`` over a cached prepared cursor: always runs its own ``sql`` and is never closed.
+
+    ``execute`` is the pool's ``execute(sql, params)`` for that cursor; the
+    pool drops the cursor when it resets, discards or closes the connection.
+    """
+
+    def __init__(self, raw, node: str, sql: str, execute):
+        super().__init__(raw, node)
+        self._sql = sql
+        self._execute = execute
+
+    def __exit__(self, exc_type, *exc):
+        # Keep the statement prepared; only drain rows the caller left unread.
+        if exc_type is None and self._raw.with_rows:
+            self._raw.fetchall()
+
+    def execute(self, sql, params=()):
+        return self._run(self._execute, self._sql, params)
+
+    def close(self):
+        pass
+
+
+class AsyncInstrumentedCursor(InstrumentedCursor):
+    """``InstrumentedCursor`` for ``mysql.connector.aio`` cursors."""
+
+    async def _run(self, method, sql, params):
+        started = time.perf_counter()
+        error = None
+        try:
+            return await method(sql, params)
+        except mysql.connector.Error as err:
+            error = err
+            raise
+        finally:
+            _record_query(self._node, sql, params, time.perf_counter() - started, error)
+            if error is None and not getattr(self._raw, "with_rows", True) and (self._raw.rowcount or 0) > 0:
+                ROWS_AFFECTED.inc(self._node, amount=self._raw.rowcount)
+
+    async def fetchone(self):
+        row = await self._raw.fetchone()
+        _record_rows(self._node, row)
+        return row
+
+    async def fetchmany(self, size=1):
+        rows = await self._raw.fetchmany(size)
+        _record_rows(self._node, rows)
+        return rows
+
+    async def fetchall(self):
+        rows = await self._raw.fetchall()
+        _record_rows(self._node, rows)
+        return rows
+
+
+class AsyncPreparedCursor(AsyncInstrumentedCursor):
+    """``PreparedCursor`` for ``mysql.connector.aio``; the caller reads all rows and does not close it."""
+
+    def __init__(self, raw, node: str, sql: str, execute):
+        super().__init__(raw, node)
+        self._sql = sql
+        self._execute = execute
+
+    async def execute(self, sql, params=()):
+        return await self._run(self._execute, self._sql, params)
+
+    async def close(self):
+        pass
+
+
+# ---------- HTTP endpoint ----------
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass  # scrapes every few seconds would flood the console
+
+
+def start_http_server(port: int, host: str = "127.0.0.1"):
+    """Serve ``/metrics`` on ``host:port`` from a daemon thread; returns the server."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
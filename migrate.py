@@ -0,0 +1,151 @@
+"""Idempotent schema migrations for databases created from an older ``students.sql``.
+
+``students.sql`` recreates the schema from scratch (docker init). A database
+created before a feature that needs new columns / tables is brought up to
+date with ``python migrate.py``, run against the PRIMARY of every shard; the
+DDL reaches the REPLICAs through replication. Every step first checks
+``information_schema``, so running it again (or on a fresh database)
+changes nothing.
+
+CLI::
+
+    python migrate.py            # apply the missing steps on every PRIMARY
+    python migrate.py --check    # only list the missing steps
+"""
+
+import argparse
+
+import mysql.connector
+
+import summary
+from db import all_shards, get_write_connection
+
+_COLUMN_EXISTS = (
+    "SELECT COUNT(*) FROM information_schema.COLUMNS "
+    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s"
+)
+_TABLE_EXISTS = "SELECT COUNT(*) FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s"
+_INDEX_EXISTS = (
+    "SELECT COUNT(*) FROM information_schema.STATISTICS "
+    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s"
+)
+
+_UPDATED_AT = "updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)"
+
+# (tên, câu kiểm tra đã có chưa, tham số, các bước) theo thứ tự áp dụng; DDL giống hệt định nghĩa trong
+# students.sql. Mỗi bước là một câu SQL hoặc hàm nhận cursor (vd. điền dữ liệu cho bảng mới).
+MIGRATIONS = [
+    (
+        "students.idx_students_class (lọc roster theo lớp)",
+        _INDEX_EXISTS,
+        ("students", "idx_students_class"),
+        ("ALTER TABLE students ADD INDEX idx_students_class (class_name, id)",),
+    ),
+    (
+        "students.updated_at (delta refresh)",
+        _COLUMN_EXISTS,
+        ("students", "updated_at"),
+        (f"ALTER TABLE students ADD COLUMN {_UPDATED_AT}, ADD INDEX idx_students_updated (updated_at)",),
+    ),
+    (
+        "subjects.updated_at (delta refresh)",
+        _COLUMN_EXISTS,
+        ("subjects", "updated_at"),
+        (f"ALTER TABLE subjects ADD COLUMN {_UPDATED_AT}, ADD INDEX idx_subjects_updated (updated_at)",),
+    ),
+    (
+        "scores.updated_at (delta refresh)",
+        _COLUMN_EXISTS,
+        ("scores", "updated_at"),
+        (f"ALTER TABLE scores ADD COLUMN {_UPDATED_AT}",),
+    ),
+    (
+        "deleted_rows (tombstone cho delta refresh)",
+        _TABLE_EXISTS,
+        ("deleted_rows",),
+        (
+            "CREATE TABLE IF NOT EXISTS deleted_rows ("
+            "id BIGINT AUTO_INCREMENT PRIMARY KEY, "
+            "table_name VARCHAR(30) NOT NULL, "
+            "row_key VARCHAR(64) NOT NULL, "
+            "deleted_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6), "
+            "INDEX idx_deleted_table_time (table_name, deleted_at))",
+        ),
+    ),
+    (
+        "student_summary (GPA / hạng theo lớp)",
+        _TABLE_EXISTS,
+        ("student_summary",),
+        (
+            "CREATE TABLE IF NOT EXISTS student_summary ("
+            "student_id INT PRIMARY KEY, "
+            "class_name VARCHAR(50) NULL, "
+            "gpa DECIMAL(6,3) NULL, "
+            "credits_earned INT NOT NULL DEFAULT 0, "
+            "graded_count INT NOT NULL DEFAULT 0, "
+            "class_rank INT NULL, "
+            "INDEX idx_summary_class_gpa (class_name, gpa), "
+            "CONSTRAINT fk_summary_student FOREIGN KEY (student_id) REFERENCES students(id) ON DELETE CASCADE)",
+            # Bảng mới tạo còn rỗng: tính cho mọi sinh viên hiện có (như `python summary.py`).
+            summary.rebuild,
+        ),
+    ),
+]
+
+
+def missing_steps(cur) -> list[tuple]:
+    """Steps of ``MIGRATIONS`` not applied yet on ``cur``'s database."""
+    missing = []
+    for step in MIGRATIONS:
+        _, check_sql, params, _ = step
+        cur.execute(check_sql, params)
+        if not cur.fetchone()[0]:
+            missing.append(step)
+    return missing
+
+
+def migrate(conn, cur, check_only: bool = False) -> list[str]:
+    """Apply the missing steps, committing after each; names of the steps found missing."""
+    names = []
+    for name, _, _, actions in missing_steps(cur):
+        if not check_only:
+            for action in actions:
+                if callable(action):
+                    action(cur)
+                else:
+                    cur.execute(action)
+            conn.commit()
+        names.append(name)
+    return names
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Cập nhật schema của DB tạo từ students.sql cũ (chạy lại nhiều lần vẫn an toàn).")
+    parser.add_argument("--check", action="store_true", help="chỉ liệt kê các bước còn thiếu, không sửa DB")
+    args = parser.parse_args(argv)
+
+    for shard in all_shards() or [None]:
+        label = shard.name if shard else "PRIMARY"
+        conn = get_write_connection(shard)
+        if conn is None:
+            print(f"❌ Không kết nối được {label}.")
+            return 1
+        try:
+            cur = conn.cursor()
+            names = migrate(conn, cur, check_only=args.check)
+            cur.close()
+        except mysql.connector.Error as err:
+            print(f"❌ {label}: {err}")
+            return 1
+        finally:
+            if conn.is_connected():
+                conn.close()
+        if not names:
+            print(f"✅ {label}: schema đã mới nhất.")
+        for name in names:
+            print(f"{'⚠️ thiếu' if args.check else '✅ đã thêm'} {label}: {name}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
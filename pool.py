@@ -0,0 +1,540 @@
+import asyncio
+import functools
+import threading
+import time
+import weakref
+from collections import deque
+
+import mysql.connector
+from mysql.connector.errors import PoolError
+
+import metrics
+
+
+class ConnectionPool:
+    """Thread-safe pool of MySQL connections for one node.
+
+    mysql-connector ships its own ``MySQLConnectionPool`` but it has no
+    overflow, idle eviction, health check or metrics, so we keep a small one
+    here (still dependency-free).
+
+    - ``size`` connections are kept warm; up to ``max_overflow`` extra ones are
+      opened under load and closed again when they are returned.
+    - Idle connections older than ``idle_timeout`` seconds are closed on checkout.
+    - ``pre_ping`` pings a reused connection before handing it out.
+    - ``reset_on_return`` clears session state (COM_RESET_CONNECTION) on return;
+      otherwise an open transaction is rolled back.
+    - ``prepared`` keeps server-side prepared statements per connection
+      (``PooledConnection.prepared_cursor``). COM_RESET_CONNECTION deallocates
+      them, so with ``reset_on_return`` they are dropped on every return and
+      prepared again by the next borrower; they are also dropped whenever the
+      pool closes or discards the connection.
+    """
+
+    _kind = "sync"  # label of the acquire-time metric
+
+    def __init__(
+        self,
+        name: str,
+        connect_kwargs: dict,
+        size: int = 5,
+        max_overflow: int = 10,
+        timeout: float = 10.0,
+        idle_timeout: float = 300.0,
+        pre_ping: bool = True,
+        reset_on_return: bool = True,
+        prepared: bool = False,
+    ):
+        self.name = name
+        self.connect_kwargs = dict(connect_kwargs)
+        self.size = max(1, int(size))
+        self.max_overflow = max(0, int(max_overflow))
+        self.timeout = float(timeout)
+        self.idle_timeout = float(idle_timeout)
+        self.pre_ping = pre_ping
+        self.reset_on_return = reset_on_return
+        self.keeps_prepared = prepared
+        # raw connection -> {(sql, dictionary): (sql, prepared cursor)}; dropped on reset / discard / close.
+        self._statements: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+        self._cond = threading.Condition()
+        self._idle: deque = deque()  # (raw_conn, returned_at)
+        self._total = 0
+        self._in_use = 0
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "timeouts": 0,
+            "created": 0,
+            "broken": 0,
+            "idle_closed": 0,
+            "prepared": 0,
+        }
+
+    # ---------- checkout / return ----------
+
+    def acquire(self):
+        """Check out a connection, waiting up to ``timeout`` seconds for a free slot."""
+        started = time.monotonic()
+        waited = False
+        expired = []
+
+        with self._cond:
+            while True:
+                raw, got_slot = self._take_slot(started, expired)
+                if got_slot:
+                    break
+                waited = True
+                remaining = self.timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self._timed_out(started)
+                self._cond.wait(remaining)
+
+        for conn in expired:
+            _close_quietly(conn)
+
+        try:
+            if raw is None:
+                raw = self._connect()
+            elif self.pre_ping and not self._is_alive(raw):
+                self._count("broken")
+                self._forget_statements(raw)
+                _close_quietly(raw)
+                raw = self._connect()
+        except mysql.connector.Error:
+            self._give_back_slot()
+            raise
+
+        self._checked_out(started, waited)
+        return PooledConnection(self, raw)
+
+    def release(self, raw, broken: bool = False) -> None:
+        """Return a raw connection to the pool (or drop it if broken / overflow)."""
+        if not broken:
+            try:
+                if raw.unread_result:
+                    raw.consume_results()
+                if self.reset_on_return:
+                    self._forget_statements(raw)
+                    raw.reset_session()
+                elif raw.in_transaction:
+                    raw.rollback()
+            except mysql.connector.Error:
+                broken = True
+
+        if self._put_back(raw, broken):
+            _close_quietly(raw)
+
+    # ---------- bookkeeping shared with AsyncConnectionPool ----------
+
+    def _take_slot(self, now: float, expired: list):
+        """(idle_conn_or_None, got_slot). Caller holds self._cond.
+
+        Pops a fresh idle connection (closing expired ones into ``expired``) or
+        reserves a slot for a new connection, opened later outside the lock.
+        """
+        while self._idle:
+            candidate, returned_at = self._idle.pop()
+            if self.idle_timeout > 0 and now - returned_at > self.idle_timeout:
+                expired.append(candidate)
+                self._statements.pop(candidate, None)
+                self._total -= 1
+                self._stats["idle_closed"] += 1
+                continue
+            self._in_use += 1
+            return candidate, True
+
+        if self._total < self.size + self.max_overflow:
+            self._total += 1
+            self._in_use += 1
+            return None, True
+        return None, False
+
+    def _timed_out(self, started: float) -> None:
+        # Caller holds self._cond.
+        self._stats["timeouts"] += 1
+        self._record_wait(time.monotonic() - started)
+        raise PoolError(f"Pool '{self.name}' exhausted (timeout {self.timeout}s).")
+
+    def _give_back_slot(self) -> None:
+        """Undo _take_slot after a failed connect."""
+        with self._cond:
+            self._total -= 1
+            self._in_use -= 1
+            self._cond.notify()
+
+    def _checked_out(self, started: float, waited: bool) -> None:
+        elapsed = time.monotonic() - started
+        with self._cond:
+            self._stats["checkouts"] += 1
+            if waited:
+                self._record_wait(elapsed)
+        metrics.observe_acquire(self.name, self._kind, elapsed)
+
+    def _put_back(self, raw, broken: bool) -> bool:
+        """Keep ``raw`` as idle or drop it; True if the caller must close it."""
+        discard = broken
+        with self._cond:
+            self._in_use -= 1
+            if broken:
+                self._stats["broken"] += 1
+            if not discard and len(self._idle) >= self.size:
+                # Overflow connection: do not keep it around.
+                discard = True
+            if discard:
+                self._total -= 1
+                self._statements.pop(raw, None)
+            else:
+                self._idle.append((raw, time.monotonic()))
+            self._cond.notify()
+        return discard
+
+    def _count(self, key: str) -> None:
+        with self._cond:
+            self._stats[key] += 1
+
+    def _forget_statements(self, raw) -> None:
+        """Drop the cached prepared cursors of ``raw`` (reset / closed: the server no longer has them)."""
+        with self._cond:
+            self._statements.pop(raw, None)
+
+    def statements(self, raw) -> dict:
+        """Prepared cursors of ``raw`` (only used by the connection's current owner)."""
+        with self._cond:
+            cache = self._statements.get(raw)
+            if cache is None:
+                cache = self._statements[raw] = {}
+        return cache
+
+    def close_all(self) -> None:
+        with self._cond:
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            for conn in idle:
+                self._statements.pop(conn, None)
+            self._total -= len(idle)
+        for conn in idle:
+            _close_quietly(conn)
+
+    # ---------- metrics ----------
+
+    def stats(self) -> dict:
+        with self._cond:
+            data = dict(self._stats)
+            data.update(
+                {
+                    "name": self.name,
+                    "size": self.size,
+                    "max_overflow": self.max_overflow,
+                    "total": self._total,
+                    "in_use": self._in_use,
+                    "idle": len(self._idle),
+                }
+            )
+        data["wait_time_total"] = round(data["wait_time_total"], 6)
+        data["wait_time_max"] = round(data["wait_time_max"], 6)
+        return data
+
+    # ---------- internals ----------
+
+    def _connect(self):
+        raw = mysql.connector.connect(**self.connect_kwargs)
+        self._count("created")
+        return raw
+
+    def _record_wait(self, seconds: float) -> None:
+        # Caller holds self._cond.
+        self._stats["waits"] += 1
+        self._stats["wait_time_total"] += seconds
+        self._stats["wait_time_max"] = max(self._stats["wait_time_max"], seconds)
+
+    @staticmethod
+    def _is_alive(raw) -> bool:
+        try:
+            raw.ping(reconnect=False)
+            return True
+        except mysql.connector.Error:
+            return False
+
+
+class PooledConnection:
+    """Proxy around a raw connection; ``close()`` gives it back to the pool.
+
+    Everything else is forwarded, so handlers keep using the usual
+    ``cursor()`` / ``commit()`` / ``is_connected()`` / ``close()`` calls.
+    """
+
+    def __init__(self, pool: ConnectionPool, raw):
+        self._pool = pool
+        self._raw = raw
+        self._released = False
+
+    @property
+    def node(self) -> str:
+        return self._pool.name
+
+    def __getattr__(self, item):
+        return getattr(self._raw, item)
+
+    def cursor(self, *args, **kwargs):
+        return metrics.InstrumentedCursor(self._raw.cursor(*args, **kwargs), self._pool.name)
+
+    def prepared_cursor(self, sql: str, dictionary: bool = False):
+        """Cursor running ``sql`` as a server-side prepared statement, prepared once per connection.
+
+        Results use the binary protocol. Use it as ``with conn.prepared_cursor(SQL) as cur:
+        cur.execute(SQL, params)``; leaving the block keeps the statement.
+        Falls back to a plain cursor when the pool does not keep statements, which is
+        the default: ``DB_PREPARED_STATEMENTS`` is only on when ``DB_POOL_RESET_SESSION=0``.
+        """
+        if not self._pool.keeps_prepared:
+            return self.cursor(dictionary=dictionary)
+        statements = self._pool.statements(self._raw)
+        entry = statements.get((sql, dictionary))
+        if entry is None:
+            # Same str object on every execute: the connector re-prepares when it changes.
+            entry = statements[(sql, dictionary)] = (sql, self._raw.cursor(prepared=True, dictionary=dictionary))
+            self._pool._count("prepared")
+        sql, cur = entry
+        return metrics.PreparedCursor(cur, self._pool.name, sql, functools.partial(execute_prepared, cur))
+
+    def is_connected(self) -> bool:
+        if self._released:
+            return False
+        if self._raw.is_connected():
+            return True
+        # Handlers only call close() when is_connected() is True, so a dead
+        # connection has to give its slot back here.
+        self._release(broken=True)
+        return False
+
+    def close(self) -> None:
+        self._release(broken=False)
+
+    def _release(self, broken: bool) -> None:
+        if self._released:
+            return
+        self._released = True
+        self._pool.release(self._raw, broken=broken)
+
+
+class AsyncConnectionPool(ConnectionPool):
+    """asyncio flavour of ``ConnectionPool`` (``mysql.connector.aio`` connections).
+
+    Slot accounting, idle eviction and stats are the same code as the
+    threaded pool; only waiting for a free slot and the network calls
+    (connect, ping, reset, close) are awaited, so a request waiting on the
+    database does not hold a worker thread.
+    """
+
+    _kind = "async"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._waiters = None  # asyncio.Condition, created inside the event loop
+
+    def _async_cond(self) -> asyncio.Condition:
+        if self._waiters is None:
+            self._waiters = asyncio.Condition()
+        return self._waiters
+
+    async def acquire(self):
+        started = time.monotonic()
+        waited = False
+        expired = []
+
+        waiters = self._async_cond()
+        async with waiters:
+            while True:
+                with self._cond:
+                    raw, got_slot = self._take_slot(started, expired)
+                if got_slot:
+                    break
+                waited = True
+                remaining = self.timeout - (time.monotonic() - started)
+                try:
+                    if remaining <= 0:
+                        raise asyncio.TimeoutError
+                    await asyncio.wait_for(waiters.wait(), remaining)
+                except asyncio.TimeoutError:
+                    with self._cond:
+                        self._timed_out(started)
+
+        for conn in expired:
+            await _aclose_quietly(conn)
+
+        try:
+            if raw is None:
+                raw = await self._aconnect()
+            elif self.pre_ping and not await self._ais_alive(raw):
+                self._count("broken")
+                self._forget_statements(raw)
+                await _aclose_quietly(raw)
+                raw = await self._aconnect()
+        except mysql.connector.Error:
+            self._give_back_slot()
+            await self._wake_one()
+            raise
+
+        self._checked_out(started, waited)
+        return AsyncPooledConnection(self, raw)
+
+    async def release(self, raw, broken: bool = False) -> None:
+        if not broken:
+            try:
+                if raw.unread_result:
+                    await raw.consume_results()
+                if self.reset_on_return:
+                    self._forget_statements(raw)
+                    await raw.reset_session()
+                elif raw.in_transaction:
+                    await raw.rollback()
+            except mysql.connector.Error:
+                broken = True
+
+        if self._put_back(raw, broken):
+            await _aclose_quietly(raw)
+        await self._wake_one()
+
+    async def close_all(self) -> None:
+        with self._cond:
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            for conn in idle:
+                self._statements.pop(conn, None)
+            self._total -= len(idle)
+        for conn in idle:
+            await _aclose_quietly(conn)
+
+    async def _wake_one(self) -> None:
+        waiters = self._async_cond()
+        async with waiters:
+            waiters.notify()
+
+    async def _aconnect(self):
+        from mysql.connector import aio
+
+        raw = await aio.connect(**self.connect_kwargs)
+        self._count("created")
+        return raw
+
+    @staticmethod
+    async def _ais_alive(raw) -> bool:
+        try:
+            await raw.ping(reconnect=False)
+            return True
+        except mysql.connector.Error:
+            return False
+
+
+class AsyncPooledConnection(PooledConnection):
+    """``PooledConnection`` for ``AsyncConnectionPool``: ``is_connected()`` / ``close()`` are awaited."""
+
+    async def cursor(self, *args, **kwargs):
+        return metrics.AsyncInstrumentedCursor(await self._raw.cursor(*args, **kwargs), self._pool.name)
+
+    async def prepared_cursor(self, sql: str, dictionary: bool = False):
+        """Async ``PooledConnection.prepared_cursor`` (read every row before the next statement)."""
+        if not self._pool.keeps_prepared:
+            return await self.cursor(dictionary=dictionary)
+        statements = self._pool.statements(self._raw)
+        entry = statements.get((sql, dictionary))
+        if entry is None:
+            entry = statements[(sql, dictionary)] = (sql, await self._raw.cursor(prepared=True, dictionary=dictionary))
+            self._pool._count("prepared")
+        sql, cur = entry
+        return metrics.AsyncPreparedCursor(cur, self._pool.name, sql, functools.partial(aexecute_prepared, cur))
+
+    async def is_connected(self) -> bool:
+        if self._released:
+            return False
+        if await self._raw.is_connected():
+            return True
+        await self._release(broken=True)
+        return False
+
+    async def close(self) -> None:
+        await self._release(broken=False)
+
+    async def _release(self, broken: bool) -> None:
+        if self._released:
+            return
+        self._released = True
+        await self._pool.release(self._raw, broken=broken)
+
+
+# Internals of mysql-connector's prepared cursors used to skip COM_STMT_RESET (checked against the
+# version pinned in requirements.txt); when one is missing the public ``cur.execute`` is used.
+_CURSOR_INTERNALS = ("_prepared", "_executed", "_connection", "_read_timeout", "_write_timeout", "_handle_result")
+
+
+def _can_skip_reset(cur, sql: str, params: tuple) -> bool:
+    """``sql`` is already prepared on ``cur`` and its previous result was read to the end."""
+    if not all(hasattr(cur, name) for name in _CURSOR_INTERNALS):
+        return False
+    connection = cur._connection
+    if not hasattr(connection, "cmd_stmt_execute") or getattr(connection, "unread_result", True):
+        return False
+    statement = cur._prepared
+    return (
+        isinstance(statement, dict)
+        and "statement_id" in statement
+        and cur._executed is sql
+        and len(statement.get("parameters") or ()) == len(params)
+    )
+
+
+def execute_prepared(cur, sql: str, params=()) -> None:
+    """``cur.execute(sql, params)`` on a kept prepared cursor, without the COM_STMT_RESET when it is not needed.
+
+    mysql-connector sends COM_STMT_RESET (one more round trip) before every
+    execute; it only discards what is left of the previous execution, so it
+    is skipped once the statement is prepared and its last result was fully
+    read (``metrics.PreparedCursor`` drains it). Other cursors (e.g. the C
+    extension's, or a connector version without these internals) take the
+    regular path.
+    """
+    params = tuple(params or ())
+    if not _can_skip_reset(cur, sql, params):
+        return cur.execute(sql, params)
+    statement = cur._prepared
+    result = cur._connection.cmd_stmt_execute(
+        statement["statement_id"],
+        data=params,
+        parameters=statement["parameters"],
+        read_timeout=cur._read_timeout,
+        write_timeout=cur._write_timeout,
+    )
+    cur._handle_result(result)
+
+
+async def aexecute_prepared(cur, sql: str, params=()) -> None:
+    """Async ``execute_prepared`` (``mysql.connector.aio`` prepared cursors)."""
+    params = tuple(params or ())
+    if not _can_skip_reset(cur, sql, params):
+        return await cur.execute(sql, params)
+    statement = cur._prepared
+    result = await cur._connection.cmd_stmt_execute(
+        statement["statement_id"],
+        data=params,
+        parameters=statement["parameters"],
+        read_timeout=cur._read_timeout,
+        write_timeout=cur._write_timeout,
+    )
+    await cur._handle_result(result)
+
+
+def _close_quietly(raw) -> None:
+    try:
+        raw.close()
+    except Exception:
+        pass
+
+
+async def _aclose_quietly(raw) -> None:
+    try:
+        await raw.close()
+    except Exception:
+        pass
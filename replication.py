@@ -0,0 +1,255 @@
+import threading
+import time
+from collections import deque
+
+import mysql.connector
+
+# Lag of the worker currently applying a transaction, measured from the time it
+# was committed on the source. Finer grained than Seconds_Behind_Source, which
+# MySQL only updates once per applied event.
+_WORKER_LAG_SQL = (
+    "SELECT MAX(TIMESTAMPDIFF(MICROSECOND, APPLYING_TRANSACTION_ORIGINAL_COMMIT_TIMESTAMP, NOW(6))) "
+    "FROM performance_schema.replication_applier_status_by_worker "
+    "WHERE APPLYING_TRANSACTION <> ''"
+)
+
+
+class ReplicaLagMonitor:
+    """Background sampler of replication lag for a set of replica nodes.
+
+    Every ``interval`` seconds each node is asked for ``SHOW REPLICA STATUS``
+    and the applier workers in ``performance_schema``; the last ``window``
+    samples are averaged into a rolling lag estimate. A node whose estimate
+    exceeds ``max_lag`` (or whose replication threads are stopped) is reported
+    as unhealthy so the router can leave it out of the read pool.
+    """
+
+    def __init__(self, nodes, checkout, interval: float = 2.0, window: int = 5, max_lag: float = 5.0):
+        self.nodes = list(nodes)
+        self.interval = float(interval)
+        self.max_lag = float(max_lag)
+        self._checkout = checkout
+        self._lock = threading.Lock()
+        self._samples = {node: deque(maxlen=max(1, int(window))) for node in self.nodes}
+        self._errors = {node: "" for node in self.nodes}
+        self._sampled_at = {node: None for node in self.nodes}
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        if self._thread is not None or not self.nodes or self.interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name="replica-lag-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    # ---------- queries ----------
+
+    def lag(self, node: str) -> float | None:
+        """Rolling lag estimate in seconds (None = unknown / replication broken)."""
+        with self._lock:
+            samples = self._samples.get(node)
+            if not samples or samples[-1] is None:
+                return None
+            return sum(samples) / len(samples)
+
+    def is_healthy(self, node: str) -> bool:
+        with self._lock:
+            samples = self._samples.get(node)
+            if samples is None or not samples:
+                # Not sampled yet: do not hold back reads while the monitor warms up.
+                return True
+            if samples[-1] is None:
+                return False
+        return self.lag(node) <= self.max_lag
+
+    def snapshot(self) -> dict:
+        return {
+            node: {
+                "lag_seconds": None if self.lag(node) is None else round(self.lag(node), 3),
+                "healthy": self.is_healthy(node),
+                "sampled_at": self._sampled_at[node],
+                "error": self._errors[node],
+            }
+            for node in self.nodes
+        }
+
+    # ---------- sampling ----------
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            for node in self.nodes:
+                lag, error = self._sample(node)
+                with self._lock:
+                    samples = self._samples[node]
+                    if lag is None or (samples and samples[-1] is None):
+                        # A broken replica must not keep an old, good-looking average
+                        # (and a recovered one starts a fresh one).
+                        samples.clear()
+                    samples.append(lag)
+                    self._errors[node] = error
+                    self._sampled_at[node] = time.time()
+            self._stop.wait(self.interval)
+
+    def _sample(self, node: str):
+        conn = self._checkout(node)
+        if conn is None:
+            return None, "không kết nối được"
+        cur = None
+        try:
+            cur = conn.cursor(dictionary=True)
+            try:
+                cur.execute("SHOW REPLICA STATUS")
+            except mysql.connector.Error:
+                # MySQL < 8.0.22
+                cur.execute("SHOW SLAVE STATUS")
+            channels = cur.fetchall()
+            if not channels:
+                # Not a replica (e.g. the primary listed as a read node): no lag.
+                return 0.0, ""
+
+            lag = 0.0
+            for status in channels:
+                io_running = status.get("Replica_IO_Running", status.get("Slave_IO_Running"))
+                sql_running = status.get("Replica_SQL_Running", status.get("Slave_SQL_Running"))
+                if io_running != "Yes" or sql_running != "Yes":
+                    error = status.get("Last_IO_Error") or status.get("Last_SQL_Error") or "replication stopped"
+                    return None, error
+                behind = status.get("Seconds_Behind_Source", status.get("Seconds_Behind_Master"))
+                lag = max(lag, float(behind or 0))
+
+            cur.execute(_WORKER_LAG_SQL)
+            row = cur.fetchone()
+            worker_micros = next(iter(row.values())) if row else None
+            if worker_micros is not None:
+                lag = max(lag, float(worker_micros) / 1_000_000)
+            return lag, ""
+        except mysql.connector.Error as err:
+            return None, str(err)
+        finally:
+            if cur is not None:
+                try:
+                    cur.close()
+                except mysql.connector.Error:
+                    pass
+            conn.close()
+
+
+class TopologyMonitor:
+    """Discovers the writable node among ``nodes`` at runtime.
+
+    Every ``interval`` seconds each node is asked for ``@@read_only``,
+    ``@@super_read_only`` and whether it replicates from another node. The
+    writable node (read_only = super_read_only = 0) is the PRIMARY; if
+    several are writable, one that is not itself a replica wins, then
+    ``preferred``. ``refresh_soon()`` (called after a write error) triggers a
+    new round right away, so a promoted replica takes writes within seconds.
+    Until the first round completes, ``primary()`` returns ``preferred``.
+    """
+
+    def __init__(self, nodes, checkout, interval: float = 2.0, preferred: str | None = None):
+        self.nodes = list(dict.fromkeys(nodes))
+        self.interval = float(interval)
+        self.preferred = preferred
+        self._checkout = checkout
+        self._lock = threading.Lock()
+        self._primary = preferred
+        self._discovered = False
+        self._states = {node: {} for node in self.nodes}
+        self._changed_at = None
+        self._thread = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        if self._thread is not None or not self.nodes or self.interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name="topology-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def primary(self) -> str | None:
+        with self._lock:
+            return self._primary
+
+    def refresh_soon(self) -> None:
+        self._wake.set()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "primary": self._primary,
+                "discovered": self._discovered,
+                "changed_at": self._changed_at,
+                "nodes": {node: dict(state) for node, state in self._states.items()},
+            }
+
+    # ---------- discovery ----------
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.refresh()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def refresh(self) -> str | None:
+        states = {node: self._probe(node) for node in self.nodes}
+        writable = [
+            node
+            for node, s in states.items()
+            if s.get("reachable") and not s.get("read_only") and not s.get("super_read_only")
+        ]
+        # A writable node that still replicates from someone is a half-finished promotion.
+        writable.sort(key=lambda node: (bool(states[node].get("replicating")), node != self.preferred))
+        primary = writable[0] if writable else None
+        with self._lock:
+            if primary != self._primary:
+                self._changed_at = time.time()
+            self._primary = primary
+            self._discovered = True
+            self._states = states
+        return primary
+
+    def _probe(self, node: str) -> dict:
+        conn = self._checkout(node)
+        if conn is None:
+            return {"reachable": False, "checked_at": time.time()}
+        cur = None
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT @@GLOBAL.read_only, @@GLOBAL.super_read_only")
+            read_only, super_read_only = cur.fetchone()
+            try:
+                cur.execute("SHOW REPLICA STATUS")
+            except mysql.connector.Error:
+                cur.execute("SHOW SLAVE STATUS")
+            columns = [d[0] for d in cur.description or []]
+            channels = [dict(zip(columns, row)) for row in cur.fetchall()]
+            sources = [
+                ch.get("Source_Host", ch.get("Master_Host"))
+                for ch in channels
+                if ch.get("Replica_IO_Running", ch.get("Slave_IO_Running")) == "Yes"
+                or ch.get("Replica_SQL_Running", ch.get("Slave_SQL_Running")) == "Yes"
+            ]
+            return {
+                "reachable": True,
+                "read_only": bool(read_only),
+                "super_read_only": bool(super_read_only),
+                "replicating": bool(sources),
+                "source": sources[0] if sources else None,
+                "checked_at": time.time(),
+            }
+        except mysql.connector.Error as err:
+            return {"reachable": False, "error": str(err), "checked_at": time.time()}
+        finally:
+            if cur is not None:
+                try:
+                    cur.close()
+                except mysql.connector.Error:
+                    pass
+            conn.close()
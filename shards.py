@@ -0,0 +1,94 @@
+"""Shard map: students (with their scores and accounts) partitioned by id range.
+
+Each shard is a primary/replica group that owns a contiguous range of
+``students.id``; ``scores`` and the student's ``users`` row live on the same
+shard (foreign keys stay local). ``subjects`` is a reference table present on
+every shard, so the scores LEFT JOIN never leaves the shard.
+
+``DB_SHARDS`` format (shards separated by ``;``, replicas by ``,``)::
+
+    1-499999=10.0.0.1|10.0.0.2,10.0.0.3;500000-=10.0.1.1|10.0.1.2
+
+``low-high`` is inclusive; the last range may be open (``500000-``). New
+students are created on the shard with the highest range, whose
+``AUTO_INCREMENT`` must start inside it (``ALTER TABLE students
+AUTO_INCREMENT = 500000``).
+"""
+
+import bisect
+
+
+class UnroutedStudent(ValueError):
+    """A student id no shard of ``DB_SHARDS`` owns (gap between ranges, below the first one, not a number)."""
+
+
+class Shard:
+    def __init__(self, name: str, low: int, high: int | None, primary: str, replicas=()):
+        self.name = name
+        self.low = int(low)
+        self.high = None if high is None else int(high)
+        self.primary = primary
+        self.replicas = [node for node in replicas if node != primary]
+
+    def owns(self, student_id: int) -> bool:
+        return student_id >= self.low and (self.high is None or student_id <= self.high)
+
+    @property
+    def nodes(self) -> list[str]:
+        return [self.primary] + self.replicas
+
+    def range_text(self) -> str:
+        return f"{self.low}–{'∞' if self.high is None else self.high}"
+
+    def __repr__(self) -> str:
+        return f"Shard({self.name}, {self.range_text()}, primary={self.primary})"
+
+
+def parse_shards(spec: str) -> list[Shard]:
+    """Parse ``DB_SHARDS``; raises ``ValueError`` on a malformed or overlapping map."""
+    shards = []
+    for index, part in enumerate(p.strip() for p in spec.split(";")):
+        if not part:
+            continue
+        id_range, sep, nodes = part.partition("=")
+        low, dash, high = id_range.strip().partition("-")
+        primary, _, replicas = nodes.partition("|")
+        if not sep or not dash or not low.strip() or not primary.strip():
+            raise ValueError(f"DB_SHARDS: không hiểu '{part}' (dạng low-high=primary|replica1,replica2)")
+        shards.append(
+            Shard(
+                f"shard{index + 1}",
+                int(low),
+                int(high) if high.strip() else None,
+                primary.strip(),
+                [node.strip() for node in replicas.split(",") if node.strip()],
+            )
+        )
+
+    shards.sort(key=lambda shard: shard.low)
+    for prev, shard in zip(shards, shards[1:]):
+        if prev.high is None or prev.high >= shard.low:
+            raise ValueError(f"DB_SHARDS: {prev.name} ({prev.range_text()}) chồng lên {shard.name} ({shard.range_text()})")
+    return shards
+
+
+class ShardMap:
+    """Lookup of the owning shard of a student id (shards sorted by range)."""
+
+    def __init__(self, shards: list[Shard]):
+        self.shards = sorted(shards, key=lambda shard: shard.low)
+        self._lows = [shard.low for shard in self.shards]
+        self._by_node = {node: shard for shard in self.shards for node in shard.nodes}
+
+    def for_student(self, student_id: int) -> Shard | None:
+        index = bisect.bisect_right(self._lows, student_id) - 1
+        if index < 0:
+            return None
+        shard = self.shards[index]
+        return shard if shard.owns(student_id) else None
+
+    def for_new_student(self) -> Shard:
+        return self.shards[-1]
+
+    def for_node(self, node: str) -> Shard | None:
+        return self._by_node.get(node)
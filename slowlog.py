@@ -0,0 +1,181 @@
+"""Application-side slow query log.
+
+Statements slower than the threshold (timed by ``metrics.InstrumentedCursor``)
+are written as JSON lines to a size-rotated log: SQL, parameters, duration,
+node and the handler that ran it. The first time a query *shape* (the SQL with
+literals replaced by ``?``) is seen slow, a background thread runs
+``EXPLAIN FORMAT=JSON`` for it on the same node and logs the plan, so
+full scans / missing indexes show up without touching the request path.
+
+Example line::
+
+    {"event": "slow_query", "ts": "...", "duration_ms": 812.4, "node": "10.0.0.2",
+     "handler": "teacher_load_scores_grid", "shape_id": "3f2a...", "sql": "...", "params": [42]}
+"""
+
+import hashlib
+import json
+import logging
+import queue
+import re
+import threading
+import time
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+import mysql.connector
+
+import metrics
+
+_EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE")
+_MAX_PARAM_LEN = 200
+_MAX_PARAMS = 20
+
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def query_shape(sql) -> str:
+    """SQL with literals / placeholders as ``?`` and value lists collapsed (one shape per query)."""
+    shape = _STRING_RE.sub("?", str(sql))
+    shape = _NUMBER_RE.sub("?", shape).replace("%s", "?")
+    shape = _PLACEHOLDER_LIST_RE.sub("(?+)", shape)
+    # Multi-row VALUES (...),(...) -> one group.
+    shape = re.sub(r"(\(\?\+\))(?:\s*,\s*\(\?\+\))+", r"\1", shape)
+    return _SPACE_RE.sub(" ", shape).strip()
+
+
+def _safe_params(sql, params):
+    if params is None:
+        return None
+    if "password" in str(sql).lower():
+        return "***"
+    if isinstance(params, dict):
+        items = list(params.items())[:_MAX_PARAMS]
+        return {str(k): _safe_value(v) for k, v in items}
+    values = list(params)
+    if values and isinstance(values[0], (list, tuple)):
+        # executemany: log the batch size and the first row only.
+        return {"rows": len(values), "first": [_safe_value(v) for v in values[0]]}
+    return [_safe_value(v) for v in values[:_MAX_PARAMS]]
+
+
+def _safe_value(value):
+    if value is None or isinstance(value, (int, float, bool)):
+        return value
+    text = str(value)
+    return text if len(text) <= _MAX_PARAM_LEN else text[:_MAX_PARAM_LEN] + "…"
+
+
+class SlowQueryLog:
+    """Logs statements slower than ``threshold`` seconds; EXPLAINs each new shape once.
+
+    ``checkout(node)`` returns a connection to ``node`` (or None) for the
+    EXPLAIN worker, like the lag monitor's.
+    """
+
+    def __init__(self, path: str, threshold: float, checkout, max_bytes: int = 10 * 1024 * 1024, backups: int = 5):
+        self.threshold = float(threshold)
+        self._checkout = checkout
+        self._logger = logging.getLogger("slow_query")
+        self._logger.setLevel(logging.INFO)
+        self._logger.propagate = False
+        if not self._logger.handlers:
+            handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8", delay=True)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._logger.addHandler(handler)
+        self._explained: set[str] = set()
+        self._lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue(maxsize=100)
+        self._thread = None
+
+    def observe(self, node: str, sql, params, seconds: float, error) -> None:
+        """``metrics`` query observer: cheap unless the statement was slow."""
+        if seconds < self.threshold:
+            return
+        shape = query_shape(sql)
+        shape_id = hashlib.sha1(shape.encode("utf-8")).hexdigest()[:12]
+        record = {
+            "event": "slow_query",
+            "ts": datetime.now().isoformat(timespec="milliseconds"),
+            "duration_ms": round(seconds * 1000, 1),
+            "threshold_ms": round(self.threshold * 1000, 1),
+            "node": node,
+            "handler": metrics.current_handler.get() or None,
+            "shape_id": shape_id,
+            "sql": str(sql),
+            "params": _safe_params(sql, params),
+        }
+        if error is not None:
+            record["errno"] = getattr(error, "errno", None)
+        self._write(record)
+
+        with self._lock:
+            if shape_id in self._explained:
+                return
+            self._explained.add(shape_id)
+        if metrics.statement_kind(sql) in _EXPLAINABLE and not _is_many(params):
+            self._start()
+            try:
+                self._queue.put_nowait((node, shape_id, shape, str(sql), params))
+            except queue.Full:
+                # Try again next time this shape is slow.
+                with self._lock:
+                    self._explained.discard(shape_id)
+
+    # ---------- EXPLAIN worker ----------
+
+    def _start(self) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="slow-query-explain", daemon=True)
+                    self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            node, shape_id, shape, sql, params = self._queue.get()
+            started = time.perf_counter()
+            plan, error = self._explain(node, sql, params)
+            record = {
+                "event": "explain",
+                "ts": datetime.now().isoformat(timespec="milliseconds"),
+                "node": node,
+                "shape_id": shape_id,
+                "shape": shape,
+                "explain_ms": round((time.perf_counter() - started) * 1000, 1),
+            }
+            if error:
+                record["error"] = error
+            else:
+                record["plan"] = plan
+            self._write(record)
+
+    def _explain(self, node: str, sql: str, params):
+        conn = self._checkout(node)
+        if conn is None:
+            return None, "không kết nối được"
+        cur = None
+        try:
+            cur = conn.cursor()
+            cur.execute("EXPLAIN FORMAT=JSON " + sql, params or ())
+            row = cur.fetchone()
+            return (json.loads(row[0]) if row else None), None
+        except (mysql.connector.Error, ValueError) as err:
+            return None, str(err)
+        finally:
+            if cur is not None:
+                try:
+                    cur.close()
+                except mysql.connector.Error:
+                    pass
+            conn.close()
+
+    def _write(self, record: dict) -> None:
+        self._logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+
+def _is_many(params) -> bool:
+    return isinstance(params, (list, tuple)) and bool(params) and isinstance(params[0], (list, tuple))
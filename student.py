@@ -1,64 +1,90 @@
 import mysql.connector
 
+import changes
 from db import (
-    ROLE,
     _node_info,
     _parse_date,
     _require_login,
     _write_blocked_message,
-    get_db_connection,
+    can_write,
+    read_connection,
+    remember_write,
+    shard_for_student,
+    write_connection,
 )
+from metrics import instrumented
+from shards import UnroutedStudent
+from summary import SUMMARY_SQL, shard_rank, summary_row, summary_text
 
 
-def student_load_profile(session: dict | None):
+_PROFILE_SQL = "SELECT id, full_name, class_name, email, date_of_birth, address FROM students WHERE id=%s"
+
+_SCORES_SQL = (
+    "SELECT s.subject_code, s.subject_name, s.credits, sc.score "
+    "FROM subjects s "
+    "LEFT JOIN scores sc ON sc.subject_id=s.id AND sc.student_id=%s "
+    "ORDER BY s.id"
+)
+
+
+def _require_student(session: dict | None):
+    """(student_id, "") for a logged-in student, else (None, message)."""
     ok, msg = _require_login(session)
     if not ok:
-        return "", "", "", "", "", msg, ""
+        return None, msg
     if session.get("role") != "student":
-        return "", "", "", "", "", "❌ Chỉ Student mới dùng chức năng này.", ""
+        return None, "❌ Chỉ Student mới dùng chức năng này."
 
     sid = session.get("student_id")
     if not sid:
-        return "", "", "", "", "", "❌ Tài khoản student chưa được gán student_id.", ""
-
-    conn = get_db_connection()
-    if conn is None:
-        return "", "", "", "", "", "❌ Không kết nối được database local.", ""
+        return None, "❌ Tài khoản student chưa được gán student_id."
+    return sid, ""
+
+
+def _profile_result(row):
+    if not row:
+        return "", "", "", "", "", "❌ Không tìm thấy hồ sơ sinh viên.", _node_info()
+    dob = row["date_of_birth"].strftime("%Y-%m-%d") if row["date_of_birth"] else ""
+    return (
+        row.get("full_name") or "",
+        row.get("class_name") or "",
+        row.get("email") or "",
+        dob,
+        row.get("address") or "",
+        "✅ Đã tải hồ sơ.",
+        _node_info(),
+    )
+
+
+@instrumented
+def student_load_profile(session: dict | None):
+    sid, msg = _require_student(session)
+    if not sid:
+        return "", "", "", "", "", msg, ""
 
     try:
-        cur = conn.cursor(dictionary=True)
-        cur.execute(
-            "SELECT id, full_name, class_name, email, date_of_birth, address FROM students WHERE id=%s",
-            (int(sid),),
-        )
-        row = cur.fetchone()
-        if not row:
-            return "", "", "", "", "", "❌ Không tìm thấy hồ sơ sinh viên.", _node_info()
-        dob = row["date_of_birth"].strftime("%Y-%m-%d") if row["date_of_birth"] else ""
-        return (
-            row.get("full_name") or "",
-            row.get("class_name") or "",
-            row.get("email") or "",
-            dob,
-            row.get("address") or "",
-            "✅ Đã tải hồ sơ.",
-            _node_info(),
-        )
-    except (mysql.connector.Error, ValueError) as err:
-        return "", "", "", "", "", f"❌ Lỗi: {err}", ""
-    finally:
-        if conn and conn.is_connected():
-            cur.close()
-            conn.close()
-
-
+        shard = shard_for_student(sid)
+    except UnroutedStudent as err:
+        return "", "", "", "", "", f"❌ {err}", ""
+    with read_connection(session, shard) as conn:
+        if conn is None:
+            return "", "", "", "", "", "❌ Không kết nối được database local.", ""
+        try:
+            with conn.cursor(dictionary=True) as cur:
+                cur.execute(_PROFILE_SQL, (int(sid),))
+                return _profile_result(cur.fetchone())
+        except (mysql.connector.Error, ValueError) as err:
+            return "", "", "", "", "", f"❌ Lỗi: {err}", ""
+
+
+@instrumented
 def student_update_profile(session: dict | None, full_name, email, date_of_birth, address):
     ok, msg = _require_login(session)
     if not ok:
         return msg
     if session.get("role") != "student":
         return "❌ Chỉ Student mới có quyền cập nhật thông tin cá nhân."
-    if ROLE == "replica":
+    if not can_write():
         return _write_blocked_message()
 
     sid = session.get("student_id")
@@ -71,57 +97,53 @@ def student_update_profile(session: dict | None, full_name, email, date_of_birth
     if dob == "__invalid__":
         return "⚠️ Ngày sinh không hợp lệ. Định dạng đúng: YYYY-MM-DD."
 
-    conn = get_db_connection()
-    if conn is None:
-        return "❌ Không kết nối được database local."
-
     try:
-        cur = conn.cursor()
-        # Student chỉ được ghi: full_name, address, date_of_birth, email
-        cur.execute(
-            "UPDATE students SET full_name=%s, email=%s, date_of_birth=%s, address=%s WHERE id=%s",
-            (full_name, email, None if dob is None else dob, address, int(sid)),
-        )
-        conn.commit()
-        return "✅ Đã cập nhật thông tin cá nhân."
-    except (mysql.connector.Error, ValueError) as err:
-        return f"❌ Lỗi: {err}"
-    finally:
-        if conn and conn.is_connected():
-            cur.close()
-            conn.close()
-
-
+        shard = shard_for_student(sid)
+    except UnroutedStudent as err:
+        return f"❌ {err}"
+    with write_connection(shard) as conn:
+        if conn is None:
+            return "❌ Không kết nối được database local."
+        try:
+            with conn.cursor() as cur:
+                # Student chỉ được ghi: full_name, address, date_of_birth, email
+                cur.execute(
+                    "UPDATE students SET full_name=%s, email=%s, date_of_birth=%s, address=%s WHERE id=%s",
+                    (full_name, email, None if dob is None else dob, address, int(sid)),
+                )
+            conn.commit()
+            remember_write(session, conn, shard)
+        except (mysql.connector.Error, ValueError) as err:
+            return f"❌ Lỗi: {err}"
+    changes.publish("students", [int(sid)])
+    return "✅ Đã cập nhật thông tin cá nhân."
+
+
+@instrumented
 def student_scores_table(session: dict | None):
-    ok, msg = _require_login(session)
-    if not ok:
-        return [], msg, ""
-    if session.get("role") != "student":
-        return [], "❌ Chỉ Student mới dùng chức năng này.", ""
+    """Scores table of the logged-in student + GPA / credits / class rank summary.
 
-    sid = session.get("student_id")
+    The scores query is prepared only with ``DB_PREPARED_STATEMENTS`` (off while the pool resets sessions).
+    """
+    sid, msg = _require_student(session)
     if not sid:
-        return [], "❌ Tài khoản student chưa được gán student_id.", ""
-
-    conn = get_db_connection()
-    if conn is None:
-        return [], "❌ Không kết nối được database local.", ""
+        return [], msg, "", ""
 
     try:
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT s.subject_code, s.subject_name, s.credits, sc.score "
-            "FROM subjects s "
-            "LEFT JOIN scores sc ON sc.subject_id=s.id AND sc.student_id=%s "
-            "ORDER BY s.id",
-            (int(sid),),
-        )
-        rows = cur.fetchall() or []
-        table = [list(r) for r in rows]
-        return table, "", _node_info()
-    except (mysql.connector.Error, ValueError) as err:
-        return [], f"❌ Lỗi: {err}", ""
-    finally:
-        if conn and conn.is_connected():
-            cur.close()
-            conn.close()
+        shard = shard_for_student(sid)
+    except UnroutedStudent as err:
+        return [], f"❌ {err}", "", ""
+    with read_connection(session, shard) as conn:
+        if conn is None:
+            return [], "❌ Không kết nối được database local.", "", ""
+        try:
+            with conn.prepared_cursor(_SCORES_SQL) as cur:
+                cur.execute(_SCORES_SQL, (int(sid),))
+                table = [list(r) for r in cur.fetchall() or []]
+            node = _node_info()
+            with conn.cursor() as cur:
+                cur.execute(SUMMARY_SQL, (int(sid),))
+                summary = shard_rank(session, summary_row(cur.fetchone()))
+            return table, "", node, summary_text(summary)
+        except (mysql.connector.Error, ValueError) as err:
+            return [], f"❌ Lỗi: {err}", "", ""
@@ -0,0 +1,52 @@
+"""Async versions of the student read handlers (see ``db_async``)."""
+
+import mysql.connector
+
+import db_async
+from db import _node_info, shard_for_student
+from metrics import instrumented
+from shards import UnroutedStudent
+from student import _PROFILE_SQL, _SCORES_SQL, _profile_result, _require_student
+from summary import SUMMARY_SQL, async_shard_rank, summary_row, summary_text
+
+
+@instrumented
+async def student_load_profile(session: dict | None):
+    sid, msg = _require_student(session)
+    if not sid:
+        return "", "", "", "", "", msg, ""
+
+    try:
+        shard = shard_for_student(sid)
+    except UnroutedStudent as err:
+        return "", "", "", "", "", f"❌ {err}", ""
+    async with db_async.read_connection(session, shard) as conn:
+        if conn is None:
+            return "", "", "", "", "", "❌ Không kết nối được database local.", ""
+        try:
+            row = await db_async.fetch(conn, _PROFILE_SQL, (int(sid),), dictionary=True, one=True)
+        except (mysql.connector.Error, ValueError) as err:
+            return "", "", "", "", "", f"❌ Lỗi: {err}", ""
+    return _profile_result(row)
+
+
+@instrumented
+async def student_scores_table(session: dict | None):
+    sid, msg = _require_student(session)
+    if not sid:
+        return [], msg, "", ""
+
+    try:
+        shard = shard_for_student(sid)
+    except UnroutedStudent as err:
+        return [], f"❌ {err}", "", ""
+    async with db_async.read_connection(session, shard) as conn:
+        if conn is None:
+            return [], "❌ Không kết nối được database local.", "", ""
+        try:
+            rows = await db_async.fetch(conn, _SCORES_SQL, (int(sid),), prepared=True)
+            node = _node_info()
+            summary = summary_row(await db_async.fetch(conn, SUMMARY_SQL, (int(sid),), one=True))
+            return [list(r) for r in rows], "", node, summary_text(await async_shard_rank(session, summary))
+        except (mysql.connector.Error, ValueError) as err:
+            return [], f"❌ Lỗi: {err}", "", ""
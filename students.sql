@@ -13,25 +13,60 @@ CREATE TABLE IF NOT EXISTS students (
     address VARCHAR(255) NULL,
     date_of_birth DATE NULL,
     email VARCHAR(120) NULL,
-    class_name VARCHAR(50) NULL
+    class_name VARCHAR(50) NULL,
+    -- Mốc thay đổi cho delta refresh (MySQL tự cập nhật khi INSERT/UPDATE)
+    updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+    -- Lọc theo lớp + phân trang keyset (WHERE class_name=? AND id > ? ORDER BY id)
+    INDEX idx_students_class (class_name, id),
+    INDEX idx_students_updated (updated_at)
 );
 
 CREATE TABLE IF NOT EXISTS subjects (
     id INT AUTO_INCREMENT PRIMARY KEY,
     subject_code VARCHAR(20) NOT NULL UNIQUE,
     subject_name VARCHAR(120) NOT NULL,
-    credits INT NOT NULL DEFAULT 3
+    credits INT NOT NULL DEFAULT 3,
+    updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+    INDEX idx_subjects_updated (updated_at)
 );
 
 CREATE TABLE IF NOT EXISTS scores (
     student_id INT NOT NULL,
     subject_id INT NOT NULL,
     score DECIMAL(4,2) NULL,
+    -- Delta của lưới điểm theo sinh viên đọc theo khoá chính (student_id, ...), không cần index riêng
+    updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
     PRIMARY KEY (student_id, subject_id),
     CONSTRAINT fk_scores_student FOREIGN KEY (student_id) REFERENCES students(id) ON DELETE CASCADE,
     CONSTRAINT fk_scores_subject FOREIGN KEY (subject_id) REFERENCES subjects(id) ON DELETE CASCADE
 );
 
+-- Tombstone cho delta refresh: app ghi 1 dòng khi xoá sinh viên / môn học (cùng transaction).
+-- Xoá dây chuyền qua FK không kích hoạt trigger nên không dùng trigger; điểm bị xoá theo FK
+-- được suy ra từ tombstone của sinh viên / môn học. Dòng cũ hơn DELTA_TOMBSTONE_RETENTION được dọn.
+CREATE TABLE IF NOT EXISTS deleted_rows (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    table_name VARCHAR(30) NOT NULL,
+    row_key VARCHAR(64) NOT NULL,
+    deleted_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    INDEX idx_deleted_table_time (table_name, deleted_at)
+);
+
+-- Tổng hợp theo sinh viên: GPA theo tín chỉ, tín chỉ tích luỹ (điểm >= 4), số môn có điểm, hạng trong lớp.
+-- App cập nhật trong cùng transaction với các thao tác ghi điểm/môn/sinh viên (summary.py);
+-- `python summary.py` tính lại toàn bộ.
+CREATE TABLE IF NOT EXISTS student_summary (
+    student_id INT PRIMARY KEY,
+    class_name VARCHAR(50) NULL,
+    gpa DECIMAL(6,3) NULL,
+    credits_earned INT NOT NULL DEFAULT 0,
+    graded_count INT NOT NULL DEFAULT 0,
+    class_rank INT NULL,
+    -- Xếp hạng / sĩ số theo lớp
+    INDEX idx_summary_class_gpa (class_name, gpa),
+    CONSTRAINT fk_summary_student FOREIGN KEY (student_id) REFERENCES students(id) ON DELETE CASCADE
+);
+
 -- =========================
 -- Simple login table for Gradio demo
 -- NOTE: plain-text password is ONLY for classroom demo.
@@ -99,6 +134,28 @@ ON DUPLICATE KEY UPDATE
     role=VALUES(role),
     student_id=VALUES(student_id);
 
+INSERT INTO student_summary (student_id, class_name, gpa, credits_earned, graded_count)
+SELECT st.id, st.class_name,
+       ROUND(SUM(sc.score * sj.credits) / NULLIF(SUM(CASE WHEN sc.score IS NOT NULL THEN sj.credits END), 0), 3),
+       COALESCE(SUM(CASE WHEN sc.score >= 4 THEN sj.credits END), 0),
+       COUNT(sc.score)
+FROM students st
+LEFT JOIN scores sc ON sc.student_id = st.id
+LEFT JOIN subjects sj ON sj.id = sc.subject_id
+GROUP BY st.id, st.class_name
+ON DUPLICATE KEY UPDATE
+    class_name=VALUES(class_name),
+    gpa=VALUES(gpa),
+    credits_earned=VALUES(credits_earned),
+    graded_count=VALUES(graded_count);
+
+UPDATE student_summary ss
+JOIN (
+    SELECT student_id, RANK() OVER (PARTITION BY class_name ORDER BY gpa DESC) AS class_rank
+    FROM student_summary WHERE gpa IS NOT NULL
+) ranked ON ranked.student_id = ss.student_id
+SET ss.class_rank = ranked.class_rank;
+
 -- Create replication user (to be executed on Primary)
 DROP USER IF EXISTS 'repl'@'%';
 CREATE USER IF NOT EXISTS 'repl'@'%' IDENTIFIED BY 'replpass';
@@ -0,0 +1,217 @@
+"""Per-student summary table: credit-weighted GPA, credits earned, graded subjects, class rank.
+
+``student_summary`` is derived from ``scores`` × ``subjects.credits``. Every
+write that changes the inputs refreshes the affected rows *in the same
+transaction* (``refresh_students`` / ``refresh_subject``), so dashboards read
+one row by primary key instead of aggregating on every view:
+
+- score upsert / grid save -> that student;
+- subject credits changed / subject deleted -> students graded in it;
+- student created / updated (class change) / deleted -> that student and its classes.
+
+``class_rank`` is ``RANK()`` over the class by GPA (ungraded students: NULL),
+recomputed for the touched classes only. With sharding a class can span
+shards, so the rank shown is re-counted across shards on read.
+
+CLI (repair / after bulk loads)::
+
+    python summary.py            # full rebuild on every PRIMARY (each shard)
+"""
+
+import argparse
+import time
+
+import mysql.connector
+
+import db_async
+from db import all_shards, get_write_connection, scatter_read, sharding_enabled
+
+# Điểm tối thiểu để môn được tính vào số tín chỉ tích luỹ (thang 10, từ điểm D).
+PASS_SCORE = 4.0
+# Số sinh viên mỗi câu IN (...) khi một môn học đổi tín chỉ / bị xoá.
+_REFRESH_CHUNK = 1000
+
+_SELECT_SUMMARY = (
+    "SELECT st.id, st.class_name, "
+    "ROUND(SUM(sc.score * sj.credits) / NULLIF(SUM(CASE WHEN sc.score IS NOT NULL THEN sj.credits END), 0), 3), "
+    f"COALESCE(SUM(CASE WHEN sc.score >= {PASS_SCORE} THEN sj.credits END), 0), "
+    "COUNT(sc.score) "
+    "FROM students st "
+    "LEFT JOIN scores sc ON sc.student_id = st.id "
+    "LEFT JOIN subjects sj ON sj.id = sc.subject_id"
+)
+_UPSERT_SUMMARY = (
+    "INSERT INTO student_summary (student_id, class_name, gpa, credits_earned, graded_count) "
+    "{select} GROUP BY st.id, st.class_name "
+    "ON DUPLICATE KEY UPDATE class_name=VALUES(class_name), gpa=VALUES(gpa), "
+    "credits_earned=VALUES(credits_earned), graded_count=VALUES(graded_count)"
+)
+_RANK_SQL = (
+    "UPDATE student_summary ss "
+    "JOIN (SELECT student_id, RANK() OVER (PARTITION BY class_name ORDER BY gpa DESC) AS class_rank "
+    "      FROM student_summary WHERE gpa IS NOT NULL{where}) ranked "
+    "ON ranked.student_id = ss.student_id "
+    "SET ss.class_rank = ranked.class_rank "
+    "WHERE NOT (ss.class_rank <=> ranked.class_rank)"
+)
+_UNRANK_SQL = "UPDATE student_summary SET class_rank = NULL WHERE gpa IS NULL AND class_rank IS NOT NULL{where}"
+
+# Đọc cho dashboard: 1 dòng theo khoá chính + sĩ số có điểm của lớp (index (class_name, gpa)).
+SUMMARY_SQL = (
+    "SELECT ss.gpa, ss.credits_earned, ss.graded_count, ss.class_rank, ss.class_name, "
+    "(SELECT COUNT(*) FROM student_summary c WHERE c.class_name = ss.class_name AND c.gpa IS NOT NULL) AS class_size "
+    "FROM student_summary ss WHERE ss.student_id = %s"
+)
+# Với sharding: số bạn cùng lớp có GPA cao hơn + sĩ số, trên từng shard.
+SHARD_RANK_SQL = (
+    "SELECT COALESCE(SUM(gpa > %s), 0), COUNT(*) FROM student_summary "
+    "WHERE class_name = %s AND gpa IS NOT NULL"
+)
+
+
+def _in_list(values) -> str:
+    return ",".join(["%s"] * len(values))
+
+
+def refresh_statements(student_ids) -> list[tuple[str, tuple]]:
+    """(sql, params) recomputing the rows of ``student_ids`` and re-ranking their classes.
+
+    No statement returns rows, so the list runs as-is on a sync or async cursor.
+    """
+    ids = tuple(sorted({int(student_id) for student_id in student_ids}))
+    if not ids:
+        return []
+    marks = _in_list(ids)
+    classes = f" AND class_name IN (SELECT class_name FROM students WHERE id IN ({marks}))"
+    return [
+        (_UPSERT_SUMMARY.format(select=f"{_SELECT_SUMMARY} WHERE st.id IN ({marks})"), ids),
+        (_RANK_SQL.format(where=classes), ids),
+        (_UNRANK_SQL.format(where=classes), ids),
+    ]
+
+
+def refresh_students(cur, student_ids, old_classes=()) -> None:
+    """Refresh ``student_ids`` in the caller's transaction; ``old_classes``: classes they just left."""
+    ids = sorted({int(student_id) for student_id in student_ids})
+    for start in range(0, len(ids), _REFRESH_CHUNK):
+        for sql, params in refresh_statements(ids[start : start + _REFRESH_CHUNK]):
+            cur.execute(sql, params)
+    rerank_classes(cur, old_classes)
+
+
+def students_graded_in(cur, subject_id) -> list[int]:
+    cur.execute("SELECT student_id FROM scores WHERE subject_id = %s", (int(subject_id),))
+    return [row[0] for row in cur.fetchall()]
+
+
+def refresh_subject(cur, subject_id) -> None:
+    """After a credits change: refresh every student graded in ``subject_id``."""
+    refresh_students(cur, students_graded_in(cur, subject_id))
+
+
+def rerank_classes(cur, class_names) -> None:
+    classes = sorted({name for name in class_names if name is not None})
+    if not classes:
+        return
+    where = f" AND class_name IN ({_in_list(classes)})"
+    cur.execute(_RANK_SQL.format(where=where), classes)
+    cur.execute(_UNRANK_SQL.format(where=where), classes)
+
+
+def class_of(cur, student_id) -> str | None:
+    cur.execute("SELECT class_name FROM students WHERE id = %s", (int(student_id),))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def rebuild(cur) -> int:
+    """Recompute the whole table (caller commits); returns the number of students."""
+    cur.execute("DELETE FROM student_summary")
+    cur.execute(_UPSERT_SUMMARY.format(select=_SELECT_SUMMARY))
+    cur.execute("SELECT COUNT(*) FROM student_summary")
+    count = int(cur.fetchone()[0])
+    cur.execute(_RANK_SQL.format(where=""))
+    return count
+
+
+# ---------- dashboards ----------
+
+
+SUMMARY_COLUMNS = ("gpa", "credits_earned", "graded_count", "class_rank", "class_name", "class_size")
+
+
+def summary_row(values) -> dict | None:
+    """A ``SUMMARY_SQL`` row (tuple) as a dict; None if the student has no summary row yet."""
+    return dict(zip(SUMMARY_COLUMNS, values)) if values else None
+
+
+def needs_shard_rank(row: dict | None) -> bool:
+    return sharding_enabled() and bool(row) and row["gpa"] is not None and row["class_name"] is not None
+
+
+def shard_rank(session: dict | None, row: dict | None) -> dict | None:
+    """``row`` with rank / class size counted across every shard (unchanged when not sharded)."""
+    if not needs_shard_rank(row):
+        return row
+    return with_shard_rank(row, scatter_read(session, SHARD_RANK_SQL, (row["gpa"], row["class_name"])))
+
+
+async def async_shard_rank(session: dict | None, row: dict | None) -> dict | None:
+    """Async ``shard_rank`` (for the ``*_async`` handlers)."""
+    if not needs_shard_rank(row):
+        return row
+    return with_shard_rank(row, await db_async.scatter_fetch(session, SHARD_RANK_SQL, (row["gpa"], row["class_name"])))
+
+
+def with_shard_rank(row: dict, parts) -> dict:
+    higher = sum(int(rows[0][0] or 0) for rows in parts if rows)
+    size = sum(int(rows[0][1] or 0) for rows in parts if rows)
+    return {**row, "class_rank": higher + 1, "class_size": size}
+
+
+def summary_text(row: dict | None) -> str:
+    if not row or not row.get("graded_count"):
+        return "📊 Chưa có điểm nào để tính GPA."
+    text = (
+        f"📊 GPA (theo tín chỉ): **{float(row['gpa']):.2f}** · "
+        f"Tín chỉ tích luỹ: **{row['credits_earned']}** · "
+        f"Số môn có điểm: **{row['graded_count']}**"
+    )
+    if row.get("class_name") and row.get("class_rank"):
+        text += f" · Hạng trong lớp {row['class_name']}: **{row['class_rank']}/{row['class_size']}**"
+    return text
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Tính lại toàn bộ bảng student_summary (GPA, tín chỉ, hạng).")
+    parser.parse_args(argv)
+
+    for shard in all_shards() or [None]:
+        name = shard.name if shard else "PRIMARY"
+        conn = get_write_connection(shard)
+        if conn is None:
+            print(f"❌ Không kết nối được {name}.")
+            return 1
+        started = time.perf_counter()
+        try:
+            cur = conn.cursor()
+            conn.start_transaction()
+            count = rebuild(cur)
+            conn.commit()
+            cur.close()
+        except mysql.connector.Error as err:
+            try:
+                conn.rollback()
+            except mysql.connector.Error:
+                pass
+            print(f"❌ {name}: {err}")
+            return 1
+        finally:
+            if conn.is_connected():
+                conn.close()
+        print(f"✅ {name}: {count} sinh viên trong {time.perf_counter() - started:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
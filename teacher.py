@@ -1,43 +1,243 @@
+import heapq
+import itertools
+import time
+
 import gradio as gr
 import mysql.connector
 
+import changes
+from analytics import (
+    CLASS_MATRIX_SQL,
+    distribution_tables,
+    matrix_table,
+    pivot_class_matrix,
+    stats_table,
+    subject_stats,
+    subject_stats_cache,
+)
+from bulk_import import import_students
+from catalog import subject_catalog, subject_choice_labels
+from export import DATASETS, export_dataset
+from group_commit import GroupCommitQueue
+from metrics import instrumented
+from shards import UnroutedStudent
+from summary import (
+    SUMMARY_SQL,
+    class_of,
+    refresh_students,
+    refresh_subject,
+    rerank_classes,
+    shard_rank,
+    students_graded_in,
+    summary_row,
+    summary_text,
+)
+from delta import (
+    MARK_SQL,
+    SCORES_GRID_DELTA_SQL,
+    STUDENTS_DELTA_SQL,
+    mark_from,
+    mark_usable,
+    merge_rows_by_id,
+    merge_students_page,
+    record_deletes,
+    scores_grid_delta_params,
+    split_delta,
+    students_delta_params,
+)
 from db import (
-    ROLE,
+    BULK_IMPORT_BATCH_SIZE,
+    DB_SCORE_GROUP_COMMIT_MAX,
+    DB_SCORE_GROUP_COMMIT_MS,
+    STUDENTS_PAGE_SIZE,
     _node_info,
     _parse_date,
     _require_teacher,
+    _store_gtid,
     _write_blocked_message,
-    get_db_connection,
+    can_write,
+    executed_gtid,
+    new_student_shard,
+    read_connection,
+    read_everywhere,
+    reference_shard,
+    remember_write,
+    scatter_read,
+    shard_for_student,
+    sharding_enabled,
+    unit_of_work,
+    write_connection,
+    write_reference,
 )
 
 
-def list_students_table(session: dict | None):
+@instrumented
+def list_students_table(
+    session: dict | None,
+    class_filter=None,
+    name_filter=None,
+    page: dict | None = None,
+    direction: str = "first",
+):
+    """One page of the roster using keyset pagination (``WHERE id > ? LIMIT ?``).
+
+    ``page`` holds the id range currently shown ({"first_id", "last_id"}) plus
+    what ``list_students_refresh`` needs to merge a delta into it (rows,
+    filters, delta mark); ``direction`` is "first", "next", "prev" or
+    "current" (reload after a write). Returns (table, msg, node, page, page_info).
+    """
+    page = page or {}
     ok, msg = _require_teacher(session)
     if not ok:
-        return [], msg, _node_info()
+        return [], msg, _node_info(), page, ""
 
-    conn = get_db_connection()
-    if conn is None:
-        return [], "❌ Không kết nối được database local.", ""
+    sql, params, order = _students_page_query(class_filter, name_filter, page, direction)
+
+    if sharding_enabled():
+        try:
+            rows = _merge_shard_pages(scatter_read(session, sql, params), order)
+        except mysql.connector.Error as err:
+            return [], f"❌ Lỗi DB: {err}", "", page, ""
+        return _students_page_result(rows, page, direction, order, _page_filters(class_filter, name_filter))
+
+    with read_connection(session) as conn:
+        if conn is None:
+            return [], "❌ Không kết nối được database local.", "", page, ""
+        try:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                rows = cur.fetchall() or []
+        except mysql.connector.Error as err:
+            return [], f"❌ Lỗi DB: {err}", "", page, ""
+    return _students_page_result(rows, page, direction, order, _page_filters(class_filter, name_filter))
+
+
+def _page_filters(class_filter, name_filter) -> tuple[str, str]:
+    return str(class_filter or "").strip(), str(name_filter or "").strip()
+
+
+def _students_page_query(class_filter, name_filter, page: dict, direction: str):
+    """(sql, params, order) for one roster page; shared with teacher_async."""
+    where, params = [], []
+    class_filter, name_filter = _page_filters(class_filter, name_filter)
+    if class_filter:
+        where.append("class_name = %s")
+        params.append(class_filter)
+    if name_filter:
+        where.append("full_name LIKE %s")
+        params.append(f"%{name_filter}%")
+
+    order = "ASC"
+    if direction == "next" and page.get("last_id") is not None:
+        where.append("id > %s")
+        params.append(int(page["last_id"]))
+    elif direction == "prev" and page.get("first_id") is not None:
+        where.append("id < %s")
+        params.append(int(page["first_id"]))
+        order = "DESC"
+    elif direction == "current" and page.get("first_id") is not None:
+        where.append("id >= %s")
+        params.append(int(page["first_id"]))
+
+    # Lấy dư 1 dòng để biết còn trang sau hay không.
+    sql = (
+        "SELECT id, full_name, class_name, email, date_of_birth, address "
+        "FROM students"
+        + (" WHERE " + " AND ".join(where) if where else "")
+        + f" ORDER BY id {order} LIMIT %s"
+    )
+    return sql, (*params, STUDENTS_PAGE_SIZE + 1), order
+
+
+def _merge_shard_pages(parts, order: str):
+    """Merge the page read from each shard (each sorted by id) into one page in global id order."""
+    merged = heapq.merge(*parts, key=lambda row: row[0], reverse=(order == "DESC"))
+    return list(itertools.islice(merged, STUDENTS_PAGE_SIZE + 1))
+
+
+def _students_page_result(rows, page: dict, direction: str, order: str, filters: tuple[str, str]):
+    has_more = len(rows) > STUDENTS_PAGE_SIZE
+    rows = list(rows[:STUDENTS_PAGE_SIZE])
+    if order == "DESC":
+        rows.reverse()
+
+    if not rows and direction in ("next", "prev"):
+        edge = "cuối" if direction == "next" else "đầu"
+        return gr.update(), f"📄 Đã ở trang {edge}.", _node_info(), page, gr.update()
+
+    table = [list(r) for r in rows]
+    new_page = {
+        "first_id": rows[0][0] if rows else None,
+        "last_id": rows[-1][0] if rows else None,
+        "has_next": bool(rows) and (has_more if order == "ASC" else True),
+        "rows": table,
+        "class_filter": filters[0],
+        "name_filter": filters[1],
+        # Mốc delta là của cả bảng, vẫn đúng khi chuyển trang (chỉ có thể đọc thừa).
+        "delta": page.get("delta"),
+    }
+    return table, "", _node_info(), new_page, _students_page_info(new_page)
+
+
+def _students_page_info(page: dict) -> str:
+    if not page["rows"]:
+        return "📄 Không có sinh viên phù hợp."
+    info = f"📄 ID {page['first_id']}–{page['last_id']} · {len(page['rows'])} sinh viên"
+    return info + (" · còn trang sau" if page["has_next"] else " · trang cuối")
+
+
+@instrumented
+@unit_of_work()
+def list_students_refresh(session: dict | None, class_filter, name_filter, page: dict | None, current_msg=None):
+    """Post-write roster refresh: merge the rows changed since the page's delta mark.
+
+    Only changed rows and tombstones are read (``delta``). Without a usable
+    mark, or when the change does not fit the page (it would overflow or
+    empty it), the page is reloaded in full, taking the mark *before* the
+    reload so nothing committed in between is missed next time. The write's
+    message (``current_msg``) is kept.
+    """
+    page = page or {}
+    ok, msg = _require_teacher(session)
+    if not ok:
+        return [], msg, _node_info(), page, ""
 
+    state = page.get("delta")
     try:
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT id, full_name, class_name, email, date_of_birth, address "
-            "FROM students ORDER BY id"
-        )
-        rows = cur.fetchall() or []
-        table = [list(r) for r in rows]
-        return table, "", _node_info()
+        if mark_usable(state):
+            delta_rows = read_everywhere(session, STUDENTS_DELTA_SQL, students_delta_params(page, state))
+            changed, deleted, state = split_delta(delta_rows, state)
+            rows = merge_students_page(page, changed, deleted, STUDENTS_PAGE_SIZE)
+            if rows is not None:
+                new_page = {**page, "rows": rows, "first_id": rows[0][0], "last_id": rows[-1][0], "delta": state}
+                info = _students_page_info(new_page) + f" · 🔁 {len(changed) + len(deleted)} dòng thay đổi"
+                return rows, current_msg or "", _node_info(), new_page, info
+        else:
+            state = mark_from(read_everywhere(session, MARK_SQL.format(table="students")))
     except mysql.connector.Error as err:
-        return [], f"❌ Lỗi DB: {err}", ""
-    finally:
-        if conn and conn.is_connected():
-            cur.close()
-            conn.close()
+        return gr.update(), f"❌ Lỗi DB: {err}", "", page, gr.update()
+    table, msg, node, new_page, info = list_students_table(session, class_filter, name_filter, {**page, "delta": state}, "current")
+    return table, (current_msg or msg), node, new_page, info
+
+
+@instrumented
+def list_students_next_page(session: dict | None, class_filter, name_filter, page: dict | None):
+    return list_students_table(session, class_filter, name_filter, page, "next")
 
 
+@instrumented
+def list_students_prev_page(session: dict | None, class_filter, name_filter, page: dict | None):
+    return list_students_table(session, class_filter, name_filter, page, "prev")
+
+
+@instrumented
+def list_students_reload_page(session: dict | None, class_filter, name_filter, page: dict | None):
+    return list_students_table(session, class_filter, name_filter, page, "current")
+
+
+@instrumented
 def get_student_detail(session: dict | None, student_id):
+    """One student's row; prepared statement when ``DB_PREPARED_STATEMENTS`` is on (default: text query)."""
     ok, msg = _require_teacher(session)
     if not ok:
         return "", "", "", "", "", msg, ""
@@ -45,39 +245,44 @@ def get_student_detail(session: dict | None, student_id):
     if not student_id:
         return "", "", "", "", "", "⚠️ Vui lòng nhập Student ID.", _node_info()
 
-    conn = get_db_connection()
-    if conn is None:
-        return "", "", "", "", "", "❌ Không kết nối được database local.", ""
-
     try:
-        cur = conn.cursor(dictionary=True)
-        cur.execute(
-            "SELECT id, full_name, class_name, email, date_of_birth, address "
-            "FROM students WHERE id=%s",
-            (int(student_id),),
-        )
-        row = cur.fetchone()
-        if not row:
-            return "", "", "", "", "", "🔍 Không tìm thấy sinh viên.", _node_info()
-
-        dob = row["date_of_birth"].strftime("%Y-%m-%d") if row["date_of_birth"] else ""
-        return (
-            row.get("full_name") or "",
-            row.get("class_name") or "",
-            row.get("email") or "",
-            dob,
-            row.get("address") or "",
-            "✅ Đã tải thông tin sinh viên.",
-            _node_info(),
-        )
-    except (mysql.connector.Error, ValueError) as err:
-        return "", "", "", "", "", f"❌ Lỗi: {err}", ""
-    finally:
-        if conn and conn.is_connected():
-            cur.close()
-            conn.close()
+        shard = shard_for_student(student_id)
+    except UnroutedStudent as err:
+        return "", "", "", "", "", f"❌ {err}", ""
+    with read_connection(session, shard) as conn:
+        if conn is None:
+            return "", "", "", "", "", "❌ Không kết nối được database local.", ""
+        try:
+            with conn.prepared_cursor(_STUDENT_DETAIL_SQL, dictionary=True) as cur:
+                cur.execute(_STUDENT_DETAIL_SQL, (int(student_id),))
+                return _student_detail_result(cur.fetchone())
+        except (mysql.connector.Error, ValueError) as err:
+            return "", "", "", "", "", f"❌ Lỗi: {err}", ""
+
+
+_STUDENT_DETAIL_SQL = (
+    "SELECT id, full_name, class_name, email, date_of_birth, address "
+    "FROM students WHERE id=%s"
+)
+
+
+def _student_detail_result(row):
+    if not row:
+        return "", "", "", "", "", "🔍 Không tìm thấy sinh viên.", _node_info()
 
+    dob = row["date_of_birth"].strftime("%Y-%m-%d") if row["date_of_birth"] else ""
+    return (
+        row.get("full_name") or "",
+        row.get("class_name") or "",
+        row.get("email") or "",
+        dob,
+        row.get("address") or "",
+        "✅ Đã tải thông tin sinh viên.",
+        _node_info(),
+    )
 
+
+@instrumented
 def teacher_create_student(
     session: dict | None,
     full_name,
@@ -91,7 +296,7 @@ def teacher_create_student(
     ok, msg = _require_teacher(session)
     if not ok:
         return msg
-    if ROLE == "replica":
+    if not can_write():
         return _write_blocked_message()
 
     if not full_name:
@@ -106,47 +311,75 @@ def teacher_create_student(
     if dob == "__invalid__":
         return "⚠️ Ngày sinh không hợp lệ. Định dạng đúng: YYYY-MM-DD."
 
-    conn = get_db_connection()
-    if conn is None:
-        return "❌ Không kết nối được database local."
-
+    shard = new_student_shard()
     username = str(username).strip()
 
-    try:
-        cur = conn.cursor()
-        conn.start_transaction()
-        cur.execute(
-            "INSERT INTO students (full_name, class_name, email, date_of_birth, address) "
-            "VALUES (%s,%s,%s,%s,%s)",
-            (full_name, class_name, email, None if dob is None else dob, address),
-        )
-        student_id = cur.lastrowid
-        cur.execute(
-            "INSERT INTO users (username, password, role, student_id) VALUES (%s,%s,'student',%s)",
-            (username, password, student_id),
-        )
-        conn.commit()
-        return f"✅ Đã tạo sinh viên (ID={student_id}) và tài khoản ({username})."
-    except mysql.connector.Error as err:
+    with write_connection(shard) as conn:
+        if conn is None:
+            return "❌ Không kết nối được database local."
         try:
-            conn.rollback()
-        except mysql.connector.Error:
-            pass
+            with conn.cursor() as cur:
+                conn.start_transaction()
+                cur.execute(
+                    "INSERT INTO students (full_name, class_name, email, date_of_birth, address) "
+                    "VALUES (%s,%s,%s,%s,%s)",
+                    (full_name, class_name, email, None if dob is None else dob, address),
+                )
+                student_id = cur.lastrowid
+                if shard is not None and not shard.owns(student_id):
+                    conn.rollback()
+                    return (
+                        f"❌ ID mới ({student_id}) nằm ngoài khoảng {shard.range_text()} của {shard.name}: "
+                        "kiểm tra AUTO_INCREMENT của bảng students trên shard."
+                    )
+                cur.execute(
+                    "INSERT INTO users (username, password, role, student_id) VALUES (%s,%s,'student',%s)",
+                    (username, password, student_id),
+                )
+                refresh_students(cur, [student_id])
+            conn.commit()
+            remember_write(session, conn, shard)
+        except mysql.connector.Error as err:
+            _rollback_quietly(conn)
+            if getattr(err, "errno", None) == 1062:
+                return "⚠️ Username đã tồn tại. Vui lòng chọn username khác."
+            return f"❌ Lỗi DB: {err}"
+    changes.publish("students", [student_id])
+    return f"✅ Đã tạo sinh viên (ID={student_id}) và tài khoản ({username})."
+
+
+@instrumented
+def teacher_bulk_import_students(session: dict | None, upload, batch_size):
+    """Import students + accounts from an uploaded CSV/XLSX file (see bulk_import.py)."""
+    ok, msg = _require_teacher(session)
+    if not ok:
+        return msg
+    if not can_write():
+        return _write_blocked_message()
+    if not upload:
+        return "⚠️ Vui lòng chọn file CSV/XLSX."
 
-        if getattr(err, "errno", None) == 1062:
-            return "⚠️ Username đã tồn tại. Vui lòng chọn username khác."
-        return f"❌ Lỗi DB: {err}"
-    finally:
-        if conn and conn.is_connected():
-            cur.close()
-            conn.close()
+    path = upload if isinstance(upload, str) else getattr(upload, "name", None)
+    try:
+        size = int(batch_size) if batch_size else BULK_IMPORT_BATCH_SIZE
+    except (TypeError, ValueError):
+        return "⚠️ Batch size phải là số nguyên."
+
+    try:
+        report = import_students(path, size, session=session)
+    except (OSError, RuntimeError, mysql.connector.Error) as err:
+        return f"❌ Lỗi: {err}"
+    if report.inserted:
+        changes.publish("students")
+    return report.summary()
 
 
+@instrumented
 def teacher_update_student(session: dict | None, student_id, full_name, class_name, email, date_of_birth, address):
     ok, msg = _require_teacher(session)
     if not ok:
         return msg
-    if ROLE == "replica":
+    if not can_write():
         return _write_blocked_message()
     if not student_id:
         return "⚠️ Vui lòng nhập Student ID."
@@ -157,83 +390,100 @@ def teacher_update_student(session: dict | None, student_id, full_name, class_na
     if dob == "__invalid__":
         return "⚠️ Ngày sinh không hợp lệ. Định dạng đúng: YYYY-MM-DD."
 
-    conn = get_db_connection()
-    if conn is None:
-        return "❌ Không kết nối được database local."
-
     try:
-        cur = conn.cursor()
-        cur.execute(
-            "UPDATE students SET full_name=%s, class_name=%s, email=%s, date_of_birth=%s, address=%s "
-            "WHERE id=%s",
-            (full_name, class_name, email, None if dob is None else dob, address, int(student_id)),
-        )
-        conn.commit()
-        if cur.rowcount == 0:
-            return "🔍 Không tìm thấy sinh viên để cập nhật."
-        return "✅ Đã cập nhật sinh viên."
-    except (mysql.connector.Error, ValueError) as err:
-        return f"❌ Lỗi: {err}"
-    finally:
-        if conn and conn.is_connected():
-            cur.close()
-            conn.close()
-
-
+        shard = shard_for_student(student_id)
+    except UnroutedStudent as err:
+        return f"❌ {err}"
+    with write_connection(shard) as conn:
+        if conn is None:
+            return "❌ Không kết nối được database local."
+        try:
+            with conn.cursor() as cur:
+                old_class = class_of(cur, student_id)
+                cur.execute(
+                    "UPDATE students SET full_name=%s, class_name=%s, email=%s, date_of_birth=%s, address=%s "
+                    "WHERE id=%s",
+                    (full_name, class_name, email, None if dob is None else dob, address, int(student_id)),
+                )
+                updated = cur.rowcount
+                if updated:
+                    # Đổi lớp: tính lại hạng của cả lớp cũ.
+                    refresh_students(cur, [student_id], old_classes=[old_class])
+            conn.commit()
+            remember_write(session, conn, shard)
+        except (mysql.connector.Error, ValueError) as err:
+            _rollback_quietly(conn)
+            return f"❌ Lỗi: {err}"
+    if updated == 0:
+        return "🔍 Không tìm thấy sinh viên để cập nhật."
+    changes.publish("students", [int(student_id)])
+    return "✅ Đã cập nhật sinh viên."
+
+
+@instrumented
 def teacher_delete_student(session: dict | None, student_id):
     ok, msg = _require_teacher(session)
     if not ok:
         return msg
-    if ROLE == "replica":
+    if not can_write():
         return _write_blocked_message()
     if not student_id:
         return "⚠️ Vui lòng nhập Student ID."
 
-    conn = get_db_connection()
-    if conn is None:
-        return "❌ Không kết nối được database local."
-
     try:
-        cur = conn.cursor()
-        cur.execute("DELETE FROM students WHERE id=%s", (int(student_id),))
-        conn.commit()
-        if cur.rowcount == 0:
-            return "🔍 Không tìm thấy sinh viên để xoá."
-        return "✅ Đã xoá sinh viên (và các dữ liệu liên quan)."
-    except (mysql.connector.Error, ValueError) as err:
-        return f"❌ Lỗi: {err}"
-    finally:
-        if conn and conn.is_connected():
-            cur.close()
-            conn.close()
-
-
+        shard = shard_for_student(student_id)
+    except UnroutedStudent as err:
+        return f"❌ {err}"
+    with write_connection(shard) as conn:
+        if conn is None:
+            return "❌ Không kết nối được database local."
+        try:
+            with conn.cursor() as cur:
+                old_class = class_of(cur, student_id)
+                cur.execute("SELECT subject_id FROM scores WHERE student_id=%s", (int(student_id),))
+                graded_subjects = [row[0] for row in cur.fetchall()]
+                cur.execute("DELETE FROM students WHERE id=%s", (int(student_id),))
+                deleted = cur.rowcount
+                if deleted:
+                    record_deletes(cur, "students", [int(student_id)])
+                    # Dòng student_summary bị xoá theo FK; các bạn cùng lớp lên hạng.
+                    rerank_classes(cur, [old_class])
+            conn.commit()
+            remember_write(session, conn, shard)
+        except (mysql.connector.Error, ValueError) as err:
+            _rollback_quietly(conn)
+            return f"❌ Lỗi: {err}"
+    if deleted == 0:
+        return "🔍 Không tìm thấy sinh viên để xoá."
+    # Điểm cũng bị xoá theo FK (không có trigger): báo cho cache thống kê môn.
+    changes.publish("scores", [(int(student_id), subject_id) for subject_id in graded_subjects])
+    changes.publish("students", [int(student_id)])
+    return "✅ Đã xoá sinh viên (và các dữ liệu liên quan)."
+
+
+@instrumented
 def teacher_list_subjects_table(session: dict | None):
     ok, msg = _require_teacher(session)
     if not ok:
         return [], msg, _node_info()
 
-    conn = get_db_connection()
-    if conn is None:
-        return [], "❌ Không kết nối được database local.", ""
-
     try:
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT id, subject_code, subject_name, credits "
-            "FROM subjects ORDER BY id"
-        )
-        rows = cur.fetchall() or []
-        table = [list(r) for r in rows]
-        return table, "", _node_info()
+        snap = subject_catalog.snapshot(session)
     except mysql.connector.Error as err:
         return [], f"❌ Lỗi DB: {err}", ""
-    finally:
-        if conn and conn.is_connected():
-            cur.close()
-            conn.close()
+    if snap is None:
+        return [], "❌ Không kết nối được database local.", ""
+    return [list(r) for r in snap.rows], "", _catalog_node_info(snap)
+
 
+def _catalog_node_info(snap) -> str:
+    if not snap.cached:
+        return _node_info()
+    age = time.monotonic() - snap.loaded_at
+    return f"ℹ️ Danh mục môn học lấy từ cache (tải từ node `{snap.node}` {age:.0f}s trước)"
 
+
+@instrumented
 def teacher_get_subject_detail(session: dict | None, subject_id):
     ok, msg = _require_teacher(session)
     if not ok:
@@ -242,33 +492,31 @@ def teacher_get_subject_detail(session: dict | None, subject_id):
     if not subject_id:
         return "", "", None, "⚠️ Vui lòng nhập Subject ID.", _node_info()
 
-    conn = get_db_connection()
-    if conn is None:
-        return "", "", None, "❌ Không kết nối được database local.", ""
+    with read_connection(session, reference_shard()) as conn:
+        if conn is None:
+            return "", "", None, "❌ Không kết nối được database local.", ""
+        try:
+            with conn.cursor(dictionary=True) as cur:
+                cur.execute(_SUBJECT_DETAIL_SQL, (int(subject_id),))
+                return _subject_detail_result(cur.fetchone())
+        except (mysql.connector.Error, ValueError) as err:
+            return "", "", None, f"❌ Lỗi: {err}", ""
+
+
+_SUBJECT_DETAIL_SQL = "SELECT id, subject_code, subject_name, credits FROM subjects WHERE id=%s"
 
-    try:
-        cur = conn.cursor(dictionary=True)
-        cur.execute(
-            "SELECT id, subject_code, subject_name, credits FROM subjects WHERE id=%s",
-            (int(subject_id),),
-        )
-        row = cur.fetchone()
-        if not row:
-            return "", "", None, "🔍 Không tìm thấy môn học.", _node_info()
-
-        return (
-            row.get("subject_code") or "",
-            row.get("subject_name") or "",
-            row.get("credits"),
-            "✅ Đã tải thông tin môn học.",
-            _node_info(),
-        )
-    except (mysql.connector.Error, ValueError) as err:
-        return "", "", None, f"❌ Lỗi: {err}", ""
-    finally:
-        if conn and conn.is_connected():
-            cur.close()
-            conn.close()
+
+def _subject_detail_result(row):
+    if not row:
+        return "", "", None, "🔍 Không tìm thấy môn học.", _node_info()
+
+    return (
+        row.get("subject_code") or "",
+        row.get("subject_name") or "",
+        row.get("credits"),
+        "✅ Đã tải thông tin môn học.",
+        _node_info(),
+    )
 
 
 def _validate_subject_inputs(subject_code, subject_name, credits):
@@ -288,62 +536,76 @@ def _validate_subject_inputs(subject_code, subject_name, credits):
     return True, credits_int
 
 
+@instrumented
 def teacher_refresh_subjects_ui(session: dict | None):
     """Refresh subject table + dropdown choices (for Teacher UI)."""
-    table, msg, node = teacher_list_subjects_table(session)
-    dropdown_update, _ = teacher_list_subject_choices(session)
+    table, msg, node, dropdown_update = _subjects_ui_from_catalog(session)
     # Prefer list message for refresh action
     msg = msg or "✅ Đã tải danh sách môn học."
     return table, msg, node, dropdown_update
 
 
+@instrumented
 def teacher_refresh_subjects_ui_keep_msg(session: dict | None, current_msg: str | None):
     """Refresh subject table + dropdown but keep existing message (after CRUD)."""
-    table, _, node = teacher_list_subjects_table(session)
-    dropdown_update, _ = teacher_list_subject_choices(session)
+    table, _, node, dropdown_update = _subjects_ui_from_catalog(session)
     return table, (current_msg or ""), node, dropdown_update
 
 
+def _subjects_ui_from_catalog(session: dict | None):
+    """Subject table + dropdown built from ONE catalog snapshot."""
+    table, msg, node = teacher_list_subjects_table(session)
+    if msg:
+        return table, msg, node, gr.update(choices=[], value=None)
+    choices = subject_choice_labels(table)
+    return table, msg, node, gr.update(choices=choices, value=(choices[0] if choices else None))
+
+
+@instrumented
 def teacher_create_subject(session: dict | None, subject_code, subject_name, credits):
     ok, msg = _require_teacher(session)
     if not ok:
         return msg
-    if ROLE == "replica":
+    if not can_write():
         return _write_blocked_message()
 
     valid, credits_or_msg = _validate_subject_inputs(subject_code, subject_name, credits)
     if not valid:
         return credits_or_msg
     credits_int = credits_or_msg
-
-    conn = get_db_connection()
-    if conn is None:
-        return "❌ Không kết nối được database local."
-
-    try:
-        cur = conn.cursor()
+    code, name = str(subject_code).strip(), str(subject_name).strip()
+
+    def insert(cur, subject_id):
+        if subject_id is None:
+            cur.execute(
+                "INSERT INTO subjects (subject_code, subject_name, credits) VALUES (%s, %s, %s)",
+                (code, name, credits_int),
+            )
+            return cur.lastrowid
+        # Các shard còn lại: cùng ID với shard đầu để scores.subject_id khớp ở mọi shard.
         cur.execute(
-            "INSERT INTO subjects (subject_code, subject_name, credits) VALUES (%s, %s, %s)",
-            (str(subject_code).strip(), str(subject_name).strip(), credits_int),
+            "INSERT INTO subjects (id, subject_code, subject_name, credits) VALUES (%s, %s, %s, %s)",
+            (subject_id, code, name, credits_int),
         )
-        conn.commit()
-        return "✅ Đã tạo môn học."
+        return subject_id
+
+    try:
+        new_id = write_reference(session, insert)
     except mysql.connector.Error as err:
         # Duplicate subject_code
         if getattr(err, "errno", None) == 1062:
             return "⚠️ Mã môn đã tồn tại (subject_code bị trùng)."
         return f"❌ Lỗi DB: {err}"
-    finally:
-        if conn and conn.is_connected():
-            cur.close()
-            conn.close()
+    changes.publish("subjects", [new_id])
+    return "✅ Đã tạo môn học."
 
 
+@instrumented
 def teacher_update_subject(session: dict | None, subject_id, subject_code, subject_name, credits):
     ok, msg = _require_teacher(session)
     if not ok:
         return msg
-    if ROLE == "replica":
+    if not can_write():
         return _write_blocked_message()
 
     if not subject_id:
@@ -354,154 +616,504 @@ def teacher_update_subject(session: dict | None, subject_id, subject_code, subje
         return credits_or_msg
     credits_int = credits_or_msg
 
-    conn = get_db_connection()
-    if conn is None:
-        return "❌ Không kết nối được database local."
-
-    try:
-        cur = conn.cursor()
+    def update(cur, _first):
         cur.execute(
             "UPDATE subjects SET subject_code=%s, subject_name=%s, credits=%s WHERE id=%s",
             (str(subject_code).strip(), str(subject_name).strip(), credits_int, int(subject_id)),
         )
-        conn.commit()
-        if cur.rowcount == 0:
-            return "🔍 Không tìm thấy môn học để cập nhật."
-        return "✅ Đã cập nhật môn học."
+        updated = cur.rowcount
+        if updated:
+            # Số tín chỉ có thể đã đổi: GPA của mọi sinh viên có điểm môn này.
+            refresh_subject(cur, subject_id)
+        return updated
+
+    try:
+        updated = write_reference(session, update)
     except (mysql.connector.Error, ValueError) as err:
         if getattr(err, "errno", None) == 1062:
             return "⚠️ Mã môn đã tồn tại (subject_code bị trùng)."
         return f"❌ Lỗi: {err}"
-    finally:
-        if conn and conn.is_connected():
-            cur.close()
-            conn.close()
+    changes.publish("subjects", [int(subject_id)])
+    if updated == 0:
+        return "🔍 Không tìm thấy môn học để cập nhật."
+    return "✅ Đã cập nhật môn học."
 
 
+@instrumented
 def teacher_delete_subject(session: dict | None, subject_id):
     ok, msg = _require_teacher(session)
     if not ok:
         return msg
-    if ROLE == "replica":
+    if not can_write():
         return _write_blocked_message()
     if not subject_id:
         return "⚠️ Vui lòng nhập Subject ID."
 
-    conn = get_db_connection()
-    if conn is None:
-        return "❌ Không kết nối được database local."
+    def delete(cur, _first):
+        graded = students_graded_in(cur, subject_id)
+        cur.execute("DELETE FROM subjects WHERE id=%s", (int(subject_id),))
+        deleted = cur.rowcount
+        if deleted:
+            record_deletes(cur, "subjects", [int(subject_id)])
+        # Điểm của môn bị xoá theo FK (không có trigger): tính lại các sinh viên đó.
+        refresh_students(cur, graded)
+        return deleted
 
     try:
-        cur = conn.cursor()
-        cur.execute("DELETE FROM subjects WHERE id=%s", (int(subject_id),))
-        conn.commit()
-        if cur.rowcount == 0:
-            return "🔍 Không tìm thấy môn học để xoá."
-        return "✅ Đã xoá môn học (và điểm liên quan nếu có)."
+        deleted = write_reference(session, delete)
     except (mysql.connector.Error, ValueError) as err:
         return f"❌ Lỗi: {err}"
-    finally:
-        if conn and conn.is_connected():
-            cur.close()
-            conn.close()
+    changes.publish("subjects", [int(subject_id)])
+    if deleted == 0:
+        return "🔍 Không tìm thấy môn học để xoá."
+    return "✅ Đã xoá môn học (và điểm liên quan nếu có)."
 
 
+@instrumented
 def teacher_list_subject_choices(session: dict | None):
     ok, msg = _require_teacher(session)
     if not ok:
         return gr.update(choices=[], value=None), msg
 
-    conn = get_db_connection()
-    if conn is None:
-        return gr.update(choices=[], value=None), "❌ Không kết nối được database local."
-
     try:
-        cur = conn.cursor()
-        cur.execute("SELECT id, subject_code, subject_name FROM subjects ORDER BY id")
-        rows = cur.fetchall() or []
-        # label: "1 - DBD - ..."
-        choices = [f"{r[0]} - {r[1]} - {r[2]}" for r in rows]
-        return gr.update(choices=choices, value=(choices[0] if choices else None)), ""
+        snap = subject_catalog.snapshot(session)
     except mysql.connector.Error as err:
         return gr.update(choices=[], value=None), f"❌ Lỗi DB: {err}"
-    finally:
-        if conn and conn.is_connected():
-            cur.close()
-            conn.close()
+    if snap is None:
+        return gr.update(choices=[], value=None), "❌ Không kết nối được database local."
 
+    choices = subject_choice_labels(snap.rows)
+    return gr.update(choices=choices, value=(choices[0] if choices else None)), ""
 
+
+@instrumented
 def teacher_get_scores_table(session: dict | None, student_id):
+    table, msg, node, _, _ = teacher_load_scores_grid(session, student_id)
+    return table, msg, node
+
+
+@instrumented
+def teacher_load_scores_grid(session: dict | None, student_id):
+    """Scores table of one student + a snapshot used to diff grid edits on save + GPA summary.
+
+    snapshot = {"student_id": id, "scores": {subject_code: [subject_id, score]},
+    "rows": [(subject_id, code, name, credits, score)], "delta": delta mark}
+    """
+    return _scores_grid(session, student_id)
+
+
+def _scores_grid(session: dict | None, student_id, snapshot: dict | None = None):
+    """Full grid load, or (``snapshot`` with a usable delta mark) merge of the changed rows only."""
     ok, msg = _require_teacher(session)
     if not ok:
-        return [], msg, ""
+        return [], msg, "", {}, ""
     if not student_id:
-        return [], "⚠️ Vui lòng nhập Student ID.", _node_info()
+        return [], "⚠️ Vui lòng nhập Student ID.", _node_info(), {}, ""
 
-    conn = get_db_connection()
-    if conn is None:
-        return [], "❌ Không kết nối được database local.", ""
+    try:
+        shard = shard_for_student(student_id)
+    except UnroutedStudent as err:
+        return [], f"❌ {err}", "", {}, ""
+    with read_connection(session, shard) as conn:
+        if conn is None:
+            return [], "❌ Không kết nối được database local.", "", {}, ""
+        try:
+            with conn.cursor() as cur:
+                state = (snapshot or {}).get("delta")
+                if snapshot and snapshot.get("rows") is not None and mark_usable(state):
+                    cur.execute(SCORES_GRID_DELTA_SQL, scores_grid_delta_params(int(student_id), state))
+                    changed, deleted, state = split_delta(cur.fetchall() or [], state)
+                    rows = merge_rows_by_id(snapshot["rows"], changed, deleted)
+                    result = _scores_grid_result(rows, student_id, state)
+                else:
+                    cur.execute(_SCORES_GRID_SQL, (int(student_id),))
+                    result = _scores_grid_result(cur.fetchall() or [], student_id)
+                cur.execute(SUMMARY_SQL, (int(student_id),))
+                summary = shard_rank(session, summary_row(cur.fetchone()))
+            return (*result, summary_text(summary))
+        except (mysql.connector.Error, ValueError) as err:
+            return [], f"❌ Lỗi: {err}", "", {}, ""
+
+
+# Cột cuối: mốc thay đổi mới nhất của dòng (môn hoặc điểm) -> mốc delta của lưới.
+_SCORES_GRID_SQL = (
+    "SELECT s.id, s.subject_code, s.subject_name, s.credits, sc.score, "
+    "GREATEST(s.updated_at, COALESCE(sc.updated_at, s.updated_at)) "
+    "FROM subjects s "
+    "LEFT JOIN scores sc ON sc.subject_id=s.id AND sc.student_id=%s "
+    "ORDER BY s.id"
+)
+
+
+def _scores_grid_result(rows, student_id, state: dict | None = None):
+    """Grid outputs from ``_SCORES_GRID_SQL`` rows (mark taken from their stamps) or merged rows + ``state``."""
+    if state is None:
+        state = mark_from([[r[5] for r in rows]])
+    rows = [tuple(r[:5]) for r in rows]
+    table = [list(r[1:]) for r in rows]
+    snapshot = {
+        "student_id": int(student_id),
+        "scores": {r[1]: [r[0], None if r[4] is None else float(r[4])] for r in rows},
+        "rows": rows,
+        "delta": state,
+    }
+    return table, "", _node_info(), snapshot
 
+
+@instrumented
+def teacher_reload_scores_grid_keep_msg(session: dict | None, snapshot: dict | None, current_msg: str | None):
+    """Refresh the grid of the student being edited (delta since its load) but keep the save message."""
+    student_id = (snapshot or {}).get("student_id")
+    table, msg, node, new_snapshot, summary = _scores_grid(session, student_id, snapshot)
+    return table, (current_msg or msg), node, new_snapshot, summary
+
+
+def _snapshot_of(snapshot: dict | None, student_id) -> dict | None:
+    """``snapshot`` if it is the grid of ``student_id`` (delta-refreshable), else None (full load)."""
     try:
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT s.subject_code, s.subject_name, s.credits, sc.score "
-            "FROM subjects s "
-            "LEFT JOIN scores sc ON sc.subject_id=s.id AND sc.student_id=%s "
-            "ORDER BY s.id",
-            (int(student_id),),
-        )
-        rows = cur.fetchall() or []
-        table = [list(r) for r in rows]
-        return table, "", _node_info()
-    except (mysql.connector.Error, ValueError) as err:
-        return [], f"❌ Lỗi: {err}", ""
-    finally:
-        if conn and conn.is_connected():
-            cur.close()
-            conn.close()
+        return snapshot if snapshot and snapshot.get("student_id") == int(student_id) else None
+    except (TypeError, ValueError):
+        return None
 
 
-def teacher_upsert_score(session: dict | None, student_id, subject_choice, score_val):
-    ok, msg = _require_teacher(session)
-    if not ok:
-        return msg
-    if ROLE == "replica":
-        return _write_blocked_message()
+@instrumented
+def teacher_refresh_scores_grid_keep_msg(session: dict | None, student_id, snapshot: dict | None, current_msg: str | None):
+    """After saving one score: delta-refresh the grid if it shows ``student_id``, else load that student's grid."""
+    table, msg, node, new_snapshot, summary = _scores_grid(session, student_id, _snapshot_of(snapshot, student_id))
+    return table, (current_msg or msg), node, new_snapshot, summary
+
+
+def _parse_score(score_val):
+    if score_val is None or score_val == "":
+        return False, "⚠️ Vui lòng nhập điểm."
+    try:
+        score_num = float(score_val)
+    except (TypeError, ValueError):
+        return False, "⚠️ Điểm phải là số."
+    if score_num != score_num:  # NaN (ô trống trong lưới)
+        return False, "⚠️ Vui lòng nhập điểm."
+    if score_num < 0 or score_num > 10:
+        return False, "⚠️ Điểm phải trong khoảng 0..10."
+    return True, score_num
+
+
+def _validate_score_input(student_id, subject_choice, score_val):
+    """(True, (student_id, subject_id, score)) or (False, message)."""
     if not student_id:
-        return "⚠️ Vui lòng nhập Student ID."
+        return False, "⚠️ Vui lòng nhập Student ID."
     if not subject_choice:
-        return "⚠️ Vui lòng chọn môn học."
+        return False, "⚠️ Vui lòng chọn môn học."
 
     try:
         subject_id = int(str(subject_choice).split("-", 1)[0].strip())
     except (TypeError, ValueError):
-        return "⚠️ Môn học không hợp lệ."
+        return False, "⚠️ Môn học không hợp lệ."
 
-    if score_val is None or score_val == "":
-        return "⚠️ Vui lòng nhập điểm."
+    valid, score_or_msg = _parse_score(score_val)
+    if not valid:
+        return False, score_or_msg
     try:
-        score_num = float(score_val)
+        return True, (int(student_id), subject_id, score_or_msg)
     except (TypeError, ValueError):
-        return "⚠️ Điểm phải là số."
-    if score_num < 0 or score_num > 10:
-        return "⚠️ Điểm phải trong khoảng 0..10."
+        return False, "⚠️ Student ID không hợp lệ."
+
+
+def _upsert_scores_sql(rows):
+    """One multi-row INSERT ... ON DUPLICATE KEY UPDATE for [(student_id, subject_id, score), ...]."""
+    placeholders = ",".join(["(%s,%s,%s)"] * len(rows))
+    sql = (
+        f"INSERT INTO scores (student_id, subject_id, score) VALUES {placeholders} "
+        "ON DUPLICATE KEY UPDATE score=VALUES(score)"
+    )
+    return sql, tuple(value for row in rows for value in row)
+
+
+# Lưu 1 điểm (nút "Lưu điểm"): câu lệnh nóng, chạy dạng prepared statement khi bật DB_PREPARED_STATEMENTS.
+_UPSERT_SCORE_SQL = _upsert_scores_sql([(0, 0, 0)])[0]
+
+
+def _upsert_scores(cur, rows) -> None:
+    """Upsert ``rows`` and refresh those students' ``student_summary`` rows (same transaction)."""
+    cur.execute(*_upsert_scores_sql(rows))
+    refresh_students(cur, [row[0] for row in rows])
+
+
+def _flush_score_batch(shard, rows):
+    """Group-commit flush: ``rows`` in ONE multi-row upsert + commit on the (shard) PRIMARY.
+
+    Returns one result per row: the node's GTID set after the commit (for
+    read-your-writes), or the error. If the batch fails (e.g. a subject was
+    deleted meanwhile), rows are retried one by one so only the bad ones fail.
+    """
+    with write_connection(shard) as conn:
+        if conn is None:
+            return [mysql.connector.errors.OperationalError(msg="Không kết nối được database PRIMARY.")] * len(rows)
+        with conn.cursor() as cur:
+            try:
+                conn.start_transaction()
+                _upsert_scores(cur, rows)
+                conn.commit()
+                results = [None] * len(rows)
+            except mysql.connector.Error:
+                _rollback_quietly(conn)
+                results = []
+                for row in rows:
+                    try:
+                        conn.start_transaction()
+                        _upsert_scores(cur, [row])
+                        conn.commit()
+                        results.append(None)
+                    except mysql.connector.Error as err:
+                        _rollback_quietly(conn)
+                        results.append(err)
+        gtid_set = executed_gtid(conn)
+    _scores_changed([row for row, result in zip(rows, results) if result is None])
+    return [gtid_set if result is None else result for result in results]
+
+
+def _scores_changed(rows) -> None:
+    """Notify caches / live sessions after committing score ``rows``."""
+    if rows:
+        changes.publish("scores", {(row[0], row[1]) for row in rows})
+
+
+def _rollback_quietly(conn) -> None:
+    try:
+        conn.rollback()
+    except mysql.connector.Error:
+        pass
+
+
+# Hàng đợi gộp các lần lưu một điểm (None = tắt, xem DB_SCORE_GROUP_COMMIT_MS).
+score_commit_queue = (
+    GroupCommitQueue(
+        "teacher_upsert_score",
+        _flush_score_batch,
+        window=DB_SCORE_GROUP_COMMIT_MS / 1000.0,
+        max_batch=DB_SCORE_GROUP_COMMIT_MAX,
+    )
+    if DB_SCORE_GROUP_COMMIT_MS > 0
+    else None
+)
+
+
+def _remember_group_commit(session: dict | None, shard, gtid_set) -> None:
+    if session is not None and gtid_set:
+        _store_gtid(session, shard, gtid_set)
 
-    conn = get_db_connection()
-    if conn is None:
-        return "❌ Không kết nối được database local."
+
+@instrumented
+def teacher_upsert_score(session: dict | None, student_id, subject_choice, score_val):
+    """Save one score (group commit queue if enabled).
+
+    The upsert runs as a prepared statement only when ``DB_PREPARED_STATEMENTS`` is on,
+    which by default needs ``DB_POOL_RESET_SESSION=0``; otherwise it is a text query.
+    """
+    ok, msg = _require_teacher(session)
+    if not ok:
+        return msg
+    if not can_write():
+        return _write_blocked_message()
+
+    valid, row_or_msg = _validate_score_input(student_id, subject_choice, score_val)
+    if not valid:
+        return row_or_msg
 
     try:
-        cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO scores (student_id, subject_id, score) VALUES (%s,%s,%s) "
-            "ON DUPLICATE KEY UPDATE score=VALUES(score)",
-            (int(student_id), subject_id, score_num),
-        )
-        conn.commit()
+        shard = shard_for_student(row_or_msg[0])
+    except UnroutedStudent as err:
+        return f"❌ {err}"
+    if score_commit_queue is not None:
+        try:
+            gtid_set = score_commit_queue.submit(shard, row_or_msg).result()
+        except (mysql.connector.Error, RuntimeError) as err:
+            return f"❌ Lỗi: {err}"
+        _remember_group_commit(session, shard, gtid_set)
         return "✅ Đã cập nhật điểm."
-    except (mysql.connector.Error, ValueError) as err:
-        return f"❌ Lỗi: {err}"
-    finally:
-        if conn and conn.is_connected():
-            cur.close()
-            conn.close()
+
+    with write_connection(shard) as conn:
+        if conn is None:
+            return "❌ Không kết nối được database local."
+        try:
+            with conn.prepared_cursor(_UPSERT_SCORE_SQL) as cur:
+                cur.execute(_UPSERT_SCORE_SQL, row_or_msg)
+            with conn.cursor() as cur:
+                refresh_students(cur, [row_or_msg[0]])
+            conn.commit()
+            remember_write(session, conn, shard)
+        except (mysql.connector.Error, ValueError) as err:
+            _rollback_quietly(conn)
+            return f"❌ Lỗi: {err}"
+    _scores_changed([row_or_msg])
+    return "✅ Đã cập nhật điểm."
+
+
+@instrumented
+def teacher_save_scores_grid(session: dict | None, edited_table, snapshot: dict | None):
+    """Save every score cell edited in the grid in ONE transaction / ONE multi-row upsert.
+
+    Only cells that differ from the snapshot taken when the grid was loaded
+    are written; an empty cell that had no score is left alone.
+    """
+    ok, msg = _require_teacher(session)
+    if not ok:
+        return msg
+    if not can_write():
+        return _write_blocked_message()
+    if not snapshot or not snapshot.get("scores"):
+        return "⚠️ Vui lòng tải bảng môn & điểm trước khi lưu."
+
+    student_id = snapshot["student_id"]
+    original = snapshot["scores"]
+    edits, errors = [], []
+    for row in edited_table or []:
+        if len(row) < 4 or row[0] not in original:
+            continue
+        subject_id, old_score = original[row[0]]
+        new_value = row[3]
+        if old_score is None and (new_value is None or new_value == "" or new_value != new_value):
+            continue
+        valid, score_or_msg = _parse_score(new_value)
+        if not valid:
+            errors.append(f"{row[0]}: {score_or_msg}")
+            continue
+        if old_score is None or round(score_or_msg, 2) != round(old_score, 2):
+            edits.append((student_id, subject_id, score_or_msg))
+
+    if errors:
+        return "⚠️ Chưa lưu, có ô điểm không hợp lệ:\n" + "\n".join(errors)
+    if not edits:
+        return "ℹ️ Không có điểm nào thay đổi."
+
+    try:
+        shard = shard_for_student(student_id)
+    except UnroutedStudent as err:
+        return f"❌ {err}"
+    with write_connection(shard) as conn:
+        if conn is None:
+            return "❌ Không kết nối được database local."
+        try:
+            with conn.cursor() as cur:
+                conn.start_transaction()
+                _upsert_scores(cur, edits)
+            conn.commit()
+            remember_write(session, conn, shard)
+        except mysql.connector.Error as err:
+            _rollback_quietly(conn)
+            return f"❌ Lỗi DB: {err}"
+    _scores_changed(edits)
+    return f"✅ Đã lưu {len(edits)} điểm trong 1 transaction."
+
+
+@instrumented
+def teacher_class_matrix(session: dict | None, class_name):
+    """Students × subjects score matrix of one class + per-subject mean / median / fail rate.
+
+    One set-based query (one per shard when sharded) instead of one scores
+    query per student. Returns (matrix, stats, msg, node).
+    """
+    empty = {"headers": ["Student ID", "Họ tên"], "data": []}
+    ok, msg = _require_teacher(session)
+    if not ok:
+        return empty, [], msg, ""
+    class_name = str(class_name or "").strip()
+    if not class_name:
+        return empty, [], "⚠️ Vui lòng nhập lớp.", _node_info()
+
+    if sharding_enabled():
+        try:
+            rows = [row for part in scatter_read(session, CLASS_MATRIX_SQL, (class_name,)) for row in part]
+        except mysql.connector.Error as err:
+            return empty, [], f"❌ Lỗi DB: {err}", ""
+        return _class_matrix_result(rows, class_name)
+
+    with read_connection(session) as conn:
+        if conn is None:
+            return empty, [], "❌ Không kết nối được database local.", ""
+        try:
+            with conn.cursor() as cur:
+                cur.execute(CLASS_MATRIX_SQL, (class_name,))
+                rows = cur.fetchall() or []
+        except mysql.connector.Error as err:
+            return empty, [], f"❌ Lỗi DB: {err}", ""
+    return _class_matrix_result(rows, class_name)
+
+
+def _class_matrix_result(rows, class_name: str):
+    matrix = pivot_class_matrix(rows)
+    students, subjects = matrix["scores"].shape
+    if not students:
+        return matrix_table(matrix), [], f"ℹ️ Lớp {class_name} không có sinh viên nào.", _node_info()
+    msg = f"✅ Lớp {class_name}: {students} sinh viên × {subjects} môn có điểm."
+    return matrix_table(matrix), stats_table(matrix, subject_stats(matrix)), msg, _node_info()
+
+
+@instrumented
+def teacher_analytics_subject_choices(session: dict | None):
+    """Subject multiselect of the analytics panel (from the catalog cache)."""
+    ok, msg = _require_teacher(session)
+    if not ok:
+        return gr.update(choices=[], value=[]), msg
+
+    try:
+        snap = subject_catalog.snapshot(session)
+    except mysql.connector.Error as err:
+        return gr.update(choices=[], value=[]), f"❌ Lỗi DB: {err}"
+    if snap is None:
+        return gr.update(choices=[], value=[]), "❌ Không kết nối được database local."
+    return gr.update(choices=subject_choice_labels(snap.rows), value=[]), ""
+
+
+@instrumented
+@unit_of_work()
+def teacher_subject_analytics(session: dict | None, subject_choices):
+    """Score distribution of the selected subjects: stats, grade bands, histogram.
+
+    Returns (distribution, bands, histogram, msg, node). Results come from
+    ``subject_stats_cache`` until a score of that subject changes.
+    """
+    empty_hist = {"headers": ["Khoảng điểm"], "data": []}
+    ok, msg = _require_teacher(session)
+    if not ok:
+        return [], [], empty_hist, msg, ""
+    try:
+        subject_ids = [int(str(choice).split("-", 1)[0].strip()) for choice in subject_choices or []]
+    except (TypeError, ValueError):
+        return [], [], empty_hist, "⚠️ Môn học không hợp lệ.", ""
+    if not subject_ids:
+        return [], [], empty_hist, "⚠️ Vui lòng chọn ít nhất một môn.", _node_info()
+
+    try:
+        result = subject_stats_cache.get(session, subject_ids)
+        snap = subject_catalog.snapshot(session)
+    except mysql.connector.Error as err:
+        return [], [], empty_hist, f"❌ Lỗi DB: {err}", ""
+    if result is None:
+        return [], [], empty_hist, "❌ Không kết nối được database local.", ""
+
+    stats_by_subject, cached = result
+    codes = {row[0]: row[1] for row in (snap.rows if snap else [])}
+    distribution, bands, histogram = distribution_tables(stats_by_subject, codes)
+    total = sum(stats["count"] for stats in stats_by_subject.values())
+    msg = f"✅ {len(stats_by_subject)} môn, {total} điểm."
+    if cached == len(stats_by_subject):
+        return distribution, bands, histogram, msg, "ℹ️ Thống kê lấy từ cache (chưa có điểm nào của các môn này thay đổi)."
+    if cached:
+        msg += f" ({cached} môn lấy từ cache)"
+    return distribution, bands, histogram, msg, _node_info()
+
+
+@instrumented
+def teacher_export_data(session: dict | None, dataset, fmt):
+    """Export roster / subject catalog / score matrix to a downloadable file."""
+    ok, msg = _require_teacher(session)
+    if not ok:
+        return None, msg
+    if dataset not in DATASETS:
+        return None, "⚠️ Vui lòng chọn dữ liệu cần xuất."
+
+    try:
+        path, count, seconds = export_dataset(dataset, fmt or "csv", session=session)
+    except (OSError, RuntimeError, ValueError, mysql.connector.Error) as err:
+        return None, f"❌ Lỗi: {err}"
+    return path, f"✅ Đã xuất {count} dòng ({DATASETS[dataset]}) trong {seconds:.2f}s."
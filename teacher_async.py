@@ -0,0 +1,279 @@
+"""Async versions of the hot teacher read/score handlers (see ``db_async``).
+
+Validation, SQL and result shaping are shared with ``teacher``; only the
+database round trips differ.
+"""
+
+import asyncio
+
+import gradio as gr
+import mysql.connector
+
+import db_async
+from db import (
+    STUDENTS_PAGE_SIZE,
+    _node_info,
+    _require_teacher,
+    _write_blocked_message,
+    can_write,
+    reference_shard,
+    shard_for_student,
+    sharding_enabled,
+)
+from delta import (
+    MARK_SQL,
+    SCORES_GRID_DELTA_SQL,
+    STUDENTS_DELTA_SQL,
+    mark_from,
+    mark_usable,
+    merge_rows_by_id,
+    merge_students_page,
+    scores_grid_delta_params,
+    split_delta,
+    students_delta_params,
+)
+from metrics import instrumented
+from shards import UnroutedStudent
+from summary import SUMMARY_SQL, async_shard_rank, refresh_statements, summary_row, summary_text
+from teacher import (
+    _SCORES_GRID_SQL,
+    _STUDENT_DETAIL_SQL,
+    _SUBJECT_DETAIL_SQL,
+    _UPSERT_SCORE_SQL,
+    _merge_shard_pages,
+    _page_filters,
+    _remember_group_commit,
+    _scores_changed,
+    _scores_grid_result,
+    _snapshot_of,
+    _student_detail_result,
+    _students_page_info,
+    _students_page_query,
+    _students_page_result,
+    _subject_detail_result,
+    _validate_score_input,
+    score_commit_queue,
+)
+
+
+@instrumented
+async def list_students_table(
+    session: dict | None,
+    class_filter=None,
+    name_filter=None,
+    page: dict | None = None,
+    direction: str = "first",
+):
+    page = page or {}
+    ok, msg = _require_teacher(session)
+    if not ok:
+        return [], msg, _node_info(), page, ""
+
+    sql, params, order = _students_page_query(class_filter, name_filter, page, direction)
+
+    if sharding_enabled():
+        try:
+            rows = _merge_shard_pages(await db_async.scatter_fetch(session, sql, params), order)
+        except mysql.connector.Error as err:
+            return [], f"❌ Lỗi DB: {err}", "", page, ""
+        return _students_page_result(rows, page, direction, order, _page_filters(class_filter, name_filter))
+
+    async with db_async.read_connection(session) as conn:
+        if conn is None:
+            return [], "❌ Không kết nối được database local.", "", page, ""
+        try:
+            rows = await db_async.fetch(conn, sql, params)
+        except mysql.connector.Error as err:
+            return [], f"❌ Lỗi DB: {err}", "", page, ""
+    return _students_page_result(rows, page, direction, order, _page_filters(class_filter, name_filter))
+
+
+@instrumented
+async def list_students_next_page(session: dict | None, class_filter, name_filter, page: dict | None):
+    return await list_students_table(session, class_filter, name_filter, page, "next")
+
+
+@instrumented
+async def list_students_prev_page(session: dict | None, class_filter, name_filter, page: dict | None):
+    return await list_students_table(session, class_filter, name_filter, page, "prev")
+
+
+@instrumented
+async def list_students_reload_page(session: dict | None, class_filter, name_filter, page: dict | None):
+    return await list_students_table(session, class_filter, name_filter, page, "current")
+
+
+@instrumented
+@db_async.unit_of_work()
+async def list_students_refresh(session: dict | None, class_filter, name_filter, page: dict | None, current_msg=None):
+    page = page or {}
+    ok, msg = _require_teacher(session)
+    if not ok:
+        return [], msg, _node_info(), page, ""
+
+    state = page.get("delta")
+    try:
+        if mark_usable(state):
+            delta_rows = await db_async.fetch_everywhere(session, STUDENTS_DELTA_SQL, students_delta_params(page, state))
+            changed, deleted, state = split_delta(delta_rows, state)
+            rows = merge_students_page(page, changed, deleted, STUDENTS_PAGE_SIZE)
+            if rows is not None:
+                new_page = {**page, "rows": rows, "first_id": rows[0][0], "last_id": rows[-1][0], "delta": state}
+                info = _students_page_info(new_page) + f" · 🔁 {len(changed) + len(deleted)} dòng thay đổi"
+                return rows, current_msg or "", _node_info(), new_page, info
+        else:
+            state = mark_from(await db_async.fetch_everywhere(session, MARK_SQL.format(table="students")))
+    except mysql.connector.Error as err:
+        return gr.update(), f"❌ Lỗi DB: {err}", "", page, gr.update()
+    table, msg, node, new_page, info = await list_students_table(
+        session, class_filter, name_filter, {**page, "delta": state}, "current"
+    )
+    return table, (current_msg or msg), node, new_page, info
+
+
+@instrumented
+async def get_student_detail(session: dict | None, student_id):
+    ok, msg = _require_teacher(session)
+    if not ok:
+        return "", "", "", "", "", msg, ""
+
+    if not student_id:
+        return "", "", "", "", "", "⚠️ Vui lòng nhập Student ID.", _node_info()
+
+    try:
+        shard = shard_for_student(student_id)
+    except UnroutedStudent as err:
+        return "", "", "", "", "", f"❌ {err}", ""
+    async with db_async.read_connection(session, shard) as conn:
+        if conn is None:
+            return "", "", "", "", "", "❌ Không kết nối được database local.", ""
+        try:
+            row = await db_async.fetch(conn, _STUDENT_DETAIL_SQL, (int(student_id),), dictionary=True, one=True, prepared=True)
+        except (mysql.connector.Error, ValueError) as err:
+            return "", "", "", "", "", f"❌ Lỗi: {err}", ""
+    return _student_detail_result(row)
+
+
+@instrumented
+async def teacher_get_subject_detail(session: dict | None, subject_id):
+    ok, msg = _require_teacher(session)
+    if not ok:
+        return "", "", None, msg, ""
+
+    if not subject_id:
+        return "", "", None, "⚠️ Vui lòng nhập Subject ID.", _node_info()
+
+    async with db_async.read_connection(session, reference_shard()) as conn:
+        if conn is None:
+            return "", "", None, "❌ Không kết nối được database local.", ""
+        try:
+            row = await db_async.fetch(conn, _SUBJECT_DETAIL_SQL, (int(subject_id),), dictionary=True, one=True)
+        except (mysql.connector.Error, ValueError) as err:
+            return "", "", None, f"❌ Lỗi: {err}", ""
+    return _subject_detail_result(row)
+
+
+@instrumented
+async def teacher_load_scores_grid(session: dict | None, student_id):
+    return await _scores_grid(session, student_id)
+
+
+async def _scores_grid(session: dict | None, student_id, snapshot: dict | None = None):
+    ok, msg = _require_teacher(session)
+    if not ok:
+        return [], msg, "", {}, ""
+    if not student_id:
+        return [], "⚠️ Vui lòng nhập Student ID.", _node_info(), {}, ""
+
+    try:
+        shard = shard_for_student(student_id)
+    except UnroutedStudent as err:
+        return [], f"❌ {err}", "", {}, ""
+    async with db_async.read_connection(session, shard) as conn:
+        if conn is None:
+            return [], "❌ Không kết nối được database local.", "", {}, ""
+        try:
+            state = (snapshot or {}).get("delta")
+            if snapshot and snapshot.get("rows") is not None and mark_usable(state):
+                delta_rows = await db_async.fetch(conn, SCORES_GRID_DELTA_SQL, scores_grid_delta_params(int(student_id), state))
+                changed, deleted, state = split_delta(delta_rows, state)
+                result = _scores_grid_result(merge_rows_by_id(snapshot["rows"], changed, deleted), student_id, state)
+            else:
+                rows = await db_async.fetch(conn, _SCORES_GRID_SQL, (int(student_id),))
+                result = _scores_grid_result(rows, student_id)
+            summary = summary_row(await db_async.fetch(conn, SUMMARY_SQL, (int(student_id),), one=True))
+            return (*result, summary_text(await async_shard_rank(session, summary)))
+        except (mysql.connector.Error, ValueError) as err:
+            return [], f"❌ Lỗi: {err}", "", {}, ""
+
+
+@instrumented
+async def teacher_get_scores_table(session: dict | None, student_id):
+    table, msg, node, _, _ = await teacher_load_scores_grid(session, student_id)
+    return table, msg, node
+
+
+@instrumented
+async def teacher_reload_scores_grid_keep_msg(session: dict | None, snapshot: dict | None, current_msg: str | None):
+    student_id = (snapshot or {}).get("student_id")
+    table, msg, node, new_snapshot, summary = await _scores_grid(session, student_id, snapshot)
+    return table, (current_msg or msg), node, new_snapshot, summary
+
+
+@instrumented
+async def teacher_refresh_scores_grid_keep_msg(
+    session: dict | None, student_id, snapshot: dict | None, current_msg: str | None
+):
+    table, msg, node, new_snapshot, summary = await _scores_grid(session, student_id, _snapshot_of(snapshot, student_id))
+    return table, (current_msg or msg), node, new_snapshot, summary
+
+
+async def _rollback_quietly(conn) -> None:
+    try:
+        await conn.rollback()
+    except mysql.connector.Error:
+        pass
+
+
+@instrumented
+async def teacher_upsert_score(session: dict | None, student_id, subject_choice, score_val):
+    ok, msg = _require_teacher(session)
+    if not ok:
+        return msg
+    if not can_write():
+        return _write_blocked_message()
+
+    valid, row_or_msg = _validate_score_input(student_id, subject_choice, score_val)
+    if not valid:
+        return row_or_msg
+
+    try:
+        shard = shard_for_student(row_or_msg[0])
+    except UnroutedStudent as err:
+        return f"❌ {err}"
+    if score_commit_queue is not None:
+        try:
+            gtid_set = await asyncio.wrap_future(score_commit_queue.submit(shard, row_or_msg))
+        except (mysql.connector.Error, RuntimeError) as err:
+            return f"❌ Lỗi: {err}"
+        _remember_group_commit(session, shard, gtid_set)
+        return "✅ Đã cập nhật điểm."
+
+    async with db_async.write_connection(shard) as conn:
+        if conn is None:
+            return "❌ Không kết nối được database local."
+        try:
+            prepared = await conn.prepared_cursor(_UPSERT_SCORE_SQL)
+            await prepared.execute(_UPSERT_SCORE_SQL, row_or_msg)
+            await prepared.close()
+            cur = await conn.cursor()
+            for sql, params in refresh_statements([row_or_msg[0]]):
+                await cur.execute(sql, params)
+            await cur.close()
+            await conn.commit()
+            await db_async.remember_write(session, conn, shard)
+        except (mysql.connector.Error, ValueError) as err:
+            await _rollback_quietly(conn)
+            return f"❌ Lỗi: {err}"
+    _scores_changed([row_or_msg])
+    return "✅ Đã cập nhật điểm."
@@ -0,0 +1,45 @@
+"""Unit tests for analytics.py (class matrix pivot and NumPy statistics)."""
+
+import math
+
+import numpy as np
+import pytest
+
+from analytics import pivot_class_matrix, score_stats, subject_stats
+
+
+def test_pivot_class_matrix_builds_sorted_dense_matrix():
+    rows = [
+        (2, "B", 20, "S20", 7.0),
+        (1, "A", 10, "S10", 3.0),
+        (1, "A", 20, "S20", 9.0),
+        (3, "C", None, None, None),  # chưa có điểm nào
+    ]
+    matrix = pivot_class_matrix(rows)
+    assert matrix["student_ids"].tolist() == [1, 2, 3]
+    assert matrix["names"] == ["A", "B", "C"]
+    assert matrix["subject_ids"].tolist() == [10, 20]
+    assert matrix["codes"] == ["S10", "S20"]
+    np.testing.assert_array_equal(matrix["scores"], [[3.0, 9.0], [np.nan, 7.0], [np.nan, np.nan]])
+
+
+def test_subject_stats_ignores_missing_scores():
+    matrix = pivot_class_matrix([(1, "A", 10, "S10", 3.0), (2, "B", 10, "S10", 8.0), (2, "B", 20, "S20", 5.0)])
+    stats = subject_stats(matrix)
+    assert stats["counts"].tolist() == [2, 1]
+    np.testing.assert_allclose(stats["mean"], [5.5, 5.0])
+    np.testing.assert_allclose(stats["median"], [5.5, 5.0])
+    np.testing.assert_allclose(stats["fail_rate"], [0.5, 0.0])
+
+
+def test_score_stats_histogram_percentiles_and_bands():
+    scores = np.array([0.0, 3.9, 4.0, 5.5, 7.0, 8.5, 10.0], dtype=np.float32)
+    stats = score_stats(scores)
+    assert stats["count"] == 7
+    assert stats["min"] == 0.0 and stats["max"] == 10.0
+    assert math.isclose(stats["mean"], float(scores.astype(np.float64).mean()), rel_tol=1e-6)
+    assert sum(stats["histogram"]) == 7
+    assert stats["histogram"][-1] == 1  # 10 nằm trong khoảng cuối [9, 10]
+    assert stats["bands"] == {"A": 2, "B": 1, "C": 1, "D": 1, "F": 2}
+    assert stats["percentiles"][2] == pytest.approx(5.5)
+    assert score_stats(np.empty(0, dtype=np.float32)) == {"count": 0}
@@ -0,0 +1,45 @@
+"""Unit tests for changes.py (in-process pub/sub, local vs binlog delivery)."""
+
+import pytest
+
+import changes
+
+
+@pytest.fixture
+def feed(monkeypatch):
+    monkeypatch.setattr(changes, "_subscribers", {})
+    monkeypatch.setattr(changes, "_binlog_feed", False)
+    return changes
+
+
+def test_publish_delivers_frozen_keys_and_survives_failing_subscribers(feed):
+    seen = []
+
+    def broken(keys):
+        raise RuntimeError("boom")
+
+    feed.subscribe("scores", broken)
+    feed.subscribe("scores", seen.append)
+    feed.publish("scores", [(1, 2), (1, 2)])
+    feed.publish("scores")
+    assert seen == [frozenset({(1, 2)}), None]
+
+
+def test_live_subscribers_hear_local_writes_once_while_the_binlog_feed_is_up(feed):
+    cache, live = [], []
+    feed.subscribe("students", cache.append)
+    feed.subscribe("students", live.append, prefer_binlog=True)
+
+    feed.set_binlog_feed(True)
+    feed.publish("students", [7])  # handler, sau commit
+    feed.publish("students", [7], from_binlog=True)  # cùng thay đổi, đọc từ binlog
+    assert cache == [frozenset({7}), frozenset({7})]
+    assert live == [frozenset({7})]
+
+    feed.set_binlog_feed(False)  # mất kết nối binlog: handler lại đẩy trực tiếp
+    feed.publish("students", [8])
+    assert live[-1] == frozenset({8})
+
+    feed.unsubscribe("students", live.append)
+    feed.publish("students", [9], from_binlog=True)
+    assert live[-1] == frozenset({8})
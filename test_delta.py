@@ -0,0 +1,71 @@
+"""Unit tests for delta.py (delta refresh merge / mark helpers, no database)."""
+
+import time
+from datetime import datetime
+
+import delta
+
+
+def _student(student_id, name="A", class_name="CS1"):
+    return [student_id, name, class_name, None, None, None]
+
+
+def _page(rows, has_next=True):
+    return {"rows": rows, "first_id": rows[0][0], "last_id": rows[-1][0], "has_next": has_next}
+
+
+def _changed(name, matches=True, class_name="CS1"):
+    return [name, class_name, None, None, None, matches]
+
+
+def test_merge_students_page_applies_updates_inserts_and_deletes():
+    page = _page([_student(1), _student(3), _student(5)])
+    changed = {3: _changed("B"), 4: _changed("New")}
+    rows = delta.merge_students_page(page, changed, {1}, page_size=10)
+    assert [row[0] for row in rows] == [3, 4, 5]
+    assert rows[0][1] == "B"
+    assert rows[1][1] == "New"
+
+
+def test_merge_students_page_drops_rows_leaving_the_filter_or_the_range():
+    page = _page([_student(1), _student(3), _student(5)])
+    # 3 không còn khớp bộ lọc; 9 nằm sau trang (còn trang sau) nên không thuộc trang này.
+    rows = delta.merge_students_page(page, {3: _changed("B", matches=False), 9: _changed("X")}, set(), page_size=10)
+    assert [row[0] for row in rows] == [1, 5]
+
+
+def test_merge_students_page_last_page_takes_new_ids():
+    page = _page([_student(1), _student(3)], has_next=False)
+    rows = delta.merge_students_page(page, {9: _changed("X")}, set(), page_size=10)
+    assert [row[0] for row in rows] == [1, 3, 9]
+
+
+def test_merge_students_page_asks_for_reload_on_overflow_empty_or_unknown_page():
+    page = _page([_student(1), _student(3)], has_next=False)
+    assert delta.merge_students_page(page, {9: _changed("X")}, set(), page_size=2) is None
+    assert delta.merge_students_page(page, {}, {1, 3}, page_size=10) is None
+    assert delta.merge_students_page({"rows": None}, {}, set(), page_size=10) is None
+
+
+def test_merge_rows_by_id_replaces_adds_deletes_and_sorts():
+    rows = [(1, "a"), (2, "b"), (4, "d")]
+    merged = delta.merge_rows_by_id(rows, {2: ["B"], 3: ["c"]}, {4})
+    assert merged == [(1, "a"), (2, "B"), (3, "c")]
+
+
+def test_split_delta_advances_the_mark_and_keeps_the_full_load_time():
+    state = delta.mark_from([[datetime(2024, 1, 1), None]])
+    newer = datetime(2024, 1, 2)
+    changed, deleted, new_state = delta.split_delta([(0, 7, "x", newer), (1, 8, None, datetime(2024, 1, 1))], state)
+    assert changed == {7: ["x"]}
+    assert deleted == {8}
+    assert new_state["mark"] == newer
+    assert new_state["full_at"] == state["full_at"]
+
+
+def test_mark_usable_forces_a_periodic_full_reload(monkeypatch):
+    state = delta.mark_from([])
+    assert delta.mark_usable(state)
+    assert not delta.mark_usable({"mark": state["mark"], "synced_at": time.time()})
+    monkeypatch.setattr(delta, "DELTA_FULL_RELOAD_SECONDS", 10.0)
+    assert not delta.mark_usable({**state, "full_at": time.time() - 11})
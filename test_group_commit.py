@@ -0,0 +1,35 @@
+"""Unit tests for group_commit.GroupCommitQueue (flush contract, no database)."""
+
+from concurrent.futures import wait
+
+from group_commit import GroupCommitQueue
+
+
+def _results(futures):
+    done, _ = wait(futures, timeout=5)
+    assert len(done) == len(futures)
+    return [f.exception() or f.result() for f in futures]
+
+
+def test_group_commit_isolates_failing_items():
+    def flush(key, items):
+        return [ValueError(item) if item == "bad" else f"{key}:{item}" for item in items]
+
+    commit_queue = GroupCommitQueue("test-isolation", flush, window=0.05)
+    futures = [commit_queue.submit("k", item) for item in ("a", "bad", "b")]
+    ok_a, failed, ok_b = _results(futures)
+    assert (ok_a, ok_b) == ("k:a", "k:b")
+    assert isinstance(failed, ValueError)
+
+
+def test_group_commit_fails_every_item_when_flush_raises_or_miscounts():
+    def flush(key, items):
+        if key == "boom":
+            raise RuntimeError("down")
+        return items[:1]
+
+    commit_queue = GroupCommitQueue("test-failures", flush, window=0.05)
+    raised = [commit_queue.submit("boom", i) for i in range(2)]
+    short = [commit_queue.submit("short", i) for i in range(2)]
+    assert all(isinstance(err, RuntimeError) and str(err) == "down" for err in _results(raised))
+    assert all(isinstance(err, RuntimeError) and "kết quả" in str(err) for err in _results(short))
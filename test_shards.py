@@ -0,0 +1,52 @@
+"""Unit tests for shards.py (DB_SHARDS parsing and id routing)."""
+
+import pytest
+
+import db
+from shards import ShardMap, UnroutedStudent, parse_shards
+
+
+def test_parse_shards_sorts_ranges_and_routes_ids():
+    shards = parse_shards("500000-=10.0.1.1|10.0.1.2; 1-499999=10.0.0.1|10.0.0.2,10.0.0.3")
+    assert [(s.low, s.high, s.primary) for s in shards] == [(1, 499999, "10.0.0.1"), (500000, None, "10.0.1.1")]
+    assert shards[0].replicas == ["10.0.0.2", "10.0.0.3"]
+    shard_map = ShardMap(shards)
+    assert shard_map.for_student(499999) is shards[0]
+    assert shard_map.for_student(10**9) is shards[1]
+    assert shard_map.for_student(0) is None
+    assert shard_map.for_new_student() is shards[1]
+
+
+def test_shard_map_leaves_gaps_unrouted():
+    shard_map = ShardMap(parse_shards("1-100=a;201-=b"))
+    assert shard_map.for_student(150) is None
+
+
+@pytest.mark.parametrize(
+    "spec",
+    [
+        "1-100=a;100-200=b",  # chung biên
+        "1-=a;500-=b",  # khoảng mở không ở cuối
+        "1-100=a;50-60=b",  # nằm trong khoảng khác
+    ],
+)
+def test_parse_shards_rejects_overlaps(spec):
+    with pytest.raises(ValueError, match="chồng lên"):
+        parse_shards(spec)
+
+
+@pytest.mark.parametrize("spec", ["1-100", "1=a", "-100=a", "1-100=|b"])
+def test_parse_shards_rejects_malformed_parts(spec):
+    with pytest.raises(ValueError):
+        parse_shards(spec)
+
+
+def test_shard_for_student_refuses_unrouted_ids_instead_of_the_default_node(monkeypatch):
+    monkeypatch.setattr(db, "_shard_map", None)
+    assert db.shard_for_student(150) is None
+    shard_map = ShardMap(parse_shards("1-100=a;201-=b"))
+    monkeypatch.setattr(db, "_shard_map", shard_map)
+    assert db.shard_for_student("250") is shard_map.shards[1]
+    for student_id in (150, 0, "abc"):
+        with pytest.raises(UnroutedStudent):
+            db.shard_for_student(student_id)
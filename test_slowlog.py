@@ -0,0 +1,16 @@
+"""Unit tests for slowlog.query_shape."""
+
+from slowlog import query_shape
+
+
+def test_query_shape_replaces_literals_and_collapses_lists():
+    assert query_shape("SELECT * FROM t WHERE a = 'x' AND b = 42 AND c IN (1, 2, 3)") == (
+        "SELECT * FROM t WHERE a = ? AND b = ? AND c IN (?+)"
+    )
+    assert query_shape("SELECT  id\n FROM t WHERE x=%s") == "SELECT id FROM t WHERE x=?"
+
+
+def test_query_shape_is_the_same_for_any_number_of_value_rows():
+    one = "INSERT INTO scores (a,b,c) VALUES (%s,%s,%s)"
+    many = "INSERT INTO scores (a,b,c) VALUES (%s,%s,%s),(%s,%s,%s), (%s,%s,%s)"
+    assert query_shape(one) == query_shape(many) == "INSERT INTO scores (a,b,c) VALUES (?+)"